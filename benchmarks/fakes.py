@@ -0,0 +1,243 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable
+from crewai.llms.base_llm import BaseLLM
+
+SKU_PATTERN = re.compile(r"\b[A-Z]{2}-\d{3}\b")
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]")
+
+BRANDS = ["Aurora", "Nimbus", "Cobalt", "Juniper", "Vertex", "Harbor", "Solstice", "Tundra"]
+PRODUCT_TYPES = ["Kettle", "Blender", "Backpack", "Headphones", "Desk Lamp", "Water Bottle", "Toaster", "Jacket"]
+MATERIALS = ["stainless steel", "recycled nylon", "bamboo", "aluminium", "ceramic", "waxed canvas"]
+ADJECTIVES = ["compact", "lightweight", "durable", "quiet", "energy-efficient", "water-resistant"]
+PRAISE = ["easy to clean", "well built", "great value", "comfortable to use", "stylish", "reliable"]
+COMPLAINTS = ["a short cable", "a stiff lid", "a loud fan", "few colour options", "a bulky case"]
+
+
+class FakeLLM(BaseLLM):
+    """Deterministic crewai LLM: a canned response per agent role after a fixed latency.
+
+    `respond` maps the prompt text to the response. Calls are counted per role in `calls`,
+    which every FakeLLM shares so one run's LLM usage can be read from a single Counter.
+    """
+
+    role: str
+    latency: float = 0.0
+    respond: Callable[[str], str]
+    calls: Any = None
+    lock: Any = None
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None,
+             from_agent=None, response_model=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[self.role] += 1
+        return self.respond(_prompt_text(messages))
+
+    def supports_function_calling(self):
+        return False
+
+    def get_context_window_size(self):
+        return 8192
+
+
+def _prompt_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(m.get("content", "")) for m in messages)
+
+
+def _task_text(prompt):
+    """The task part of a crewai prompt, without the agent's role and backstory."""
+    return prompt.split("Current Task:", 1)[-1]
+
+
+def route_response(prompt):
+    text = _task_text(prompt)
+    # The batch router gets numbered questions and answers with one route per question
+    questions = re.findall(r"\[\d+\] ([^\n]*)", text)
+    if questions:
+        return json.dumps({"routes": [_route(question) for question in questions]})
+    return _route(text)
+
+
+def _route(text):
+    text = text.lower()
+    if re.search(r"\b(price|stock|inventory|lead time|shipping)\b", text):
+        return "cypher db"
+    if re.search(r"\b(news|latest|today)\b", text):
+        return "websearch"
+    return "vectorstore"
+
+
+def grade_response(prompt):
+    # The batch grader gets numbered documents and a JSON schema; the per-document grader one document
+    numbers = [int(n) for n in re.findall(r"\[(\d+)\] ", _task_text(prompt))]
+    if numbers:
+        return json.dumps({"verdicts": ["yes"] * (max(numbers) + 1)})
+    return "yes"
+
+
+def answer_response(prompt):
+    """Answers with the first sentence of the documents, or restates structured rows."""
+    text = _task_text(prompt)
+    documents = text.split("relevant ", 1)[-1]
+    if documents.lstrip().startswith("{"):
+        return "Here are the details: " + documents.strip().splitlines()[0]
+    sentence = SENTENCE_PATTERN.search(documents)
+    return sentence.group(0).strip() if sentence else "I don't know."
+
+
+def question_response(prompt):
+    question = re.search(r"user question (.*?)\.?\n", _task_text(prompt))
+    question = question.group(1) if question else "the product"
+    prefixes = ["Tell me about", "What is known about", "Give an overview of", "Explain", "Summarize"]
+    return "\n".join(f"{i}. {prefix} {question}" for i, prefix in enumerate(prefixes, 1))
+
+
+def verification_response(prompt):
+    return json.dumps({"grounded": "yes", "answer_quality": "yes", "revised_answer": ""})
+
+
+def cypher_response(prompt):
+    sku = SKU_PATTERN.search(_task_text(prompt))
+    if sku is None:
+        return "Sorry! unable to find a valid response"
+    return (f"MATCH (p:Product {{sku: '{sku.group(0)}'}}) "
+            "RETURN p.sku AS sku, p.price AS price, p.stock AS stock, p.lead_time_days AS lead_time_days")
+
+
+CANNED_RESPONSES = {
+    "router": route_response,
+    "grader": grade_response,
+    "answer_generator": answer_response,
+    "question_generators": question_response,
+    "hallucination": verification_response,
+    "answer_review": verification_response,
+    "cypher_translator": cypher_response,
+}
+
+
+def fake_agents(latency=0.0, calls=None):
+    """RAG_AGENTS whose LLMs are FakeLLMs with the canned responses; returns (agents, calls Counter)."""
+    # Imported here so the offline environment is in place before src reads its settings
+    from src.crew.agents import RAG_AGENTS
+
+    calls = Counter() if calls is None else calls
+    lock = threading.Lock()
+    llms = {
+        role: FakeLLM(model=f"fake/{role}", role=role, latency=latency, respond=respond, calls=calls, lock=lock)
+        for role, respond in CANNED_RESPONSES.items()
+    }
+    agents = RAG_AGENTS(llms["router"], llms["grader"], llms["answer_generator"], llms["question_generators"],
+                        llms["hallucination"], llms["answer_review"], llms["cypher_translator"])
+    return agents, calls
+
+
+def product_catalog(size=200, seed=7):
+    """Synthetic products with a SKU, name, description fields, reviews and inventory data."""
+    rng = random.Random(seed)
+    products = []
+    for i in range(size):
+        brand = BRANDS[i % len(BRANDS)]
+        product_type = PRODUCT_TYPES[(i // len(BRANDS)) % len(PRODUCT_TYPES)]
+        products.append({
+            "sku": f"{brand[:2].upper()}-{100 + i}",
+            "brand": brand,
+            "name": f"{brand} {product_type} {i // (len(BRANDS) * len(PRODUCT_TYPES)) + 1}",
+            "material": rng.choice(MATERIALS),
+            "adjective": rng.choice(ADJECTIVES),
+            "rating": round(rng.uniform(2.5, 5.0), 1),
+            "praise": rng.sample(PRAISE, 2),
+            "complaint": rng.choice(COMPLAINTS),
+            "price": round(rng.uniform(15, 400), 2),
+            "stock": rng.randint(0, 500),
+            "lead_time_days": rng.randint(1, 21),
+        })
+    return products
+
+
+def product_documents(products):
+    """(texts, metadatas) for the vectorstore: one description and one review summary per product."""
+    texts, metadatas = [], []
+    for p in products:
+        texts.append(f"The {p['name']} ({p['sku']}) is a {p['adjective']} product made of {p['material']}. "
+                     f"It is designed by {p['brand']} for everyday use.")
+        metadatas.append({"source": f"catalog/{p['sku']}", "sku": p["sku"], "kind": "description"})
+        texts.append(f"Customers rate the {p['name']} {p['rating']} out of 5. Reviewers say it is "
+                     f"{p['praise'][0]} and {p['praise'][1]}, but mention {p['complaint']}.")
+        metadatas.append({"source": f"reviews/{p['sku']}", "sku": p["sku"], "kind": "reviews"})
+    return texts, metadatas
+
+
+class ProductGraph:
+    """Query handler for `InMemoryGraphDriver`: answers any query about the SKU it mentions."""
+
+    def __init__(self, products, latency=0.0):
+        self.products = {p["sku"]: p for p in products}
+        self.latency = latency
+
+    def __call__(self, cypher, params):
+        if self.latency:
+            time.sleep(self.latency)
+        skus = [v for v in params.values() if isinstance(v, str)] + SKU_PATTERN.findall(cypher)
+        product = next((self.products[s] for s in skus if s in self.products), None)
+        if product is None:
+            return []
+        return [{key: product[key] for key in ("sku", "price", "stock", "lead_time_days")}]
+
+
+class FakeWebSearch:
+    """Stand-in for the Tavily tool: `invoke` / `ainvoke` return canned results after a fixed latency.
+
+    Use it as a `WebSearch` provider; the last result repeats the first one's page, as search
+    engines often do, so the dedup runs.
+    """
+
+    def __init__(self, latency=0.0, results=3):
+        self.latency = latency
+        self.results = results
+
+    def invoke(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._results(payload["query"])
+
+    async def ainvoke(self, payload):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._results(payload["query"])
+
+    def _results(self, query):
+        results = [
+            {"url": f"https://news.example.com/{i}", "title": f"News {i}",
+             "content": f"<p>Result {i} for <b>'{query}'</b>.</p> Reported this week."}
+            for i in range(self.results)
+        ]
+        return results + [{**results[0], "url": results[0]["url"] + "/"}] if results else results
+
+
+def sample_questions(products, seed=11):
+    """(expected route, question) pairs covering every route, plus ones the local router leaves to the LLM."""
+    rng = random.Random(seed)
+    templates = {
+        "vectorstore": ["What do customers say about the {name}?", "Summarize the features of the {name}.",
+                        "Describe the {name}."],
+        "cypher db": ["What is the price of {sku}?", "How many units of {sku} are in stock?",
+                      "What is the lead time for {sku}?"],
+        "web_search": ["What is the latest news about {brand}?", "Who is the CEO of {brand} today?"],
+        "llm router": ["Is the {name} a good gift?"],
+    }
+    questions = []
+    for product in rng.sample(products, min(len(products), 50)):
+        for route, route_templates in templates.items():
+            questions.append((route, rng.choice(route_templates).format(**product)))
+    rng.shuffle(questions)
+    return questions
+
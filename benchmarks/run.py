@@ -0,0 +1,233 @@
+"""Offline benchmark of the full RAG workflow.
+
+Runs `WorkFlow` with fake LLMs (canned output per agent role, fixed latency), a synthetic product
+corpus in a temporary local index, an in-memory graph DB and a fake web search, so no API is called.
+Reports p50/p95/p99 latency and requests/sec per concurrency level and the LLM calls per question
+for each route, and saves the results as JSON for comparison across commits:
+
+    python -m benchmarks.run --concurrency 1,4,16 --requests 100 --llm-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+from .fakes import (
+    CANNED_RESPONSES, FakeWebSearch, ProductGraph, fake_agents, product_catalog, product_documents, sample_questions,
+)
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Settings recorded with the results, since they change what a run measures
+RECORDED_SETTINGS = (
+    "GRADER_MODE", "GRADER_PREFILTER", "RERANKER", "HYBRID_RETRIEVAL", "RETRIEVER_K", "SEMANTIC_CACHE_ENABLED",
+    "ROUTER_CONFIDENCE_THRESHOLD", "STAGE_TIMEOUT", "MICRO_BATCHING", "MICRO_BATCH_MAX_SIZE", "MICRO_BATCH_MAX_WAIT_MS",
+    "EMBEDDING_CACHE_ENABLED", "EMBEDDING_CACHE_PATH",
+)
+
+
+def offline_environment(index_dir, cache=False, micro_batching=False):
+    """Points the app at offline stand-ins; must run before anything from `src` is imported."""
+    os.environ.update({
+        "EMBEDDING_MODEL": "fake",
+        "VECTOR_INDEX_DIR": index_dir,
+        "CREW_MEMORY": "false",
+        "SEMANTIC_CACHE_ENABLED": "true" if cache else "false",
+        "MICRO_BATCHING": "true" if micro_batching else "false",
+        "CREWAI_DISABLE_TELEMETRY": "true",
+        "OTEL_SDK_DISABLED": "true",
+        "LITELLM_LOCAL_MODEL_COST_MAP": "true",
+        # The fake models are free; without prices litellm is asked (and complains) about each one
+        "LLM_PRICES": json.dumps({f"fake/{role}": [0, 0] for role in CANNED_RESPONSES}),
+    })
+    # Only checked when the (replaced) Tavily tool is created
+    os.environ.setdefault("TAVILY_API_KEY", "offline-benchmark")
+
+
+def build_workflow(products, llm_latency=0.0, db_latency=0.0, web_latency=0.0):
+    """The WorkFlow wired to the fakes; returns (workflow, shared LLM call Counter)."""
+    from src.bm25 import BM25Index
+    from src.cypher import CypherExecutor, InMemoryGraphDriver
+    from src.embeddings import get_embeddings
+    from src.graph import WorkFlow
+    from src.nodes import Nodes
+    from src.retriever import RETRIEVER_K, HybridRetriever, LocalIndex, set_cypher_executor
+    from src.websearch import WebSearch
+
+    agents, calls = fake_agents(llm_latency)
+    nodes = Nodes(agents)
+
+    index = LocalIndex(os.environ["VECTOR_INDEX_DIR"], get_embeddings())
+    texts, metadatas = product_documents(products)
+    index.add_texts(texts, metadatas)
+    index.save()
+    nodes.vectorstore_retriever = HybridRetriever(
+        vectorstore=index, bm25=BM25Index.build_from_index(index), search_kwargs={"k": RETRIEVER_K}
+    )
+    set_cypher_executor(CypherExecutor(InMemoryGraphDriver(default=ProductGraph(products, db_latency))))
+    nodes.web_search_tool = WebSearch({"fake": FakeWebSearch(web_latency)})
+    return WorkFlow(nodes), calls
+
+
+async def llm_calls_per_route(workflow, calls, questions, samples):
+    """Runs `samples` questions of each kind one at a time; LLM calls and prompt context size by route taken."""
+    per_kind = defaultdict(list)
+    for kind, question in questions:
+        if len(per_kind[kind]) < samples:
+            per_kind[kind].append(question)
+
+    by_route = defaultdict(lambda: {"questions": 0, "llm_calls": 0, "context_tokens": 0, "by_role": Counter()})
+    for kind, kind_questions in per_kind.items():
+        for question in kind_questions:
+            before = Counter(calls)
+            result, _ = await workflow.ainvoke({"question": question})
+            used = Counter(calls)
+            used.subtract(before)
+            stats = by_route[result.get("response") or kind]
+            stats["questions"] += 1
+            stats["llm_calls"] += sum(used.values())
+            stats["context_tokens"] += result.get("context_tokens") or 0
+            stats["by_role"].update(+used)
+
+    return {
+        route: {
+            "questions": stats["questions"],
+            "llm_calls_per_question": stats["llm_calls"] / stats["questions"],
+            "context_tokens_per_question": stats["context_tokens"] / stats["questions"],
+            "by_role": {role: count / stats["questions"] for role, count in sorted(stats["by_role"].items())},
+        }
+        for route, stats in sorted(by_route.items())
+    }
+
+
+async def load_test(workflow, questions, concurrency, requests):
+    """Sends `requests` questions with at most `concurrency` in flight; returns latency and throughput."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], Counter()
+
+    async def one(question):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await workflow.ainvoke({"question": question})
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(questions[i % len(questions)][1]) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (float("nan"),) * 3
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "completed": len(latencies),
+        "errors": dict(errors),
+        "wall_seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_seconds": {"p50": float(p50), "p95": float(p95), "p99": float(p99),
+                            "mean": float(np.mean(latencies)) if latencies else float("nan")},
+    }
+
+
+def git_revision():
+    """(short commit hash, whether the tree has uncommitted changes), or (None, None) outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    if args.threads:
+        # Crew kickoffs run in the default executor, which caps how many LLM calls are in flight
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=args.threads))
+
+    products = product_catalog(args.products)
+    questions = sample_questions(products)
+    start = time.perf_counter()
+    workflow, calls = build_workflow(products, args.llm_latency, args.db_latency, args.web_latency)
+    crew_build_seconds = workflow.preload()
+    startup_seconds = time.perf_counter() - start
+
+    per_route = await llm_calls_per_route(workflow, calls, questions, args.route_samples)
+    levels = []
+    for concurrency in args.concurrency:
+        level = await load_test(workflow, questions, concurrency, args.requests)
+        latency_ms = {name: seconds * 1000 for name, seconds in level["latency_seconds"].items()}
+        print(f"concurrency {concurrency:>3}: {level['requests_per_second']:.1f} req/s, p50 {latency_ms['p50']:.0f}ms, "
+              f"p95 {latency_ms['p95']:.0f}ms, p99 {latency_ms['p99']:.0f}ms, {sum(level['errors'].values())} errors")
+        levels.append(level)
+    for route, stats in per_route.items():
+        print(f"{route:>12}: {stats['llm_calls_per_question']:.2f} LLM calls per question")
+
+    from src.embeddings import embedding_cache
+
+    nodes = workflow.graph.nodes_instance
+    commit, dirty = git_revision()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "parameters": {
+            "products": args.products, "llm_latency": args.llm_latency, "db_latency": args.db_latency,
+            "web_latency": args.web_latency, "threads": args.threads, "route_samples": args.route_samples,
+        },
+        "settings": {name: os.getenv(name) for name in RECORDED_SETTINGS},
+        "startup": {"total_seconds": startup_seconds, "crew_build_seconds": crew_build_seconds},
+        "llm_calls_per_route": per_route,
+        "load": levels,
+        "router": nodes.local_router.stats(),
+        "cypher_templates": nodes.cypher_templates.stats(),
+        "micro_batches": {role: batcher.stats() for role, batcher in nodes.batchers.items()},
+        "embedding_cache": embedding_cache().stats(),
+        "web_search": nodes.web_search_tool.stats(),
+        "total_llm_calls": dict(sorted(calls.items())),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16,64",
+                        type=lambda s: [int(c) for c in s.split(",") if c.strip()],
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds per graph-DB query")
+    parser.add_argument("--web-latency", type=float, default=0.1, help="seconds per web search")
+    parser.add_argument("--products", type=int, default=200, help="size of the synthetic product catalog")
+    parser.add_argument("--route-samples", type=int, default=5, help="questions per kind for the LLM call counts")
+    parser.add_argument("--threads", type=int, default=None, help="size of the default thread pool")
+    parser.add_argument("--cache", action="store_true", help="enable the semantic answer cache")
+    parser.add_argument("--micro-batching", action="store_true", help="coalesce router and grader calls")
+    parser.add_argument("--output", type=Path, default=None, help="results file (default: benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as index_dir:
+        offline_environment(index_dir, args.cache, args.micro_batching)
+        results = asyncio.run(run(args))
+
+    output = args.output or RESULTS_DIR / f"{results['timestamp'].replace(':', '')}-{results['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,179 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+import asyncio
+import importlib
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from src.admission import AdmissionController, Overloaded, degraded
+from src.embeddings import embedding_cache
 from src.graph import WorkFlow
+from src.nodes import StageTimeoutError
+from src.tracing import StartupReport, setup_tracing
 
-# Initialize FastAPI app
-app = FastAPI()
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING'))
+
+# How often (seconds) a running request checks whether its client is still connected
+DISCONNECT_POLL_INTERVAL = float(os.getenv('DISCONNECT_POLL_INTERVAL', '0.5'))
+
+startup = StartupReport()
+startup.record("imports", time.perf_counter() - _import_started)
+
+# Built by the startup hook, before the worker accepts requests
+workflow = None
+# Caps this worker's concurrent graph runs and picks each request's degradation mode
+admission = AdmissionController()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Builds the workflow, loads the index and builds the CREW_PRELOAD crews once per worker, timing each phase."""
+    global workflow
+    with startup.phase("workflow"):
+        workflow = await asyncio.to_thread(WorkFlow)
+    with startup.phase("index"):
+        await asyncio.to_thread(workflow.load_index)
+    with startup.phase("crewai_import"):
+        await asyncio.to_thread(importlib.import_module, "crewai")
+    for role, seconds in (await asyncio.to_thread(workflow.preload)).items():
+        startup.record(f"crew.{role}", seconds)
+    yield
 
-# Initialize your workflow
-workflow = WorkFlow()
+# Initialize FastAPI app
+app = FastAPI(lifespan=lifespan)
+setup_tracing(app)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the FastAPI Workflow!"}
 
+def overloaded(e: Overloaded):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def run_until_disconnected(request: Request, coro):
+    """Runs `coro`, cancelling it if the client disconnects before it finishes."""
+    task = asyncio.create_task(coro)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not task.done() and await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+        return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
 @app.post("/invoke")
-def invoke_workflow(payload: dict):
-    # Assuming 'invoke' is a method of WorkFlow that processes the input
-    result = workflow.app.invoke(payload)
-    return {"result": result}
+async def invoke_workflow(payload: dict, request: Request):
+    """Answers payload['question']. A retry with the same 'thread_id' (or X-Request-ID header) resumes
+    the failed run after its last completed node when CHECKPOINTER is set. Under load the answer may
+    come from a degraded 'mode'; beyond the admission queue the request gets a 503. Cached answers
+    are served without taking an execution slot."""
+    thread_id = payload.pop("thread_id", None) or request.headers.get("x-request-id")
+    mode = admission.mode()
+    entry, vector = await workflow.lookup(payload["question"], degraded(mode, "cache_first"))
+    if entry is not None:
+        return {"result": workflow.cached_state(entry), "cache": "hit", "thread_id": thread_id, "mode": mode}
+    try:
+        async with admission.slot() as mode:
+            result = await run_until_disconnected(
+                request, workflow.arun(payload, vector, thread_id=thread_id, mode=mode)
+            )
+    except Overloaded as e:
+        raise overloaded(e)
+    except StageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {"result": result, "cache": "miss", "thread_id": thread_id, "mode": mode}
+
+def sse_event(event, data):
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@app.post("/invoke/stream")
+async def stream_workflow(payload: dict):
+    """Streams a node event as each node completes, then the answer tokens and the final result.
+
+    A cached answer is sent without taking an execution slot; otherwise the slot is taken before
+    the response starts, so an overloaded worker answers with a 503 instead of an SSE error."""
+    mode = admission.mode()
+    entry, vector = await workflow.lookup(payload["question"], degraded(mode, "cache_first"))
+    if entry is not None:
+        async def cached():
+            yield sse_event("result", {"generation": entry.generation, "cache": "hit", "mode": mode})
+        return StreamingResponse(cached(), media_type="text/event-stream")
+    try:
+        mode, release = await admission.acquire()
+    except Overloaded as e:
+        raise overloaded(e)
+
+    async def events():
+        # Starlette cancels this generator (and with it the graph run) when the client disconnects
+        try:
+            async for event in run():
+                yield event
+        finally:
+            release()
+
+    async def run():
+        state = {}
+        try:
+            async for stream_mode, chunk in workflow.astream(
+                {**payload, "mode": mode},
+                config={"configurable": {"stream_tokens": True}},
+                stream_mode=["updates", "custom", "values"],
+            ):
+                if stream_mode == "updates":
+                    for node in chunk:
+                        yield sse_event("node", {"node": node})
+                elif stream_mode == "custom":
+                    yield sse_event("token", chunk)
+                else:
+                    state = chunk
+        except StageTimeoutError as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+        workflow.store(payload["question"], state, vector)
+        yield sse_event("result", {"generation": state.get("generation"), "cache": "miss", "mode": mode})
+
+    # The background task frees the slot if the response ends before the generator runs to its end
+    return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(release))
+
+@app.post("/cache/invalidate")
+def invalidate_cache(route: str = None):
+    """Drops cached answers after a data change; pass route='vectorstore' or 'cypher db' to limit it."""
+    return {"invalidated": workflow.invalidate_cache(route)}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-node latency, LLM calls, tokens, cost and branch counts."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/router/stats")
+def router_stats():
+    """Per-route counts of routing decisions made locally and by the router crew."""
+    return workflow.graph.nodes_instance.local_router.stats()
+
+@app.get("/admission/stats")
+def admission_stats():
+    """This worker's running and queued requests, its load and the mode a request admitted now gets."""
+    return admission.stats()
+
+@app.get("/embeddings/stats")
+def embedding_cache_stats():
+    """Lookups answered by each tier of this worker's embedding cache, and its hit rate."""
+    return embedding_cache().stats()
+
+@app.get("/startup")
+def startup_report():
+    """Wall time of this worker's startup phases and which crews are built so far."""
+    crews = workflow.graph.nodes_instance.crews
+    return {**startup.as_dict(), "crews_built": crews.built(), "crew_build_seconds": crews.build_seconds}
 
 # Run the application
 if __name__ == "__main__":
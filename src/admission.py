@@ -0,0 +1,154 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+from .tracing import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED, DEGRADED_REQUESTS
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Graph executions run at once per worker; later requests wait in the queue
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '16'))
+# Requests waiting beyond this are rejected with 503 at once
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '64'))
+# Seconds a request may wait for a slot before it is rejected with 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+# Load ((in flight + queued) / ADMISSION_MAX_IN_FLIGHT) at which each degraded mode starts, as mode:load pairs
+DEGRADE_LOAD_LEVELS = os.getenv('DEGRADE_LOAD_LEVELS', 'no_review:0.75,no_expansion:1.0,local_grading:1.5,cache_first:2.0')
+
+# Each mode also applies every mode before it:
+#   no_review: the verification crew, and with it the hallucination check, is skipped; an answer
+#              the local grounding check cannot confirm is returned unrevised and not cached
+#   no_expansion: no query rewriting when retrieval finds nothing relevant
+#   local_grading: documents the local signals leave uncertain are kept instead of graded by the crew
+#   cache_first: cached answers are served at a lower similarity and past their TTL
+MODES = ("full", "no_review", "no_expansion", "local_grading", "cache_first")
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted: the queue is full or its deadline passed."""
+
+
+def degraded(mode, feature):
+    """Whether `mode` applies the degradation of mode `feature`."""
+    return MODES.index(mode or "full") >= MODES.index(feature)
+
+
+def parse_levels(setting):
+    """Load thresholds from a DEGRADE_LOAD_LEVELS-style setting, as [(load, mode)] in mode order."""
+    levels = []
+    for pair in filter(None, (p.strip() for p in setting.split(","))):
+        mode, _, load = pair.partition(":")
+        if mode.strip() not in MODES[1:]:
+            raise ValueError(f"Unknown mode in DEGRADE_LOAD_LEVELS: {mode}")
+        levels.append((float(load), mode.strip()))
+    return sorted(levels, key=lambda level: MODES.index(level[1]))
+
+
+class AdmissionController:
+    """Caps concurrent graph executions, queues the excess with a deadline and picks a degraded mode.
+
+    The mode of a request is chosen when it arrives, from the load it finds (not counting itself):
+    the highest mode in `levels` whose threshold that load has reached. A freed slot is handed to
+    the longest-waiting request. Only one event loop may use a controller.
+    """
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, levels=None):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.levels = parse_levels(DEGRADE_LOAD_LEVELS) if levels is None else levels
+        self.in_flight = 0
+        self._waiters = deque()
+
+    @property
+    def load(self):
+        return (self.in_flight + len(self._waiters)) / self.max_in_flight
+
+    def mode(self, load=None):
+        """Mode for a request admitted at `load` (default: the current load)."""
+        load = self.load if load is None else load
+        mode = "full"
+        for threshold, level_mode in self.levels:
+            if load >= threshold:
+                mode = level_mode
+        return mode
+
+    async def acquire(self):
+        """Takes one execution slot; returns (the request's mode, a function that frees the slot once).
+
+        For a slot held past one block, such as a streaming response's; use `slot` otherwise.
+        Raises Overloaded if no slot is free in time.
+        """
+        mode = self.mode()
+        await self._acquire()
+        DEGRADED_REQUESTS.labels(mode).inc()
+        if mode != "full":
+            logger.info("---ADMITTED IN %s MODE AT LOAD %.2f---", mode.upper(), self.load)
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release()
+        return mode, release
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Holds one execution slot; yields the request's mode. Raises Overloaded if none is free in time."""
+        mode, release = await self.acquire()
+        try:
+            yield mode
+        finally:
+            release()
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "queued": len(self._waiters), "max_in_flight": self.max_in_flight,
+                "load": self.load, "mode": self.mode()}
+
+    async def _acquire(self):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight)
+            return
+        if len(self._waiters) >= self.queue_size:
+            ADMISSION_REJECTED.labels("queue_full").inc()
+            raise Overloaded("Server overloaded: admission queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.set(len(self._waiters))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        finally:
+            if not waiter.done():
+                # Timed out or cancelled while queued: leave the queue
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                ADMISSION_QUEUED.set(len(self._waiters))
+            elif asyncio.current_task().cancelling():
+                # Cancelled just as a slot was handed over: pass it on
+                self._release()
+        ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - started)
+        if waiter.cancelled():
+            ADMISSION_REJECTED.labels("queue_timeout").inc()
+            raise Overloaded(f"Server overloaded: no slot free within {self.queue_timeout:g}s")
+
+    def _release(self):
+        # Hand the slot to the first live waiter, or free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            ADMISSION_QUEUED.set(len(self._waiters))
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+from .tracing import MICRO_BATCH_SIZE
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Coalesce LLM calls of the same role from concurrent requests into one batched call (async path only)
+MICRO_BATCHING = os.getenv('MICRO_BATCHING', 'false').lower() == 'true'
+# Defaults for every role; override one role with e.g. MICRO_BATCH_ROUTER_MAX_SIZE / MICRO_BATCH_ROUTER_MAX_WAIT_MS
+MICRO_BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', '8'))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '10'))
+
+
+class MicroBatcher:
+    """Collects calls from concurrent requests and runs them as one batch.
+
+    The first call opens a window of `max_wait` seconds; the batch is sent when the window closes
+    or `max_size` calls are waiting. `run_batch` is an async function from a list of items to a list
+    of results in the same order, and each caller gets its own result (or the batch's exception).
+    The batch's LLM usage is traced against the node of the request that opened or filled it.
+    """
+
+    def __init__(self, name, run_batch, max_size=MICRO_BATCH_MAX_SIZE, max_wait=MICRO_BATCH_MAX_WAIT_MS / 1000):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+
+    @classmethod
+    def from_env(cls, name, run_batch):
+        """Batcher with the MICRO_BATCH_<NAME>_MAX_SIZE / _MAX_WAIT_MS settings for one role."""
+        prefix = f"MICRO_BATCH_{name.upper()}"
+        return cls(
+            name, run_batch,
+            max_size=int(os.getenv(f"{prefix}_MAX_SIZE", MICRO_BATCH_MAX_SIZE)),
+            max_wait=float(os.getenv(f"{prefix}_MAX_WAIT_MS", MICRO_BATCH_MAX_WAIT_MS)) / 1000,
+        )
+
+    async def submit(self, item):
+        """Adds one call to the current batch and waits for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Callers that timed out or were cancelled while waiting are left out
+        batch = [(item, future) for item, future in self._pending if not future.done()]
+        self._pending = []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        MICRO_BATCH_SIZE.labels(self.name).observe(len(batch))
+        logger.debug("---MICRO BATCH %s: %d CALLS---", self.name, len(batch))
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,120 @@
+import os
+import re
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+BM25_K1 = float(os.getenv('BM25_K1', '1.2'))
+BM25_B = float(os.getenv('BM25_B', '0.75'))
+
+# Keeps SKU-style tokens such as 'xr-200' or 'sku_1234' together
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_][a-z0-9]+)*")
+
+
+def save_npz(path, **arrays):
+    """Writes an .npz file to a temporary file and renames it over `path`, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class BM25Index:
+    """Sparse BM25 index with postings stored as compact CSR arrays.
+
+    For term t, `postings_docs[offsets[t]:offsets[t + 1]]` are the documents containing it and
+    `postings_tf` their term frequencies. IDF and document-length norms are precomputed at
+    build time, so a query only touches the postings of its own terms.
+    """
+
+    FILENAME = "bm25.npz"
+
+    def __init__(self, doc_ids, vocabulary, offsets, postings_docs, postings_tf, doc_lengths,
+                 k1=BM25_K1, b=BM25_B):
+        self.doc_ids = list(doc_ids)
+        self.vocabulary = vocabulary  # term -> term id
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        document_frequency = np.diff(offsets)
+        n = max(len(self.doc_ids), 1)
+        self.idf = np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        avg_length = doc_lengths.mean() if len(doc_lengths) else 1.0
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, doc_ids, texts, **kwargs):
+        """Builds the index from parallel lists of document ids and texts."""
+        vocabulary = {}
+        term_docs, term_tfs = [], []
+        doc_lengths = []
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id == len(term_docs):
+                    term_docs.append([])
+                    term_tfs.append([])
+                term_docs[term_id].append(doc)
+                term_tfs[term_id].append(tf)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(docs) for docs in term_docs])
+        postings_docs = np.fromiter((d for docs in term_docs for d in docs), dtype=np.int32, count=offsets[-1])
+        postings_tf = np.fromiter((tf for tfs in term_tfs for tf in tfs), dtype=np.float32, count=offsets[-1])
+        return cls(doc_ids, vocabulary, offsets, postings_docs, postings_tf,
+                   np.asarray(doc_lengths, dtype=np.float32), **kwargs)
+
+    @classmethod
+    def build_from_index(cls, index, **kwargs):
+        """Builds the index over the live chunks of a `LocalIndex`."""
+        chunks = index.chunks()
+        return cls.build([doc_id for doc_id, _ in chunks], [text for _, text in chunks], **kwargs)
+
+    def search(self, query, k=10):
+        """Returns [(doc_id, score)] for the k best-scoring documents."""
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        if not term_ids:
+            return []
+        docs = np.concatenate([self.postings_docs[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        tfs = np.concatenate([self.postings_tf[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        idf = np.concatenate([np.full(self.offsets[t + 1] - self.offsets[t], self.idf[t]) for t in term_ids])
+        contributions = idf * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.doc_ids[unique_docs[i]], float(scores[i])) for i in top]
+
+    def save(self, path):
+        terms = np.array(sorted(self.vocabulary, key=self.vocabulary.get), dtype=object)
+        save_npz(
+            Path(path) / self.FILENAME, doc_ids=np.array(self.doc_ids, dtype=object), terms=terms,
+            offsets=self.offsets, postings_docs=self.postings_docs, postings_tf=self.postings_tf,
+            doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Loads the index saved in directory `path`, or returns None if there is none."""
+        file = Path(path) / cls.FILENAME
+        if not file.exists():
+            return None
+        with np.load(file, allow_pickle=True) as data:
+            vocabulary = {term: i for i, term in enumerate(data["terms"])}
+            return cls(data["doc_ids"], vocabulary, data["offsets"], data["postings_docs"], data["postings_tf"],
+                       data["doc_lengths"], **kwargs)
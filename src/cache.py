@@ -0,0 +1,191 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+from dotenv import load_dotenv
+from .cypher import parameterize
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+# Minimum cosine similarity for a near-duplicate question to reuse a cached answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', '3600'))
+SEMANTIC_CACHE_MAX_SIZE = int(os.getenv('SEMANTIC_CACHE_MAX_SIZE', '10000'))
+# Lower similarity accepted, and TTL ignored, for requests admitted in the 'cache_first' degraded mode
+SEMANTIC_CACHE_DEGRADED_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_DEGRADED_THRESHOLD', '0.9'))
+
+
+def normalize_question(question):
+    """Normalizes a question for exact-match lookups."""
+    return re.sub(r"\s+", " ", str(question)).strip().lower()
+
+
+def question_literals(question):
+    """The entity values of a question (quoted text, SKUs, numbers, names), as a sorted tuple."""
+    return tuple(sorted(str(value).lower() for value in parameterize(question)[1].values()))
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    generation: str
+    route: str
+    created_at: float
+    slot: int
+    literals: tuple = ()
+
+
+class SemanticCache:
+    """Answer cache keyed on the question, with exact and embedding-similarity lookup.
+
+    Entries expire after `ttl` seconds and the least recently used entry is evicted once
+    `max_size` is reached. Question embeddings live in a fixed-size matrix of unit
+    vectors, so a similarity lookup is one matrix-vector product over at most `max_size` rows.
+    A similar question only reuses an answer when both name the same entities (see
+    `question_literals`): "price of XR-200" and "price of XR-201" embed almost identically.
+    """
+
+    def __init__(self, embeddings, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_size=SEMANTIC_CACHE_MAX_SIZE):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # normalized question -> CacheEntry, oldest first
+        self._slot_keys = [None] * max_size
+        self._occupied = np.zeros(max_size, dtype=bool)
+        self._free_slots = list(range(max_size - 1, -1, -1))
+        self._vectors = None  # allocated on first insert, once the embedding size is known
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, question, relaxed=False):
+        """Looks up a cached answer; returns (entry or None, question vector or None).
+
+        A `relaxed` lookup accepts SEMANTIC_CACHE_DEGRADED_THRESHOLD similarity and expired entries.
+        """
+        entry = self._get_exact(question, relaxed)
+        if entry is not None:
+            return entry, None
+        try:
+            vector = self.embeddings.embed_query(question)
+        except Exception as e:
+            logger.warning("---SEMANTIC CACHE LOOKUP SKIPPED: %s---", e)
+            self._record(None)
+            return None, None
+        return self._get_similar(vector, question_literals(question), relaxed), vector
+
+    async def aget(self, question, relaxed=False):
+        """Async version of `get`."""
+        entry = self._get_exact(question, relaxed)
+        if entry is not None:
+            return entry, None
+        try:
+            vector = await self.embeddings.aembed_query(question)
+        except Exception as e:
+            logger.warning("---SEMANTIC CACHE LOOKUP SKIPPED: %s---", e)
+            self._record(None)
+            return None, None
+        return self._get_similar(vector, question_literals(question), relaxed), vector
+
+    def put(self, question, generation, route, vector=None):
+        """Stores an answer; `vector` is the question embedding returned by `get`, if any."""
+        if vector is None:
+            try:
+                vector = self.embeddings.embed_query(question)
+            except Exception as e:
+                logger.warning("---SEMANTIC CACHE STORE SKIPPED: %s---", e)
+                return
+        vector = _unit(vector)
+        key = normalize_question(question)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if not self._free_slots:
+                self._remove(next(iter(self._entries)))
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._slot_keys[slot] = key
+            self._occupied[slot] = True
+            self._entries[key] = CacheEntry(question, generation, route, time.monotonic(), slot,
+                                            question_literals(question))
+
+    def invalidate(self, route=None):
+        """Drops every entry, or only the entries answered from `route` (e.g. after a data change)."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if route is None or entry.route == route]
+            for key in keys:
+                self._remove(key)
+        logger.info("---SEMANTIC CACHE INVALIDATED %d ENTRIES---", len(keys))
+        return len(keys)
+
+    def stats(self):
+        """Returns size and hit/miss counters."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _get_exact(self, question, relaxed=False):
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not relaxed and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        return entry
+
+    def _get_similar(self, vector, literals=(), relaxed=False):
+        threshold = min(self.threshold, SEMANTIC_CACHE_DEGRADED_THRESHOLD) if relaxed else self.threshold
+        vector = _unit(vector)
+        with self._lock:
+            entry = None
+            if self._entries:
+                similarities = self._vectors @ vector
+                similarities[~self._occupied] = -1.0
+                candidates = np.flatnonzero(similarities >= threshold)
+                # The most similar entry about the same entities
+                for slot in candidates[np.argsort(-similarities[candidates])]:
+                    if self._entries[self._slot_keys[slot]].literals == literals:
+                        key = self._slot_keys[slot]
+                        entry = self._entries[key]
+                        break
+                if entry is not None and not relaxed and self._expired(entry):
+                    self._remove(key)
+                    entry = None
+                elif entry is not None:
+                    self._entries.move_to_end(key)
+        self._record(entry)
+        return entry
+
+    def _record(self, entry):
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def _expired(self, entry):
+        return time.monotonic() - entry.created_at > self.ttl
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._slot_keys[entry.slot] = None
+        self._occupied[entry.slot] = False
+        self._free_slots.append(entry.slot)
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_metadata, writes_sort_key,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Graph checkpoints, so a retried request resumes after its last completed node: 'none', 'sqlite' or 'redis'
+CHECKPOINTER = os.getenv('CHECKPOINTER', 'none').lower()
+CHECKPOINT_SQLITE_PATH = os.getenv('CHECKPOINT_SQLITE_PATH', 'checkpoints.sqlite')
+# Any Redis-compatible server; only plain hashes and key expiry are used
+CHECKPOINT_REDIS_URL = os.getenv('CHECKPOINT_REDIS_URL', 'redis://localhost:6379/0')
+# Seconds a thread's checkpoint is kept after its last update
+CHECKPOINT_TTL = float(os.getenv('CHECKPOINT_TTL', '3600'))
+# SQLite checkpoint writes between sweeps of expired threads
+SQLITE_SWEEP_INTERVAL = 100
+
+DOC_REF = "__doc_ref__"
+
+
+def make_checkpointer(kind=None, lookup=None):
+    """The checkpoint saver selected by CHECKPOINTER, or None; `lookup` resolves document references."""
+    kind = (kind or CHECKPOINTER).lower()
+    serde = DocumentRefSerializer(lookup)
+    if kind in ("", "none"):
+        return None
+    if kind == "sqlite":
+        return SQLiteCheckpointSaver(CHECKPOINT_SQLITE_PATH, serde=serde)
+    if kind == "redis":
+        import redis
+        return RedisCheckpointSaver(redis.Redis.from_url(CHECKPOINT_REDIS_URL), serde=serde)
+    raise ValueError(f"Unknown CHECKPOINTER: {kind}")
+
+
+class DocumentRefSerializer(JsonPlusSerializer):
+    """Checkpoint serializer that stores index chunks as references instead of their text.
+
+    A Document whose metadata 'id' names a chunk with the same text in the index is written as
+    {DOC_REF: id, "metadata": ...}, and its text is read back from the index on load; web and
+    graph-DB results have no index id and are stored whole. A chunk gone from the index by the
+    time a checkpoint is loaded is dropped from its document list.
+    """
+
+    def __init__(self, lookup=None):
+        super().__init__()
+        self.lookup = lookup  # ids -> {id: page_content} for the ids in the index
+
+    def dumps_typed(self, obj):
+        return super().dumps_typed(self._compact(obj) if self.lookup else obj)
+
+    def loads_typed(self, data):
+        obj = super().loads_typed(data)
+        return self._expand(obj) if self.lookup else obj
+
+    def _compact(self, obj):
+        if isinstance(obj, Document):
+            doc_id = obj.metadata.get("id")
+            if doc_id is not None and self.lookup([doc_id]).get(doc_id) == obj.page_content:
+                return {DOC_REF: doc_id, "metadata": obj.metadata}
+            return obj
+        if isinstance(obj, dict):
+            return {key: self._compact(value) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._compact(value) for value in obj)
+        return obj
+
+    def _expand(self, obj):
+        if isinstance(obj, dict):
+            if DOC_REF in obj:
+                text = self.lookup([obj[DOC_REF]]).get(obj[DOC_REF])
+                if text is None:
+                    logger.warning("checkpointed chunk %s is no longer in the index", obj[DOC_REF])
+                    return None
+                return Document(page_content=text, metadata=obj["metadata"])
+            return {key: self._expand(value) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            values = [self._expand(value) for value in obj]
+            refs = [isinstance(value, dict) and DOC_REF in value for value in obj]
+            return type(obj)(value for value, ref in zip(values, refs) if not (ref and value is None))
+        return obj
+
+
+class LatestCheckpointSaver(BaseCheckpointSaver):
+    """Checkpoint saver that keeps only the latest checkpoint of each thread and its pending writes.
+
+    That is all a resumed run needs, and it bounds storage to one checkpoint per live thread;
+    history and time travel (`list` beyond the latest, `get_tuple` of an older id) are not
+    supported. Subclasses store one record per (thread, namespace):
+    {"checkpoint_id", "parent_id", "checkpoint", "metadata", "writes"}, serialized values as
+    (type, bytes) and writes as (task_id, idx, channel, value, task_path).
+    """
+
+    def get_tuple(self, config):
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = configurable["thread_id"], configurable.get("checkpoint_ns", "")
+        record = self._load(thread_id, checkpoint_ns)
+        if record is None:
+            return None
+        if configurable.get("checkpoint_id") not in (None, record["checkpoint_id"]):
+            return None
+        return self._tuple(thread_id, checkpoint_ns, record)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        if config is None:
+            keys = self._keys()
+        else:
+            configurable = config["configurable"]
+            keys = [(configurable["thread_id"], configurable.get("checkpoint_ns", ""))]
+        for thread_id, checkpoint_ns in keys:
+            if limit is not None and limit <= 0:
+                return
+            checkpoint = self.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}})
+            if checkpoint is None:
+                continue
+            if before and checkpoint.config["configurable"]["checkpoint_id"] >= before["configurable"]["checkpoint_id"]:
+                continue
+            if filter and any(checkpoint.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield checkpoint
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = configurable["thread_id"], configurable.get("checkpoint_ns", "")
+        self._save(thread_id, checkpoint_ns, {
+            "checkpoint_id": checkpoint["id"],
+            "parent_id": configurable.get("checkpoint_id"),
+            "checkpoint": self.serde.dumps_typed(checkpoint),
+            "metadata": self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+        })
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        rows = [
+            (task_id, WRITES_IDX_MAP.get(channel, idx), channel, self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        self._add_writes(configurable["thread_id"], configurable.get("checkpoint_ns", ""),
+                         configurable["checkpoint_id"], rows)
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before,
+                                                                          limit=limit))):
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def _tuple(self, thread_id, checkpoint_ns, record):
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                   "checkpoint_id": record["checkpoint_id"]}}
+        parent = record["parent_id"]
+        writes = sorted(record["writes"], key=lambda w: writes_sort_key(w[4], w[0], w[1]))
+        return CheckpointTuple(
+            config=config,
+            checkpoint=self.serde.loads_typed(record["checkpoint"]),
+            metadata=self.serde.loads_typed(record["metadata"]),
+            parent_config={"configurable": {**config["configurable"], "checkpoint_id": parent}} if parent else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value))
+                            for task_id, _, channel, value, _ in writes],
+        )
+
+    def _load(self, thread_id, checkpoint_ns):
+        raise NotImplementedError
+
+    def _save(self, thread_id, checkpoint_ns, record):
+        raise NotImplementedError
+
+    def _add_writes(self, thread_id, checkpoint_ns, checkpoint_id, rows):
+        raise NotImplementedError
+
+    def _keys(self):
+        raise NotImplementedError
+
+
+class SQLiteCheckpointSaver(LatestCheckpointSaver):
+    """Latest checkpoint per thread in a SQLite file (WAL mode, so the workers on a node can share it).
+
+    Threads not updated for `ttl` seconds are swept every SQLITE_SWEEP_INTERVAL checkpoint writes.
+    """
+
+    def __init__(self, path, ttl=CHECKPOINT_TTL, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()  # one connection per thread
+        self._puts = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints (thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, "
+                "parent_id TEXT, type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, updated_at REAL, "
+                "PRIMARY KEY (thread_id, checkpoint_ns))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS writes (thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, "
+                "task_id TEXT, idx INTEGER, channel TEXT, type TEXT, value BLOB, task_path TEXT, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS checkpoints_updated_at ON checkpoints (updated_at)")
+
+    def delete_thread(self, thread_id):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            connection.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    def sweep(self):
+        """Deletes the threads not updated for `ttl` seconds; returns how many."""
+        with self._connection() as connection:
+            expired = connection.execute("DELETE FROM checkpoints WHERE updated_at < ?",
+                                         (time.time() - self.ttl,)).rowcount
+            connection.execute(
+                "DELETE FROM writes WHERE NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id "
+                "AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)"
+            )
+        if expired:
+            logger.info("swept %d expired checkpoint threads", expired)
+        return expired
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _load(self, thread_id, checkpoint_ns):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata, updated_at FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)
+        ).fetchone()
+        if row is None or row[6] < time.time() - self.ttl:
+            return None
+        writes = connection.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, row[0])
+        ).fetchall()
+        return {
+            "checkpoint_id": row[0], "parent_id": row[1], "checkpoint": (row[2], row[3]), "metadata": (row[4], row[5]),
+            "writes": [(task_id, idx, channel, (type_, value), path) for task_id, idx, channel, type_, value, path in writes],
+        }
+
+    def _save(self, thread_id, checkpoint_ns, record):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, record["checkpoint_id"], record["parent_id"], *record["checkpoint"],
+                 *record["metadata"], time.time()),
+            )
+            # Writes of the replaced checkpoint are already applied in this one
+            connection.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                               (thread_id, checkpoint_ns, record["checkpoint_id"]))
+        self._puts += 1
+        if self._puts % SQLITE_SWEEP_INTERVAL == 0:
+            self.sweep()
+
+    def _add_writes(self, thread_id, checkpoint_ns, checkpoint_id, rows):
+        with self._connection() as connection:
+            for task_id, idx, channel, (type_, value), task_path in rows:
+                # Special writes (negative idx) replace earlier ones; regular writes are kept once
+                connection.execute(
+                    f"INSERT OR {'REPLACE' if idx < 0 else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type_, value, task_path),
+                )
+
+    def _keys(self):
+        return self._connection().execute("SELECT thread_id, checkpoint_ns FROM checkpoints").fetchall()
+
+
+class RedisCheckpointSaver(LatestCheckpointSaver):
+    """Latest checkpoint per thread in Redis hashes that expire `ttl` seconds after their last update."""
+
+    def __init__(self, client, ttl=CHECKPOINT_TTL, prefix="rag:checkpoint", serde=None):
+        super().__init__(serde=serde)
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def delete_thread(self, thread_id):
+        escaped = re.sub(r"([*?\[\]\\])", r"\\\1", thread_id)
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:{escaped}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def _key(self, thread_id, checkpoint_ns):
+        return f"{self.prefix}:{thread_id}:{checkpoint_ns}"
+
+    def _load(self, thread_id, checkpoint_ns):
+        key = self._key(thread_id, checkpoint_ns)
+        pipeline = self.client.pipeline()
+        pipeline.hgetall(key)
+        pipeline.hgetall(f"{key}:writes")
+        fields, writes = pipeline.execute()
+        if not fields:
+            return None
+        return {
+            "checkpoint_id": fields[b"checkpoint_id"].decode(),
+            "parent_id": fields[b"parent_id"].decode() or None,
+            "checkpoint": (fields[b"type"].decode(), fields[b"checkpoint"]),
+            "metadata": (fields[b"metadata_type"].decode(), fields[b"metadata"]),
+            "writes": [write for checkpoint_id, write in map(self._decode_write, writes.values())
+                       if checkpoint_id == fields[b"checkpoint_id"].decode()],
+        }
+
+    def _save(self, thread_id, checkpoint_ns, record):
+        key = self._key(thread_id, checkpoint_ns)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.delete(f"{key}:writes")
+        pipeline.hset(key, mapping={
+            "checkpoint_id": record["checkpoint_id"], "parent_id": record["parent_id"] or "",
+            "type": record["checkpoint"][0], "checkpoint": record["checkpoint"][1],
+            "metadata_type": record["metadata"][0], "metadata": record["metadata"][1],
+        })
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def _add_writes(self, thread_id, checkpoint_ns, checkpoint_id, rows):
+        key = f"{self._key(thread_id, checkpoint_ns)}:writes"
+        pipeline = self.client.pipeline(transaction=True)
+        for task_id, idx, channel, value, task_path in rows:
+            field = f"{checkpoint_id}:{task_id}:{idx}"
+            encoded = self._encode_write(checkpoint_id, (task_id, idx, channel, value, task_path))
+            if idx < 0:
+                pipeline.hset(key, field, encoded)
+            else:
+                pipeline.hsetnx(key, field, encoded)
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def _keys(self):
+        for key in self.client.scan_iter(match=f"{self.prefix}:*"):
+            key = key.decode()
+            if not key.endswith(":writes"):
+                thread_id, _, checkpoint_ns = key[len(self.prefix) + 1:].rpartition(":")
+                yield thread_id, checkpoint_ns
+
+    @staticmethod
+    def _encode_write(checkpoint_id, write):
+        task_id, idx, channel, (type_, value), task_path = write
+        return json.dumps([checkpoint_id, task_id, idx, channel, type_, task_path]).encode("utf-8") + b"\n" + value
+
+    @staticmethod
+    def _decode_write(encoded):
+        """(checkpoint id, write)"""
+        header, _, value = encoded.partition(b"\n")
+        checkpoint_id, task_id, idx, channel, type_, task_path = json.loads(header)
+        return checkpoint_id, (task_id, idx, channel, (type_, value), task_path)
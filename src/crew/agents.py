@@ -16,6 +16,11 @@ hallucination_llm = os.getenv('HALLUCINATION_LLM')
 answer_review_llm = os.getenv('ANSWER_GRADER_LLM')  # Fixed typo
 cypher_translator_llm = os.getenv('CYPHER_TRANSLATOR_LLM')
 
+# Crew and agent step-by-step console output; keep off in production
+CREW_VERBOSE = os.getenv('CREW_VERBOSE', 'false').lower() == 'true'
+# Memory for the router and answer generator crews
+CREW_MEMORY = os.getenv('CREW_MEMORY', 'true').lower() == 'true'
+
 
 class RAG_AGENTS():
     """Class for managing Retrieval-Augmented Generation agents."""
@@ -42,7 +47,7 @@ class RAG_AGENTS():
                 Use the cypher db search for questions related to product inventory, prices, discounts, lead time, shipping, etc.
                 Do not be stringent with keywords for these topics; otherwise, use web-search.
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.router_llm
         )
@@ -57,7 +62,7 @@ class RAG_AGENTS():
                 If the document contains keywords related to the user question, grade it as relevant.
                 Ensure that the answer is relevant to the question without being overly stringent.
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.grader_llm
         )
@@ -71,7 +76,7 @@ class RAG_AGENTS():
                 You are an AI language model QA answer generator assistant. Your task is to generate a concise answer based on the given user question and relevant retrieved documents.
                 Try to understand the question and generate an accurate answer based on the documents. If unsure, say 'I don’t know.' Use three sentences maximum and keep it concise.
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.answer_generator_llm
         )
@@ -85,7 +90,7 @@ class RAG_AGENTS():
                 You are an AI language model assistant. Your task is to generate five different versions of the given user question to retrieve relevant documents from a vector database.
                 By generating multiple perspectives on the question, you help overcome limitations of distance-based similarity searches. Create rephrased questions that explore different perspectives.
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.question_generators_llm
         )
@@ -99,7 +104,7 @@ class RAG_AGENTS():
                 You are a hallucination grader assessing whether an answer is grounded in or supported by a set of facts.
                 Review the response provided to ensure it aligns with the question asked.
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.hallucination_llm
         )
@@ -113,7 +118,7 @@ class RAG_AGENTS():
                 You are an AI assistant with deep knowledge of user question and answer support. Review the response meticulously to ensure it makes sense for the question asked.
                 If the answer already covers everything, return the generation. If the answer is not good, rewrite it concisely. If the response is irrelevant, say 'Sorry, contact customer support.'
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.answer_review_llm
         )
@@ -126,7 +131,7 @@ class RAG_AGENTS():
             backstory=dedent("""\
                 You are an expert at converting user questions into cypher database queries. Understand the question and convert it into cypher queries.
             """),
-            verbose=True,
+            verbose=CREW_VERBOSE,
             allow_delegation=False,
             llm=self.cypher_translator_llm
         )
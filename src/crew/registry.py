@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from ..tracing import TracedCrew
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Crews built by `preload` at startup: 'all', 'none' or a comma-separated list of roles.
+# Any other crew is built the first time a request needs it.
+CREW_PRELOAD = os.getenv('CREW_PRELOAD', 'all')
+
+# role -> (agent attribute and task factory of RAG_TASKS, LLM attribute of RAG_AGENTS, uses crew memory)
+CREW_SPECS = {
+    "router": ("router_agent", "router_task", "router_llm", True),
+    "router_batch": ("router_agent", "router_batch_task", "router_llm", False),
+    "grader": ("grader_agent", "grader_task", "grader_llm", False),
+    "grader_batch": ("grader_agent", "grader_batch_task", "grader_llm", False),
+    "grader_pairs": ("grader_agent", "grader_pairs_task", "grader_llm", False),
+    "answer_generator": ("answer_generator", "answer_generator_task", "answer_generator_llm", True),
+    "question_generators": ("question_generators", "question_generators_task", "question_generators_llm", False),
+    "verification": ("answer_review_agent", "verification_task", "answer_review_llm", False),
+    "cypher_translator": ("cypher_translator", "cypher_translator_task", "cypher_translator_llm", False),
+}
+
+
+class CrewRegistry:
+    """Builds each role's crew on first use and keeps it for the life of the process.
+
+    crewai, the agents and the tasks are only imported and built when a crew is first needed, so a
+    worker never pays for routes it does not take. The built crews are never kicked off directly:
+    `TracedCrew` runs every kickoff on a copy, so one definition is safely shared by all requests.
+    """
+
+    def __init__(self, agents=None):
+        self._agents = agents  # RAG_AGENTS; built from the *_LLM environment variables when None
+        self._tasks = None
+        self._crews = {}
+        self._lock = threading.Lock()
+        self.build_seconds = {}
+
+    def __getitem__(self, role):
+        crew = self._crews.get(role)
+        if crew is None:
+            with self._lock:
+                crew = self._crews.get(role)
+                if crew is None:
+                    crew = self._crews[role] = self._build(role)
+        return crew
+
+    def preload(self, roles=None):
+        """Builds the crews for `roles` (default: CREW_PRELOAD) now; returns each one's build seconds."""
+        roles = preload_roles() if roles is None else roles
+        for role in roles:
+            self[role]
+        return {role: self.build_seconds[role] for role in roles}
+
+    def built(self):
+        """Roles whose crews have been built."""
+        return sorted(self._crews)
+
+    def _build(self, role):
+        from crewai import Crew
+        from .agents import CREW_MEMORY, CREW_VERBOSE
+
+        start = time.perf_counter()
+        agent_name, task_name, llm_name, memory = CREW_SPECS[role]
+        rag_tasks = self._rag_tasks()
+        crew = Crew(
+            agents=[getattr(rag_tasks, agent_name)],
+            tasks=[getattr(rag_tasks, task_name)()],
+            memory=memory and CREW_MEMORY,
+            verbose=CREW_VERBOSE,
+        )
+        traced = TracedCrew(crew, _model_name(getattr(rag_tasks.agents, llm_name)))
+        self.build_seconds[role] = time.perf_counter() - start
+        logger.info("built %s crew in %.3fs", role, self.build_seconds[role])
+        return traced
+
+    def _rag_tasks(self):
+        # Called with the lock held
+        if self._tasks is None:
+            from .agents import (
+                RAG_AGENTS, router_llm, grader_llm, answer_generator_llm, question_generators_llm,
+                hallucination_llm, answer_review_llm, cypher_translator_llm,
+            )
+            from .tasks import RAG_TASKS
+
+            agents = self._agents or RAG_AGENTS(router_llm, grader_llm, answer_generator_llm, question_generators_llm,
+                                                hallucination_llm, answer_review_llm, cypher_translator_llm)
+            self._tasks = RAG_TASKS(agents)
+        return self._tasks
+
+
+def preload_roles(setting=None):
+    """Roles selected by a CREW_PRELOAD-style setting."""
+    setting = (CREW_PRELOAD if setting is None else setting).strip().lower()
+    if setting == "all":
+        return list(CREW_SPECS)
+    if setting in ("", "none"):
+        return []
+    roles = [role.strip() for role in setting.split(",") if role.strip()]
+    unknown = [role for role in roles if role not in CREW_SPECS]
+    if unknown:
+        raise ValueError(f"Unknown crew roles in CREW_PRELOAD: {', '.join(unknown)}")
+    return roles
+
+
+def _model_name(llm):
+    """Model name of an LLM given as a string or an LLM object."""
+    return llm if isinstance(llm, str) or llm is None else getattr(llm, "model", type(llm).__name__)
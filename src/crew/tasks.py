@@ -1,17 +1,61 @@
 from crewai import Task
+from functools import cached_property
 from textwrap import dedent
+from typing import List
+from pydantic import BaseModel
 from .agents import RAG_AGENTS
 
+
+class DocumentGrades(BaseModel):
+    """Relevance verdicts for a batch of documents, in document order."""
+    verdicts: List[str]
+
+
+class RouteDecisions(BaseModel):
+    """Routes for a batch of questions, in question order."""
+    routes: List[str]
+
+
+class Verification(BaseModel):
+    """Combined groundedness check, quality check and review of a generated answer."""
+    grounded: str
+    answer_quality: str
+    revised_answer: str
+
+
 class RAG_TASKS():
-    def __init__(self):
-        
-        self.router_agent = RAG_AGENTS.router_agent()
-        self.grader_agent = RAG_AGENTS.grader_agent()
-        self.answer_generator = RAG_AGENTS.answer_generator()
-        self.question_generators = RAG_AGENTS.question_generators()
-        self.hallucination_grader = RAG_AGENTS.hallucination_grader()
-        self.answer_review_agent = RAG_AGENTS.answer_review_agent()
-        self.cypher_translator = RAG_AGENTS.cypher_translator()
+    """Task definitions; each agent is built once, the first time one of its tasks is."""
+
+    def __init__(self, agents: RAG_AGENTS):
+        self.agents = agents
+
+    @cached_property
+    def router_agent(self):
+        return self.agents.router_agent()
+
+    @cached_property
+    def grader_agent(self):
+        return self.agents.grader_agent()
+
+    @cached_property
+    def answer_generator(self):
+        return self.agents.answer_generator()
+
+    @cached_property
+    def question_generators(self):
+        return self.agents.question_generators()
+
+    @cached_property
+    def hallucination_grader(self):
+        return self.agents.hallucination_grader()
+
+    @cached_property
+    def answer_review_agent(self):
+        return self.agents.answer_review_agent()
+
+    @cached_property
+    def cypher_translator(self):
+        return self.agents.cypher_translator()
 
     def router_task(self):
         return Task(
@@ -28,10 +72,25 @@ class RAG_TASKS():
             agent=self.router_agent
         )
 
-    def grader_task(self, retriever_task):
+    def router_batch_task(self):
+        return Task(
+            description=dedent(f"""
+                Analyse the keywords in each of the numbered {{questions}}.
+                For every question decide whether it is eligible for a vectorstore search, a web search, or a cypher db search.
+                Decide each question independently and keep the numbering order.
+            """),
+            expected_output=dedent("""
+                One choice per numbered question, in the same order: 'websearch', 'vectorstore', or 'cypher db'.
+                Do not provide any preamble or explanation.
+            """),
+            output_pydantic=RouteDecisions,
+            agent=self.router_agent
+        )
+
+    def grader_task(self, retriever_task=None):
         return Task(
             description=dedent(f"""
-                Based on the {{documents}} retrieved from the cypher_retriever or vectorstore_retriever for the question {{question}}, evaluate whether the {{document}} is relevant.
+                Based on the {{document}} retrieved from the cypher_retriever or vectorstore_retriever for the question {{question}}, evaluate whether the document is relevant.
             """),
             expected_output=dedent("""
                 Binary score 'yes' or 'no' to indicate relevance. 
@@ -41,6 +100,35 @@ class RAG_TASKS():
             agent=self.grader_agent
         )
 
+    def grader_batch_task(self):
+        return Task(
+            description=dedent(f"""
+                Evaluate each of the numbered {{documents}} retrieved for the question {{question}} and decide whether it is relevant.
+                Grade every document independently and keep the numbering order.
+            """),
+            expected_output=dedent("""
+                A list of binary scores, one 'yes' or 'no' per numbered document, in the same order as the documents.
+                Do not provide preamble or explanations.
+            """),
+            output_pydantic=DocumentGrades,
+            agent=self.grader_agent
+        )
+
+    def grader_pairs_task(self):
+        return Task(
+            description=dedent(f"""
+                Each of the numbered {{pairs}} holds a user question and a document retrieved for it.
+                For every pair, evaluate whether the document is relevant to its question.
+                Grade every pair independently and keep the numbering order.
+            """),
+            expected_output=dedent("""
+                A list of binary scores, one 'yes' or 'no' per numbered pair, in the same order as the pairs.
+                Do not provide preamble or explanations.
+            """),
+            output_pydantic=DocumentGrades,
+            agent=self.grader_agent
+        )
+
     def answer_generator_task(self):
         return Task(
             description=dedent(f"Generate an answer based on the user question {{question}} using relevant {{documents}}."),
@@ -86,6 +174,23 @@ class RAG_TASKS():
             agent=self.answer_review_agent
         )
 
+    def verification_task(self):
+        return Task(
+            description=dedent(f"""
+                Verify the {{generation}} response drafted for the user {{question}} against the retrieved {{documents}}.
+                First decide whether the answer is grounded in and supported by the documents.
+                Then decide whether it fully and accurately answers the question.
+                Finally review the response: if it already covers everything, return it unchanged; otherwise rewrite it
+                concisely with a friendly, professional tone, using only facts from the documents.
+            """),
+            expected_output=dedent("""
+                grounded: 'yes' or 'no'; answer_quality: 'yes' or 'no'; revised_answer: the final response for the user.
+                Do not provide preamble or explanations.
+            """),
+            output_pydantic=Verification,
+            agent=self.answer_review_agent
+        )
+
     def cypher_translator_task(self):
         return Task(
             description=dedent(f"""
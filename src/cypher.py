@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file the learned question-pattern -> cypher templates are loaded from and saved to
+CYPHER_TEMPLATES_PATH = os.getenv('CYPHER_TEMPLATES_PATH')
+CYPHER_TEMPLATES_MAX_SIZE = int(os.getenv('CYPHER_TEMPLATES_MAX_SIZE', '1000'))
+CYPHER_RESULT_TTL = float(os.getenv('CYPHER_RESULT_TTL', '60'))
+CYPHER_RESULT_CACHE_SIZE = int(os.getenv('CYPHER_RESULT_CACHE_SIZE', '1024'))
+NEO4J_POOL_SIZE = int(os.getenv('NEO4J_POOL_SIZE', '50'))
+
+# Translator response meaning no cypher query applies (see RAG_TASKS.cypher_translator_task)
+NO_CYPHER_ANSWER = "Sorry! unable to find a valid response"
+
+QUOTED_PATTERN = re.compile(r"\"([^\"]+)\"|'([^']+)'")
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[-_.][A-Za-z0-9]+)*")
+NAME_PATTERN = re.compile(r"(?<![.?!]\s)(?<!^)\b([A-Z][\w-]*(?:\s+[A-Z][\w-]*)*)")
+# A capitalized name ending in a number, such as 'Aurora Kettle 2', which is one entity
+NUMBERED_NAME_PATTERN = re.compile(r"(?<![.?!]\s)(?<!^)\b([A-Z][A-Za-z-]*(?:\s+[A-Z][A-Za-z-]*)*\s+\d+)\b")
+NUMBER_PATTERN = re.compile(r"^\d+(?:\.\d+)?$")
+
+
+def clean_cypher(text):
+    """Strips markdown fences and surrounding whitespace from a translator response."""
+    text = str(text).strip()
+    fenced = re.search(r"```(?:cypher)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return (fenced.group(1) if fenced else text).strip()
+
+
+def parameterize(question):
+    """Replaces entity values in a question with placeholders.
+
+    Quoted strings, SKU-like tokens (letters and digits), numbers and capitalized names (which may
+    end in a number, as in 'Aurora Kettle 2') become {text0}, {sku0}, {number0} and {name0}.
+    Returns (pattern, params), where the pattern is the lower-cased question with placeholders and
+    without punctuation.
+    """
+    params = {}
+    counts = defaultdict(int)
+
+    def placeholder(kind, value):
+        name = f"{kind}{counts[kind]}"
+        counts[kind] += 1
+        params[name] = value
+        return f" {{{name}}} "
+
+    def quoted(match):
+        return placeholder("text", match.group(1) or match.group(2))
+
+    def token(match):
+        value = match.group(0)
+        if NUMBER_PATTERN.match(value):
+            return placeholder("number", float(value) if "." in value else int(value))
+        if any(c.isdigit() for c in value) and any(c.isalpha() for c in value):
+            return placeholder("sku", value)
+        return value
+
+    def name(match):
+        return placeholder("name", match.group(1))
+
+    text = QUOTED_PATTERN.sub(quoted, question)
+    text = " ".join(NUMBERED_NAME_PATTERN.sub(name, part) if not part.startswith("{") else part
+                    for part in re.split(r"(\{\w+\})", text))
+    text = " ".join(TOKEN_PATTERN.sub(token, part) if not part.startswith("{") else part
+                    for part in re.split(r"(\{\w+\})", text))
+    text = " ".join(NAME_PATTERN.sub(name, part) if not part.startswith("{") else part
+                    for part in re.split(r"(\{\w+\})", text))
+    pattern = re.sub(r"[^\w{} ]", " ", text.lower())
+    return re.sub(r"\s+", " ", pattern).strip(), params
+
+
+class CypherTemplateCache:
+    """Maps normalized question patterns to parameterized cypher queries.
+
+    Templates are learned from the translator: when every entity value of a question appears as
+    exactly one literal in the generated cypher, the literals are replaced by $parameters and the
+    query is stored under the question's pattern. Later questions with the same pattern skip the
+    translator LLM. A value found at several positions (e.g. "within 10 days" with
+    `<= 10 ... LIMIT 10`) cannot be told apart from a constant of the query, so it is not learned.
+    """
+
+    def __init__(self, path=CYPHER_TEMPLATES_PATH, max_size=CYPHER_TEMPLATES_MAX_SIZE):
+        self.path = Path(path) if path else None
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.path and self.path.exists():
+            self._templates.update(json.loads(self.path.read_text(encoding="utf-8")))
+
+    def lookup(self, question):
+        """Returns (cypher, params) for a known question pattern, or None."""
+        pattern, params = parameterize(question)
+        with self._lock:
+            cypher = self._templates.get(pattern)
+            if cypher is None:
+                self.misses += 1
+                return None
+            self._templates.move_to_end(pattern)
+            self.hits += 1
+        return cypher, params
+
+    def learn(self, question, cypher):
+        """Stores the translator's cypher as a template if it can be parameterized; returns the template."""
+        cypher = clean_cypher(cypher)
+        if not cypher or cypher.startswith(NO_CYPHER_ANSWER):
+            return None
+        pattern, params = parameterize(question)
+        template = cypher
+        for name, value in params.items():
+            if isinstance(value, str):
+                literal = re.compile(r"([\"'])" + re.escape(value) + r"\1", re.IGNORECASE)
+            else:
+                literal = re.compile(r"(?<![\w.$])" + re.escape(str(value)) + r"(?![\w.])")
+            template, replaced = literal.subn(f"${name}", template)
+            if replaced != 1:
+                logger.debug("---CYPHER TEMPLATE NOT LEARNED: %s FOUND %d TIMES---", name, replaced)
+                return None
+        with self._lock:
+            self._templates[pattern] = template
+            self._templates.move_to_end(pattern)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+            if self.path:
+                self.path.write_text(json.dumps(self._templates, indent=2), encoding="utf-8")
+        return template
+
+    def stats(self):
+        return {"templates": len(self._templates), "hits": self.hits, "misses": self.misses}
+
+
+class CypherExecutor:
+    """Runs parameterized read queries through one pooled driver, with a TTL result cache and timing.
+
+    `driver` is a neo4j driver or anything with the same `session(...).run(cypher, params)` interface,
+    such as `InMemoryGraphDriver`.
+    """
+
+    def __init__(self, driver, result_ttl=CYPHER_RESULT_TTL, result_cache_size=CYPHER_RESULT_CACHE_SIZE):
+        self.driver = driver
+        self.result_ttl = result_ttl
+        self.result_cache_size = result_cache_size
+        self._results = OrderedDict()  # (cypher, params) -> (expires_at, rows)
+        self._timings = defaultdict(lambda: {"count": 0, "cache_hits": 0, "total_ms": 0.0, "max_ms": 0.0})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Builds a pooled neo4j driver from NEO4J_URI, NEO4J_USERNAME and NEO4J_PASSWORD."""
+        from neo4j import GraphDatabase
+        driver = GraphDatabase.driver(
+            os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            auth=(os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "")),
+            max_connection_pool_size=NEO4J_POOL_SIZE,
+        )
+        return cls(driver)
+
+    def execute(self, cypher, params=None):
+        """Runs a read query and returns its rows as dicts."""
+        params = params or {}
+        key = (cypher, json.dumps(params, sort_keys=True, default=str))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > now:
+                self._results.move_to_end(key)
+                self._timings[cypher]["cache_hits"] += 1
+                return cached[1]
+
+        start = time.perf_counter()
+        with self.driver.session(default_access_mode="READ") as session:
+            rows = [record.data() for record in session.run(cypher, params)]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            timing = self._timings[cypher]
+            timing["count"] += 1
+            timing["total_ms"] += elapsed_ms
+            timing["max_ms"] = max(timing["max_ms"], elapsed_ms)
+            self._results[key] = (time.monotonic() + self.result_ttl, rows)
+            self._results.move_to_end(key)
+            while len(self._results) > self.result_cache_size:
+                self._results.popitem(last=False)
+        logger.debug("---CYPHER QUERY %.1fms, %d ROWS---", elapsed_ms, len(rows))
+        return rows
+
+    def invalidate(self):
+        """Drops cached query results, e.g. after the graph data changes."""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """Per-query execution count, cache hits and timings."""
+        with self._lock:
+            return {cypher: dict(timing) for cypher, timing in self._timings.items()}
+
+    def close(self):
+        self.driver.close()
+
+
+class InMemoryGraphDriver:
+    """Graph-DB stand-in for tests: answers queries with handlers instead of a database.
+
+    `handlers` maps a cypher query (whitespace-insensitive) to a function of the parameters that
+    returns the result rows as dicts; `default(cypher, params)` answers queries without a handler.
+    """
+
+    def __init__(self, handlers=None, default=None):
+        self.handlers = {_squash(cypher): handler for cypher, handler in (handlers or {}).items()}
+        self.default = default
+        self.queries = []
+
+    def session(self, **kwargs):
+        return _InMemorySession(self)
+
+    def close(self):
+        pass
+
+
+class _InMemorySession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, cypher, params=None):
+        self.driver.queries.append((cypher, params))
+        handler = self.driver.handlers.get(_squash(cypher))
+        if handler is not None:
+            rows = handler(**(params or {}))
+        elif self.driver.default is not None:
+            rows = self.driver.default(cypher, params or {})
+        else:
+            raise KeyError(f"No in-memory handler for query: {cypher}")
+        return [_InMemoryRecord(row) for row in rows]
+
+
+class _InMemoryRecord:
+    def __init__(self, row):
+        self._row = row
+
+    def data(self):
+        return dict(self._row)
+
+
+def _squash(cypher):
+    return re.sub(r"\s+", " ", cypher).strip()
@@ -0,0 +1,229 @@
+import functools
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from .tracing import EMBEDDING_CACHE_LOOKUPS
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 'fake' gives deterministic offline embeddings (benchmarks and local runs without an API key)
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_SIZE = int(os.getenv('EMBEDDING_SIZE', '256'))
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+# Embeddings kept in each process's memory tier
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '10000'))
+# SQLite file of the disk tier, shared by the workers on a node and kept across restarts; empty disables it
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '')
+# The oldest disk entries are dropped beyond this many
+EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv('EMBEDDING_CACHE_DISK_MAX_ROWS', '1000000'))
+# Disk writes between trims to EMBEDDING_CACHE_DISK_MAX_ROWS
+DISK_TRIM_INTERVAL = 1000
+
+
+def get_embeddings(cached=EMBEDDING_CACHE_ENABLED):
+    """Create the embedding model used for retrieval and similarity checks.
+
+    With `cached`, the model sits behind this process's shared `EmbeddingCache`.
+    """
+    if EMBEDDING_MODEL == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=EMBEDDING_SIZE)
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    return CachedEmbeddings(embeddings, embedding_model_name(), embedding_cache()) if cached else embeddings
+
+
+def cosine_similarity(query_vector, vectors):
+    """Cosine similarity between one query vector and each row of a matrix."""
+    query = np.asarray(query_vector, dtype=np.float32)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    query_norm = np.linalg.norm(query) or 1.0
+    matrix_norms = np.linalg.norm(matrix, axis=1)
+    matrix_norms[matrix_norms == 0] = 1.0
+    return (matrix @ query) / (matrix_norms * query_norm)
+
+
+def embedding_model_name():
+    return f"fake-{EMBEDDING_SIZE}" if EMBEDDING_MODEL == "fake" else EMBEDDING_MODEL
+
+
+@functools.lru_cache(maxsize=None)
+def embedding_cache():
+    """The process-wide embedding cache."""
+    return EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH or None, EMBEDDING_CACHE_DISK_MAX_ROWS)
+
+
+def normalize_text(text):
+    """Unicode-normalizes text and collapses whitespace, so trivially different copies share an embedding."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", str(text))).strip()
+
+
+def embedding_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Embedding vectors by key, in an LRU memory tier over an optional SQLite disk tier.
+
+    The disk tier runs in WAL mode so every worker process on a node can read and write it at
+    once; a disk error only turns a lookup into a miss. Disk hits are copied into memory.
+    """
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, path=None, disk_max_rows=EMBEDDING_CACHE_DISK_MAX_ROWS):
+        self.max_size = max_size
+        self.path = path
+        self.disk_max_rows = disk_max_rows
+        self._memory = OrderedDict()  # key -> float32 vector, least recently used first
+        self._lock = threading.Lock()
+        self._local = threading.local()  # one SQLite connection per thread
+        self._disk_writes = 0
+        self.lookups = {"memory": 0, "disk": 0, "miss": 0}
+        if path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def get_many(self, keys):
+        """Cached vectors for `keys`, as {key: vector} for the keys found."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        memory_hits = len(found)
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.path:
+            from_disk = self._disk_get(missing)
+            self._remember(from_disk)
+            found.update(from_disk)
+        self._count("memory", memory_hits)
+        self._count("disk", len(found) - memory_hits)
+        self._count("miss", len(set(keys)) - len(found))
+        return found
+
+    def put_many(self, vectors):
+        """Stores {key: vector} in both tiers."""
+        self._remember(vectors)
+        if self.path and vectors:
+            self._disk_put(vectors)
+
+    def stats(self):
+        total = sum(self.lookups.values())
+        return {
+            **self.lookups,
+            "hit_rate": (total - self.lookups["miss"]) / total if total else 0.0,
+            "memory_size": len(self._memory),
+            "max_size": self.max_size,
+            "disk_path": self.path,
+        }
+
+    def _remember(self, vectors):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _count(self, tier, n):
+        if n:
+            self.lookups[tier] += n
+            EMBEDDING_CACHE_LOOKUPS.labels(tier).inc(n)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _disk_get(self, keys):
+        found = {}
+        try:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._connection().execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        except sqlite3.Error as e:
+            logger.warning("embedding cache read failed: %s", e)
+        return found
+
+    def _disk_put(self, vectors):
+        try:
+            connection = self._connection()
+            connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+            )
+            self._disk_writes += len(vectors)
+            if self._disk_writes >= DISK_TRIM_INTERVAL:
+                self._disk_writes = 0
+                connection.execute(
+                    "DELETE FROM embeddings WHERE rowid <= (SELECT MAX(rowid) FROM embeddings) - ?",
+                    (self.disk_max_rows,),
+                )
+        except sqlite3.Error as e:
+            logger.warning("embedding cache write failed: %s", e)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embedding model behind an `EmbeddingCache`, keyed by model name and normalized text.
+
+    Queries and documents share entries, so the wrapped model must embed both the same way (as
+    OpenAI's models do). Only the texts missing from the cache are sent to the model, in one call.
+    """
+
+    def __init__(self, embeddings, model, cache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            found.update(self._store(missing, self.embeddings.embed_documents(list(missing.values()))))
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        # Lookups stay on the event loop: a memory hit is a dict access and a disk hit one indexed read
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            found.update(self._store(missing, await self.embeddings.aembed_documents(list(missing.values()))))
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def _lookup(self, texts):
+        keys = [embedding_key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        return keys, found, missing
+
+    def _store(self, missing, vectors):
+        computed = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, vectors)}
+        self.cache.put_many(computed)
+        return computed
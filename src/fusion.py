@@ -0,0 +1,57 @@
+import hashlib
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+RRF_K = int(os.getenv('RRF_K', '60'))
+RRF_TOP_N = int(os.getenv('RRF_TOP_N', '3'))
+# Optional comma-separated weight per query list, e.g. "2,1,1,1,1"; missing weights default to 1
+RRF_WEIGHTS = [float(w) for w in os.getenv('RRF_WEIGHTS', '').split(',') if w.strip()]
+
+
+def document_id(doc):
+    """Stable ID for a document: its own ID if it has one, else a hash of its content."""
+    metadata = getattr(doc, "metadata", None) or {}
+    for key in ("id", "doc_id", "chunk_id"):
+        if metadata.get(key) is not None:
+            return str(metadata[key])
+    if getattr(doc, "id", None):
+        return str(doc.id)
+    return hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K, top_n=RRF_TOP_N, weights=None):
+    """Fuses ranked result lists with (weighted) reciprocal rank fusion.
+
+    Documents are deduplicated by `document_id`. Returns the top `top_n` documents and their
+    fused scores, best first; ties keep first-seen order so the output is deterministic.
+    """
+    ids = {}
+    documents = []
+    rows, cols, ranks = [], [], []
+    for row, docs in enumerate(result_lists):
+        for rank, doc in enumerate(docs, start=1):
+            doc_id = document_id(doc)
+            col = ids.get(doc_id)
+            if col is None:
+                col = ids[doc_id] = len(documents)
+                documents.append(doc)
+            rows.append(row)
+            cols.append(col)
+            ranks.append(rank)
+    if not documents:
+        return [], []
+
+    # Rank matrix: queries x unique documents, with inf where a query did not return the document
+    rank_matrix = np.full((len(result_lists), len(documents)), np.inf)
+    # A document repeated within one list keeps its best rank
+    np.minimum.at(rank_matrix, (np.array(rows), np.array(cols)), np.array(ranks, dtype=float))
+    weights = list(weights if weights is not None else RRF_WEIGHTS)
+    weights = np.array((weights + [1.0] * len(result_lists))[:len(result_lists)], dtype=float)
+    scores = weights @ (1.0 / (k + rank_matrix))
+
+    order = np.argsort(-scores, kind="stable")[:top_n]
+    return [documents[i] for i in order], [float(scores[i]) for i in order]
@@ -1,35 +1,42 @@
+import logging
 from dotenv import load_dotenv
 load_dotenv()
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph, START
-from langgraph.prebuilt import ToolNode
 from .state import AgentState
-from .nodes import Nodes
+from .nodes import Nodes, FALLBACK_ANSWER
+from .cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from .checkpoint import make_checkpointer
+from .admission import degraded
+from .embeddings import get_embeddings
+from .retriever import invalidate_cypher_results
+from .tracing import CHECKPOINT_RESUMES, start_request, traced_branch, traced_node
+
+logger = logging.getLogger(__name__)
 
-from .crew.crew import EmailFilterCrew
 
 class WorkflowGraph:
-    def __init__(self, agent_state: AgentState):
+    def __init__(self, agent_state: AgentState, nodes: Nodes = None, checkpointer=None):
         self.workflow = StateGraph(agent_state)
-        self.nodes_instance = Nodes()  # Create an instance of Nodes
-        self.workflow.add_node("router", self.nodes_instance.router)
-        self.workflow.add_node("web_search", self.nodes_instance.web_search)
-        self.workflow.add_node("vectorstore_retrieve", self.nodes_instance.vectorstore_retrieve)
-        self.workflow.add_node("cypher_retriever", self.nodes_instance.cypher_retriever)
-        self.workflow.add_node("cypher_translating", self.nodes_instance.cypher_translating)
-        self.workflow.add_node("retrieve_grader", self.nodes_instance.retrieve_grader)
-        self.workflow.add_node("generate", self.nodes_instance.generate)
-        self.workflow.add_node("mutiple_question_generators", self.nodes_instance.multiple_question_generators)
-        self.workflow.add_node("reciprocal_rank_fusion", self.nodes_instance.reciprocal_rank_fusion)
-        self.workflow.add_node("hallucination_grader", self.nodes_instance.hallucination_grader)
-        self.workflow.add_node("grader_crew", self.email_filter_crew.grader_crew)
-        self.workflow.add_node("hallucination_crew", self.email_filter_crew.hallucination_crew)
-        self.workflow.add_node("generation_crew", self.email_filter_crew.generation_crew)
+        self.nodes_instance = nodes or Nodes()  # Create an instance of Nodes
+        self.add_node("router", self.nodes_instance.router, self.nodes_instance.arouter)
+        self.add_node("web_search", self.nodes_instance.web_search, self.nodes_instance.aweb_search)
+        self.add_node("vectorstore_retrieve", self.nodes_instance.vectorstore_retrieve, self.nodes_instance.avectorstore_retrieve)
+        self.add_node("cypher_retriever", self.nodes_instance.cypher_retriever, self.nodes_instance.acypher_retriever)
+        self.add_node("cypher_translating", self.nodes_instance.cypher_translating, self.nodes_instance.acypher_translating)
+        self.add_node("retrieve_grader", self.nodes_instance.retrieve_grader, self.nodes_instance.aretrieve_grader)
+        self.add_node("rerank", self.nodes_instance.rerank, self.nodes_instance.arerank)
+        self.add_node("generate", self.nodes_instance.generate, self.nodes_instance.agenerate)
+        self.add_node("mutiple_question_generators", self.nodes_instance.multiple_question_generators, self.nodes_instance.amultiple_question_generators)
+        self.add_node("reciprocal_rank_fusion", self.nodes_instance.reciprocal_rank_fusion, self.nodes_instance.areciprocal_rank_fusion)
+        self.add_node("hallucination_grader", self.nodes_instance.hallucination_grader, self.nodes_instance.ahallucination_grader)
+        self.add_node("final_grader", self.nodes_instance.final_grader, self.nodes_instance.afinal_grader)
 
         # Define edges
         self.workflow.add_edge(START, "router")
         self.workflow.add_conditional_edges(
             "router",
-            self.nodes_instance.route_decision,
+            traced_branch("router", self.nodes_instance.route_decision),
             {
                 "web_search": "web_search",
                 "vectorstore": "vectorstore_retrieve",
@@ -38,19 +45,170 @@ class WorkflowGraph:
         )
         self.workflow.add_edge("web_search", "generate")
         self.workflow.add_edge("cypher_translating", "cypher_retriever")
-        self.workflow.add_edge("vectorstore_retrieve", "retrieve_grader")
+        self.workflow.add_edge("cypher_retriever", "generate")
         self.workflow.add_conditional_edges(
-            "retrieve_grader",
-            self.nodes_instance.decide_to_generate,
+            "vectorstore_retrieve",
+            traced_branch("vectorstore_retrieve", self.nodes_instance.decide_after_retrieve),
             {
-                "mutiple_question_generators": "mutiple_question_generators",
-                "generate": "generate",
+                "retrieve_grader": "retrieve_grader",
+                "rerank": "rerank",
+                "reciprocal_rank_fusion": "reciprocal_rank_fusion",
             },
         )
+        for grading_node in ("retrieve_grader", "rerank"):
+            self.workflow.add_conditional_edges(
+                grading_node,
+                traced_branch(grading_node, self.nodes_instance.decide_to_generate),
+                {
+                    "multiple_question_generators": "mutiple_question_generators",
+                    "generate": "generate",
+                },
+            )
         self.workflow.add_edge("mutiple_question_generators", "vectorstore_retrieve")
-        self.workflow.add_edge("vectorstore_retrieve", "reciprocal_rank_fusion")
-        
         self.workflow.add_edge("reciprocal_rank_fusion", "generate")
         self.workflow.add_edge("generate", "final_grader")
+        self.workflow.add_edge("final_grader", END)
         self.app = self.workflow.compile()
+        # Requests that carry a thread id run here, checkpointing after every node
+        self.checkpointed_app = self.workflow.compile(checkpointer=checkpointer) if checkpointer else None
+
+    def add_node(self, name, func, afunc):
+        """Registers a traced node that runs `func` under invoke and `afunc` under ainvoke."""
+        self.workflow.add_node(name, RunnableLambda(traced_node(name, func), afunc=traced_node(name, afunc), name=name))
+
+
+class WorkFlow:
+    """Compiled RAG workflow served by the API, behind the semantic answer cache."""
+
+    def __init__(self, nodes: Nodes = None, checkpointer=None):
+        nodes = nodes or Nodes()
+        self.checkpointer = checkpointer or make_checkpointer(lookup=_index_lookup(nodes))
+        self.graph = WorkflowGraph(AgentState, nodes, self.checkpointer)
+        self.app = self.graph.app
+        self.cache = SemanticCache(get_embeddings()) if SEMANTIC_CACHE_ENABLED else None
+
+    def invoke(self, payload, thread_id=None, mode="full"):
+        """Answers from the cache or runs the graph; returns (state, 'hit' | 'miss').
+
+        With a `thread_id` (and a checkpointer), a retry of a failed request resumes after its last
+        completed node, and a retry of a finished one returns its result. `mode` is the degradation
+        mode the request was admitted in (see src.admission).
+        """
+        relaxed = degraded(mode, "cache_first")
+        entry, vector = self.cache.get(payload["question"], relaxed) if self.cache else (None, None)
+        if entry is not None:
+            return self.cached_state(entry), "hit"
+        start_request()
+        payload = {**payload, "mode": mode}
+        if thread_id and self.graph.checkpointed_app:
+            config = self._thread_config(payload, thread_id)
+            graph_input, result = self._checkpointed_input(payload, thread_id, self.graph.checkpointed_app.get_state(config))
+            if result is None:
+                result = self.graph.checkpointed_app.invoke(graph_input, config=config)
+        else:
+            result = self.app.invoke(payload)
+        self.store(payload["question"], result, vector)
+        return result, "miss"
+
+    async def ainvoke(self, payload, config=None, thread_id=None, mode="full"):
+        """Async version of `invoke`."""
+        entry, vector = await self.lookup(payload["question"], degraded(mode, "cache_first"))
+        if entry is not None:
+            return self.cached_state(entry), "hit"
+        return await self.arun(payload, vector, config=config, thread_id=thread_id, mode=mode), "miss"
+
+    async def arun(self, payload, vector=None, config=None, thread_id=None, mode="full"):
+        """Runs the graph after a cache miss and caches the answer; returns the final state.
+
+        `vector` is the question's embedding from `lookup`, reused to cache the answer.
+        """
+        start_request()
+        payload = {**payload, "mode": mode}
+        if thread_id and self.graph.checkpointed_app:
+            config = self._thread_config(payload, thread_id, config)
+            snapshot = await self.graph.checkpointed_app.aget_state(config)
+            graph_input, result = self._checkpointed_input(payload, thread_id, snapshot)
+            if result is None:
+                result = await self.graph.checkpointed_app.ainvoke(graph_input, config=config)
+        else:
+            result = await self.app.ainvoke(payload, config=config)
+        self.store(payload["question"], result, vector)
+        return result
+
+    async def astream(self, payload, **kwargs):
+        """Streams a graph run (see StateGraph.astream), bypassing the cache."""
+        start_request()
+        async for chunk in self.app.astream(payload, **kwargs):
+            yield chunk
+
+    def preload(self, roles=None):
+        """Builds crews ahead of the first request (default: CREW_PRELOAD); returns each one's build seconds."""
+        return self.graph.nodes_instance.crews.preload(roles)
+
+    def load_index(self):
+        """Loads the vectorstore retriever (and builds its BM25 index if missing) ahead of the first request."""
+        return self.graph.nodes_instance.vectorstore_retriever
+
+    async def lookup(self, question, relaxed=False):
+        """Looks up a cached answer; returns (entry or None, question vector or None)."""
+        if self.cache is None:
+            return None, None
+        return await self.cache.aget(question, relaxed)
+
+    def store(self, question, result, vector=None):
+        """Caches a finished run's answer unless it is the fallback answer or was produced in a degraded mode.
+
+        `vector` is the question embedding from the cache lookup. Without one the lookup could not
+        embed the question, so the answer is not cached rather than embedded again (and on the async
+        path, on the event loop).
+        """
+        generation = result.get("generation")
+        if self.cache is None or not generation or generation == FALLBACK_ANSWER:
+            return
+        if vector is None:
+            logger.debug("---ANSWER NOT CACHED: QUESTION COULD NOT BE EMBEDDED---")
+            return
+        if result.get("mode", "full") != "full":
+            return
+        self.cache.put(question, generation, result.get("response"), vector)
+
+    def invalidate_cache(self, route=None):
+        """Drops cached answers, e.g. after the vectorstore ('vectorstore') or cypher data ('cypher db') changes."""
+        if route in (None, "cypher db"):
+            invalidate_cypher_results()
+        return self.cache.invalidate(route) if self.cache else 0
+
+    @staticmethod
+    def _thread_config(payload, thread_id, config=None):
+        config = dict(config or {})
+        config["configurable"] = {**config.get("configurable", {}), "thread_id": str(thread_id)}
+        # Saved in every checkpoint's metadata, so a reused thread id with a new question starts over
+        config["metadata"] = {**config.get("metadata", {}), "request_question": payload["question"]}
+        return config
+
+    def _checkpointed_input(self, payload, thread_id, snapshot):
+        """(graph input, None) for the run of a thread in `snapshot`, or (None, final state) if it already finished."""
+        if snapshot.values and snapshot.metadata.get("request_question") == payload["question"]:
+            if not snapshot.next:
+                logger.info("---THREAD %s ALREADY ANSWERED---", thread_id)
+                return None, snapshot.values
+            logger.info("---RESUMING THREAD %s AT %s---", thread_id, ", ".join(snapshot.next))
+            CHECKPOINT_RESUMES.labels(snapshot.next[0]).inc()
+            return None, None
+        if snapshot.values:
+            self.checkpointer.delete_thread(thread_id)
+        return payload, None
+
+    @staticmethod
+    def cached_state(entry):
+        return {"question": entry.question, "generation": entry.generation, "response": entry.route}
+
 
+def _index_lookup(nodes):
+    """Resolves checkpointed chunk ids against the index behind `nodes`' vectorstore retriever."""
+    def lookup(ids):
+        index = getattr(nodes.vectorstore_retriever, "vectorstore", None)
+        if index is None:
+            return {}
+        return {doc.metadata["id"]: doc.page_content for doc in index.get_documents(ids)}
+    return lookup
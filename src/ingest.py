@@ -0,0 +1,332 @@
+"""Streaming ingestion of a document corpus into the local embedding index.
+
+Documents are read lazily, chunked, embedded in batches on a bounded pool of worker processes
+and upserted into the `LocalIndex` at VECTOR_INDEX_DIR. A SQLite manifest next to the index keeps
+each document's content hash, so a rerun (or a resumed, interrupted run) only embeds documents
+that are new or changed:
+
+    python -m src.ingest data/products --workers 4 --prune
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', '1000'))
+INGEST_CHUNK_OVERLAP = int(os.getenv('INGEST_CHUNK_OVERLAP', '200'))
+# Chunks sent to the embedding model per call
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '256'))
+# Embedding worker processes; 0 embeds in the main process
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+# The index and manifest are saved after this many upserted chunks; a crash loses at most this much work
+INGEST_CHECKPOINT_CHUNKS = int(os.getenv('INGEST_CHECKPOINT_CHUNKS', '10000'))
+
+MANIFEST_FILE = "ingest.sqlite"
+TEXT_FIELDS = ("page_content", "text", "content", "description")
+DEFAULT_PATTERNS = ("*.txt", "*.md", "*.jsonl")
+
+
+@dataclass
+class SourceDocument:
+    id: str
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+def load_directory(source_dir, patterns=DEFAULT_PATTERNS):
+    """Yields the documents under `source_dir`: one per text file and one per line of a .jsonl file."""
+    source_dir = Path(source_dir)
+    for pattern in patterns:
+        for path in sorted(source_dir.rglob(pattern)):
+            source = str(path.relative_to(source_dir))
+            if path.suffix == ".jsonl":
+                yield from load_jsonl(path, source)
+            else:
+                yield SourceDocument(source, path.read_text(encoding="utf-8"), {"source": source})
+
+
+def load_jsonl(path, source=None):
+    """Yields one document per JSON line; ids default to '<source>#<line>'.
+
+    The text is the first of TEXT_FIELDS present, and the other scalar fields become metadata.
+    """
+    source = source or str(path)
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = next((record[name] for name in TEXT_FIELDS if record.get(name)), None)
+            if text is None:
+                logger.warning("skipping %s line %d: no text field", source, line_number + 1)
+                continue
+            metadata = {key: value for key, value in record.items()
+                        if key not in TEXT_FIELDS and isinstance(value, (str, int, float, bool))}
+            metadata.setdefault("source", source)
+            yield SourceDocument(str(record.get("id", f"{source}#{line_number}")), str(text), metadata)
+
+
+def content_hash(document, chunk_size, overlap, model):
+    """Hash of everything that determines a document's chunks and their embeddings."""
+    digest = hashlib.sha256(f"{model}\0{chunk_size}\0{overlap}\0".encode("utf-8"))
+    digest.update(document.text.encode("utf-8"))
+    digest.update(json.dumps(document.metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chunk_ids(doc_id, count, start=0):
+    return [f"{doc_id}:{i}" for i in range(start, count)]
+
+
+class Manifest:
+    """Per-document content hash and chunk count of what the index holds, in SQLite.
+
+    Writes are only committed by `commit`, which the ingester calls right after saving the index,
+    so a crash never records a document whose chunks were not saved.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, hash TEXT NOT NULL, "
+            "chunks INTEGER NOT NULL, run INTEGER NOT NULL)"
+        )
+        self.connection.commit()
+        self.run = int(time.time() * 1000)
+
+    def get(self, doc_id):
+        """(hash, chunk count) recorded for a document, or None."""
+        return self.connection.execute("SELECT hash, chunks FROM documents WHERE id = ?", (doc_id,)).fetchone()
+
+    def seen(self, doc_id):
+        """Marks an unchanged document as part of this run."""
+        self.connection.execute("UPDATE documents SET run = ? WHERE id = ?", (self.run, doc_id))
+
+    def put(self, doc_id, digest, chunks):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO documents (id, hash, chunks, run) VALUES (?, ?, ?, ?)",
+            (doc_id, digest, chunks, self.run),
+        )
+
+    def unseen(self):
+        """Yields (id, chunk count) of the documents not seen in this run."""
+        yield from self.connection.execute("SELECT id, chunks FROM documents WHERE run != ?", (self.run,))
+
+    def remove(self, doc_id):
+        self.connection.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+_worker_embeddings = None
+
+
+def _init_worker():
+    global _worker_embeddings
+    from .embeddings import get_embeddings
+    # Each chunk is embedded once, so it would only push query embeddings out of the cache
+    _worker_embeddings = get_embeddings(cached=False)
+
+
+def _embed_batch(texts):
+    """Embeds one batch in a worker process."""
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+
+class Ingester:
+    """Streams documents into a `LocalIndex`, embedding only new and changed documents.
+
+    A batch is a run of whole documents holding at least `batch_size` chunks. At most
+    2 * `workers` batches are embedding at once and the document stream is only read when a
+    slot frees up, so memory stays flat however large the corpus is. Finished batches are
+    upserted in input order, and every `checkpoint_chunks` chunks the index is saved and the
+    manifest committed; an interrupted run resumes by skipping the documents already committed.
+    """
+
+    def __init__(self, index, manifest, chunk_size=INGEST_CHUNK_SIZE, overlap=INGEST_CHUNK_OVERLAP,
+                 batch_size=INGEST_BATCH_SIZE, workers=INGEST_WORKERS, checkpoint_chunks=INGEST_CHECKPOINT_CHUNKS,
+                 model=None, report_every=10.0):
+        from .embeddings import EMBEDDING_MODEL
+
+        self.index = index
+        self.manifest = manifest
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint_chunks = checkpoint_chunks
+        self.model = model or EMBEDDING_MODEL
+        self.report_every = report_every
+        self.stats = {"documents": 0, "unchanged": 0, "embedded": 0, "chunks": 0, "removed": 0}
+        self._since_checkpoint = 0
+
+    def run(self, documents, prune=False):
+        """Ingests `documents`; with `prune`, also removes documents not in them. Returns the run's stats."""
+        from .retriever import chunk_text
+
+        start = self._last_report = time.perf_counter()
+        pool = self._pool()
+        in_flight = deque()  # (documents, chunks, future or vectors)
+        batch_docs, batch_chunks = [], []
+        try:
+            for document in documents:
+                self.stats["documents"] += 1
+                digest = content_hash(document, self.chunk_size, self.overlap, self.model)
+                previous = self.manifest.get(document.id)
+                if previous is not None and previous[0] == digest:
+                    self.manifest.seen(document.id)
+                    self.stats["unchanged"] += 1
+                    continue
+                chunks = chunk_text(document.text, self.chunk_size, self.overlap)
+                batch_docs.append((document.id, digest, len(chunks), previous[1] if previous else 0))
+                batch_chunks.extend(
+                    (chunk_id, chunk, {**document.metadata, "document": document.id})
+                    for chunk_id, chunk in zip(chunk_ids(document.id, len(chunks)), chunks)
+                )
+                if len(batch_chunks) >= self.batch_size:
+                    in_flight.append(self._submit(pool, batch_docs, batch_chunks))
+                    batch_docs, batch_chunks = [], []
+                    while len(in_flight) >= max(1, 2 * self.workers):
+                        self._upsert(*in_flight.popleft())
+                self._report(start)
+            if batch_docs:
+                in_flight.append(self._submit(pool, batch_docs, batch_chunks))
+            while in_flight:
+                self._upsert(*in_flight.popleft())
+            if prune:
+                self._prune()
+            self._checkpoint()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - start
+        self.stats["seconds"] = elapsed
+        self.stats["documents_per_second"] = self.stats["documents"] / elapsed if elapsed else 0.0
+        self.stats["embedded_per_second"] = self.stats["embedded"] / elapsed if elapsed else 0.0
+        logger.info("---INGESTED %d DOCUMENTS (%d EMBEDDED, %d UNCHANGED) IN %.1fs, %.1f DOCS/S---",
+                    self.stats["documents"], self.stats["embedded"], self.stats["unchanged"], elapsed,
+                    self.stats["documents_per_second"])
+        return dict(self.stats)
+
+    def _pool(self):
+        if self.workers <= 0:
+            return None
+        # spawn: workers must not inherit the parent's threads or open index files
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker)
+
+    def _submit(self, pool, docs, chunks):
+        texts = [text for _, text, _ in chunks]
+        if pool is None:
+            return docs, chunks, self.index.embeddings.embed_documents(texts)
+        return docs, chunks, pool.submit(_embed_batch, texts)
+
+    def _upsert(self, docs, chunks, vectors):
+        if not isinstance(vectors, (list, np.ndarray)):
+            vectors = vectors.result()
+        # Chunks left over from a longer previous version of a document
+        stale = [chunk_id for doc_id, _, count, previous in docs for chunk_id in chunk_ids(doc_id, previous, count)]
+        self.index.delete(stale)
+        ids, texts, metadatas = zip(*chunks) if chunks else ((), (), ())
+        if ids:
+            self.index.add(list(ids), list(texts), vectors, list(metadatas))
+        for doc_id, digest, count, _ in docs:
+            self.manifest.put(doc_id, digest, count)
+        self.stats["embedded"] += len(docs)
+        self.stats["chunks"] += len(ids)
+        self._since_checkpoint += len(ids) + len(stale)
+        if self._since_checkpoint >= self.checkpoint_chunks:
+            self._checkpoint()
+
+    def _prune(self):
+        removed = list(self.manifest.unseen())
+        for doc_id, count in removed:
+            self.index.delete(chunk_ids(doc_id, count))
+            self.manifest.remove(doc_id)
+        self.stats["removed"] = len(removed)
+
+    def _checkpoint(self):
+        self.index.save()
+        self.manifest.commit()
+        self._since_checkpoint = 0
+        logger.debug("---CHECKPOINT: %d CHUNKS IN INDEX---", len(self.index))
+
+    def _report(self, start):
+        now = time.perf_counter()
+        if now - self._last_report >= self.report_every:
+            self._last_report = now
+            logger.info("%d documents (%d embedded, %d unchanged), %.1f docs/s", self.stats["documents"],
+                        self.stats["embedded"], self.stats["unchanged"], self.stats["documents"] / (now - start))
+
+
+def ingest(documents, index_dir=None, embeddings=None, prune=False, compact_ratio=0.2, **kwargs):
+    """Ingests `documents` into the index at `index_dir` and rebuilds its BM25 index; returns the run's stats.
+
+    The matrix is compacted when more than `compact_ratio` of its rows are deleted.
+    """
+    from .bm25 import BM25Index
+    from .embeddings import get_embeddings
+    from .retriever import HYBRID_RETRIEVAL, IVF_MIN_SIZE, VECTOR_INDEX_DIR, LocalIndex
+
+    index_dir = index_dir or VECTOR_INDEX_DIR
+    index = LocalIndex(index_dir, embeddings or get_embeddings(cached=False))
+    manifest = Manifest(Path(index_dir) / MANIFEST_FILE)
+    try:
+        stats = Ingester(index, manifest, **kwargs).run(documents, prune=prune)
+    finally:
+        manifest.close()
+    if index.count and (index.count - len(index)) / index.count > compact_ratio:
+        index.compact()
+    if len(index) >= IVF_MIN_SIZE and index._centroids is None:
+        index.build_ivf()
+        index.save()
+    if HYBRID_RETRIEVAL and (stats["embedded"] or stats["removed"] or BM25Index.load(index_dir) is None):
+        BM25Index.build_from_index(index).save(index_dir)
+    stats["index_chunks"] = len(index)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", type=Path, help="directory of .txt, .md and .jsonl files, or one .jsonl file")
+    parser.add_argument("--index-dir", default=None, help="index directory (default: VECTOR_INDEX_DIR)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="embedding processes; 0 embeds inline")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="chunks per embedding call")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP, help="characters shared by chunks")
+    parser.add_argument("--checkpoint-chunks", type=int, default=INGEST_CHECKPOINT_CHUNKS,
+                        help="upserted chunks between checkpoints")
+    parser.add_argument("--prune", action="store_true", help="remove indexed documents missing from the source")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
+    documents = load_jsonl(args.source) if args.source.is_file() else load_directory(args.source)
+    stats = ingest(documents, args.index_dir, prune=args.prune, chunk_size=args.chunk_size,
+                   overlap=args.chunk_overlap, batch_size=args.batch_size, workers=args.workers,
+                   checkpoint_chunks=args.checkpoint_chunks)
+    print(json.dumps(stats, indent=2))
+    # A running server loads the index and caches answers in memory: restart it to serve the new data
+
+
+if __name__ == "__main__":
+    main()
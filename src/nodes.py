@@ -1,118 +1,281 @@
+import asyncio
+import contextvars
+import logging
 import os
-import time
-from crew.agents import RAG_AGENTS
-from crew.tasks import Tasks
-from crewai import Crew
-from .retriever import vectorstore_retrieve, cypher_retriever, web_search_tool
-
+import re
+from concurrent.futures import ThreadPoolExecutor
+from langgraph.config import get_stream_writer
+from . import retriever
+from .retriever import cypher_retriever
+from .embeddings import get_embeddings, cosine_similarity
+from .routing import LocalRouter, normalize_route
+from .fusion import reciprocal_rank_fusion
+from .rerank import Reranker
+from .cypher import CypherTemplateCache, clean_cypher
+from .verification import documents_text, is_clearly_grounded
+from .tracing import record_context_tokens, record_llm_call
+from .packing import CONTEXT_PACKING, ContextPacker, token_counter
+from .batching import MICRO_BATCHING, MicroBatcher
+from .admission import degraded
+from .crew.registry import CrewRegistry
+
+logger = logging.getLogger(__name__)
+
+# Document grading: 'batch' (one structured call), 'concurrent' (one call per document
+# on a bounded pool) or 'sequential'
+GRADER_MODE = os.getenv('GRADER_MODE', 'batch')
+GRADER_MAX_WORKERS = int(os.getenv('GRADER_MAX_WORKERS', '4'))
+# Embedding-similarity pre-filter: documents at or above the upper bound are kept and
+# documents below the lower bound are dropped without an LLM call
+GRADER_PREFILTER = os.getenv('GRADER_PREFILTER', 'true').lower() == 'true'
+GRADER_PREFILTER_LOW = float(os.getenv('GRADER_PREFILTER_LOW', '0.2'))
+GRADER_PREFILTER_HIGH = float(os.getenv('GRADER_PREFILTER_HIGH', '0.85'))
+# Concurrent retrievals for the rephrased questions of the query-expansion branch
+RETRIEVAL_MAX_WORKERS = int(os.getenv('RETRIEVAL_MAX_WORKERS', '5'))
+# Per-stage timeout (seconds) for the async path; override one stage with e.g. STAGE_TIMEOUT_GENERATE
+STAGE_TIMEOUT = float(os.getenv('STAGE_TIMEOUT', '60'))
+# Answer returned when the generation cannot be grounded in the retrieved documents
+FALLBACK_ANSWER = "Sorry, I am not able to answer this question. Please contact customer service."
+
+
+class StageTimeoutError(TimeoutError):
+    """Raised when a graph stage exceeds its timeout on the async path."""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"Stage '{stage}' timed out after {timeout:g}s")
+        self.stage = stage
+        self.timeout = timeout
 
 
 class Nodes:
-    def __init__(self):
-        # Initialize crews
-        self.router_crew = Crew(
-            agents=[RAG_AGENTS.router_agent],
-            tasks=[Tasks.router_task],
-            memory=True,
-            verbose=True,
-        )
-
-        self.grader_crew = Crew(
-            agents=[RAG_AGENTS.grader_agent],
-            tasks=[Tasks.grader_task],
-            verbose=True,
-        )
-
-        self.answer_generator_crew = Crew(
-            agents=[RAG_AGENTS.answer_generator],
-            tasks=[Tasks.answer_generator_task],
-            memory=True,
-            verbose=True,
-        )
-
-        self.question_generators_crew = Crew(
-            agents=[RAG_AGENTS.question_generators],
-            tasks=[Tasks.question_generators_task],
-            verbose=True,
-        )
-
-        self.hallucination_crew = Crew(
-            agents=[RAG_AGENTS.hallucination_grader],
-            tasks=[Tasks.hallucination_grader_task],
-            verbose=True,
-        )
-
-        self.answer_review_crew = Crew(
-            agents=[RAG_AGENTS.answer_review_agent],
-            tasks=[Tasks.answer_review_task],
-            verbose=True,
-        )
-
-        self.cypher_translator_crew = Crew(
-            agents=[RAG_AGENTS.cypher_translator],
-            tasks=[Tasks.cypher_translator_task],
-            verbose=True,
-        )
+    def __init__(self, agents=None):
+        # Crews are built on first use (or by `WorkFlow.preload`); agents use the *_LLM models
+        # from the environment unless a RAG_AGENTS instance is passed in
+        self.crews = CrewRegistry(agents)
+        self.embeddings = get_embeddings() if GRADER_PREFILTER else None
+        # Resolved on first use, so building Nodes does not load the index or write bm25.npz
+        self._vectorstore_retriever = None
+        self._web_search_tool = None
+        self.local_router = LocalRouter.from_env(self.embeddings)
+        self.reranker = Reranker.from_env()
+        self.cypher_templates = CypherTemplateCache()
+        self.packer = ContextPacker() if CONTEXT_PACKING else None
+        # Async-path router and batch grader calls of concurrent requests, coalesced per role
+        self.batchers = {
+            "router": MicroBatcher.from_env("router", self._route_batch),
+            "grader": MicroBatcher.from_env("grader", self._grade_pairs),
+        } if MICRO_BATCHING else {}
+
+    @property
+    def vectorstore_retriever(self):
+        """Retriever over the local index; the shared one is loaded on first access unless one was assigned."""
+        if self._vectorstore_retriever is None:
+            self._vectorstore_retriever = retriever.vectorstore_retrieve
+        return self._vectorstore_retriever
+
+    @vectorstore_retriever.setter
+    def vectorstore_retriever(self, value):
+        self._vectorstore_retriever = value
+
+    @property
+    def web_search_tool(self):
+        """Web search client; the shared one is created on first access unless one was assigned."""
+        if self._web_search_tool is None:
+            self._web_search_tool = retriever.web_search_tool
+        return self._web_search_tool
+
+    @web_search_tool.setter
+    def web_search_tool(self, value):
+        self._web_search_tool = value
+
+    async def _run_stage(self, stage, awaitable):
+        """Awaits one stage of an async node, bounded by that stage's timeout.
+
+        The timeout cancels the awaiting coroutine only. Work already running on a thread (a crew
+        kickoff, the cypher query) finishes in the background, bounded by CREW_MAX_THREADS for crews.
+        """
+        timeout = float(os.getenv(f"STAGE_TIMEOUT_{stage.upper()}", STAGE_TIMEOUT))
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeoutError(stage, timeout) from None
 
     def router(self, state):
-        """Initiates the router agent to generate a routing decision based on the current state."""
-        print("---CALL ROUTER AGENT---")
+        """Routes locally when the classifier is confident, otherwise initiates the router agent."""
+        question = state["question"]
+        route, confidence = self.local_router.classify(question)
+        if self.local_router.is_confident(confidence):
+            logger.debug("---LOCAL ROUTE: %s (%.2f)---", route, confidence)
+            source = "local"
+        else:
+            logger.debug("---CALL ROUTER AGENT---")
+            route = normalize_route(self.crews["router"].kickoff(inputs={"question": question}).raw)
+            source = "llm"
+        self.local_router.record(route, source)
+        return {"question": question, "response": route}
+
+    async def arouter(self, state):
+        """Async version of `router`."""
         question = state["question"]
-        response = self.router_crew.kickoff(inputs={"question": question})
-        return {"question": question, "response": response}
+        route, confidence = await self.local_router.aclassify(question)
+        if self.local_router.is_confident(confidence):
+            logger.debug("---LOCAL ROUTE: %s (%.2f)---", route, confidence)
+            source = "local"
+        else:
+            logger.debug("---CALL ROUTER AGENT---")
+            route = await self._run_stage("router", self._aroute_llm(question))
+            source = "llm"
+        self.local_router.record(route, source)
+        return {"question": question, "response": route}
+
+    async def _aroute_llm(self, question):
+        """Routes with the router crew, in a micro-batch when enabled."""
+        if "router" in self.batchers:
+            return await self.batchers["router"].submit(question)
+        response = await self.crews["router"].kickoff_async(inputs={"question": question})
+        return normalize_route(response.raw)
+
+    async def _route_batch(self, questions):
+        """Routes a micro-batch of questions with one router call; one route per question."""
+        if len(questions) == 1:
+            response = await self.crews["router"].kickoff_async(inputs={"question": questions[0]})
+            return [normalize_route(response.raw)]
+        result = await self.crews["router_batch"].kickoff_async(inputs={"questions": _numbered(questions)})
+        routes = [normalize_route(route) for route in result.pydantic.routes] if result.pydantic is not None else []
+        if len(routes) != len(questions):
+            logger.warning("---BATCH ROUTER RETURNED %d ROUTES FOR %d QUESTIONS---", len(routes), len(questions))
+            return await asyncio.gather(*(self._route_batch([question]) for question in questions))
+        return routes
 
     def route_decision(self, state):
         """Routes the question based on the agent's decision."""
-        print("---ROUTE QUESTION DECISION---")
+        logger.debug("---ROUTE QUESTION DECISION---")
         decision = state["response"]
 
         if decision == "web_search":
-            print("---ROUTE QUESTION TO WEB SEARCH---")
+            logger.debug("---ROUTE QUESTION TO WEB SEARCH---")
             return "web_search"
         elif decision == "vectorstore":
-            print("---ROUTE QUESTION TO VECTORSTORE---")
+            logger.debug("---ROUTE QUESTION TO VECTORSTORE---")
             return "vectorstore"
         elif decision == "cypher db":
-            print("---ROUTE QUESTION TO CYPHER DB---")
+            logger.debug("---ROUTE QUESTION TO CYPHER DB---")
             return "cypher db"
         else:
-            print("---UNKNOWN ROUTE DECISION---")
+            logger.warning("---UNKNOWN ROUTE DECISION---")
             return None
 
     def vectorstore_retrieve(self, state):
-        """Retrieves relevant documents for the question from the vectorstore."""
-        print("---RETRIEVE DOCUMENTS FROM VECTORSTORE---")
+        """Retrieves relevant documents for the question, or for each rephrased question, from the vectorstore."""
+        logger.debug("---RETRIEVE DOCUMENTS FROM VECTORSTORE---")
         question = state["question"]
+        questions = state.get("questions")
 
-        if isinstance(question, list):
-            documents = [self.vectorstore_retriever.get_relevant_documents(q) for q in question]
+        if questions:
+            documents = self._multi_query_retrieve(questions)
         else:
             documents = self.vectorstore_retriever.get_relevant_documents(question)
 
         return {"documents": documents, "question": question}
-    
-      
+
+    async def avectorstore_retrieve(self, state):
+        """Async version of `vectorstore_retrieve`."""
+        logger.debug("---RETRIEVE DOCUMENTS FROM VECTORSTORE---")
+        question = state["question"]
+        questions = state.get("questions")
+
+        if questions:
+            documents = await self._run_stage("vectorstore_retrieve", self._amulti_query_retrieve(questions))
+        else:
+            documents = await self._run_stage("vectorstore_retrieve", self.vectorstore_retriever.ainvoke(question))
+
+        return {"documents": documents, "question": question}
+
+    def _multi_query_retrieve(self, questions):
+        """Retrieves for every question concurrently; one result list per question, in question order.
+
+        When the retriever exposes its vectorstore, all questions are embedded in one batched call and
+        each is then searched with `search_by_vector` (dense, or fused with BM25 for a hybrid retriever).
+        """
+        retriever = self.vectorstore_retriever
+        vectorstore = getattr(retriever, "vectorstore", None)
+        with ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS) as executor:
+            if vectorstore is None:
+                return list(executor.map(retriever.get_relevant_documents, questions))
+            vectors = vectorstore.embeddings.embed_documents(questions)
+            return list(executor.map(retriever.search_by_vector, questions, vectors))
+
+    async def _amulti_query_retrieve(self, questions):
+        """Async version of `_multi_query_retrieve`, bounded by a semaphore instead of a pool."""
+        semaphore = asyncio.Semaphore(RETRIEVAL_MAX_WORKERS)
+        retriever = self.vectorstore_retriever
+        vectorstore = getattr(retriever, "vectorstore", None)
+
+        async def bounded(awaitable):
+            async with semaphore:
+                return await awaitable
+
+        if vectorstore is None:
+            return await asyncio.gather(*(bounded(retriever.ainvoke(q)) for q in questions))
+        vectors = await vectorstore.embeddings.aembed_documents(questions)
+        return await asyncio.gather(
+            *(bounded(retriever.asearch_by_vector(q, v)) for q, v in zip(questions, vectors))
+        )
+
+    def decide_after_retrieve(self, state):
+        """Sends query-expansion results to fusion and first-pass results to the reranker or grader."""
+        if state.get("questions"):
+            logger.debug("---DECISION: FUSE MULTI-QUERY RESULTS---")
+            return "reciprocal_rank_fusion"
+        return "rerank" if self.reranker is not None else "retrieve_grader"
+
     def cypher_translating(self, state):
-        """Initiates the router agent to generate a routing decision based on the current state."""
-        print("---CALL cypher_translator agent---")
+        """Converts the question into a cypher query, from a cached template when its pattern is known."""
         question = state["question"]
-        response = self.cypher_translator_crew.kickoff(inputs={"question": question})
-        return {"question": question, "response": response}
-    
-    def cypher_retriever(self, state):
-        """Retrieves relevant documents for the question from the vectorstore."""
-        print("---RETRIEVE DOCUMENTS FROM VECTORSTORE---")
+        template = self.cypher_templates.lookup(question)
+        if template is not None:
+            logger.debug("---CYPHER TEMPLATE HIT---")
+            cypher, params = template
+            return {"question": question, "cypher": cypher, "cypher_params": params}
+
+        logger.debug("---CALL cypher_translator agent---")
+        response = self.crews["cypher_translator"].kickoff(inputs={"question": question})
+        self.cypher_templates.learn(question, response.raw)
+        return {"question": question, "cypher": clean_cypher(response.raw), "cypher_params": {}}
+
+    async def acypher_translating(self, state):
+        """Async version of `cypher_translating`."""
         question = state["question"]
-        cypher=state["cypher"]
+        template = self.cypher_templates.lookup(question)
+        if template is not None:
+            logger.debug("---CYPHER TEMPLATE HIT---")
+            cypher, params = template
+            return {"question": question, "cypher": cypher, "cypher_params": params}
+
+        logger.debug("---CALL cypher_translator agent---")
+        response = await self._run_stage(
+            "cypher_translating", self.crews["cypher_translator"].kickoff_async(inputs={"question": question})
+        )
+        self.cypher_templates.learn(question, response.raw)
+        return {"question": question, "cypher": clean_cypher(response.raw), "cypher_params": {}}
 
-        if isinstance(question, list):
-            documents = [self.cypher_retriever(q) for q in cypher]
-        else:
-            documents = self.cypher_retriever(cypher)
+    def cypher_retriever(self, state):
+        """Retrieves relevant documents for the question from the cypher db."""
+        logger.debug("---RETRIEVE DOCUMENTS FROM CYPHER DB---")
+        question = state["question"]
+        documents = cypher_retriever(state["cypher"], state.get("cypher_params"))
+        return {"documents": documents, "question": question}
 
+    async def acypher_retriever(self, state):
+        """Async version of `cypher_retriever`."""
+        logger.debug("---RETRIEVE DOCUMENTS FROM CYPHER DB---")
+        question = state["question"]
+        documents = await self._run_stage(
+            "cypher_retriever", asyncio.to_thread(cypher_retriever, state["cypher"], state.get("cypher_params"))
+        )
         return {"documents": documents, "question": question}
-    
-    def web_search(state):
+
+    def web_search(self, state):
         """
         Web search based on the re-phrased question.
 
@@ -123,120 +286,491 @@ class Nodes:
              state (dict): Updates documents key with appended web results
          """
 
-        print("---WEB SEARCH---")
+        logger.debug("---WEB SEARCH---")
         question = state["question"]
 
-        # Web search
-        docs = web_search_tool.invoke({"query": question})
-        web_results = "\n".join([d["content"] for d in docs])
-        web_results = Document(page_content=web_results)
+        # One document per cleaned, truncated result
+        documents = self.web_search_tool.search(question)
+        return {"documents": documents, "question": question}
+
+    async def aweb_search(self, state):
+        """Async version of `web_search`."""
+        logger.debug("---WEB SEARCH---")
+        question = state["question"]
 
-        return {"documents": web_results, "question": question}
+        documents = await self._run_stage("web_search", self.web_search_tool.asearch(question))
+        return {"documents": documents, "question": question}
 
     def retrieve_grader(self, state):
         """Checks if the retrieved documents are relevant to the question."""
-        print("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+        logger.debug("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
         question = state["question"]
         documents = state["documents"]
-        filtered_docs = []
 
-        for doc in documents:
-            score = self.grader_crew.kickoff(inputs={"documents": documents, "question": question})
-            grade = score["score"]
+        grades = self._prefilter_documents(question, documents)
+        grades = self._grade_uncertain(question, documents, grades, degraded(state.get("mode"), "local_grading"))
+        return {"documents": self._filter_graded(documents, grades), "question": question}
+
+    async def aretrieve_grader(self, state):
+        """Async version of `retrieve_grader`."""
+        logger.debug("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+        question = state["question"]
+        documents = state["documents"]
+
+        grades = await self._run_stage("retrieve_grader", self._aprefilter_documents(question, documents))
+        grades = await self._run_stage("retrieve_grader", self._agrade_uncertain(
+            question, documents, grades, degraded(state.get("mode"), "local_grading")
+        ))
+        return {"documents": self._filter_graded(documents, grades), "question": question}
+
+    def rerank(self, state):
+        """Scores documents with the local reranker; only the uncertain band goes to the grader crew."""
+        logger.debug("---RERANK DOCUMENTS---")
+        question = state["question"]
+        documents = state["documents"]
+
+        scores, grades = self.reranker.grade(question, [doc.page_content for doc in documents])
+        grades = self._grade_uncertain(question, documents, grades, degraded(state.get("mode"), "local_grading"))
+        return self._reranked(question, documents, scores, grades)
+
+    async def arerank(self, state):
+        """Async version of `rerank`."""
+        logger.debug("---RERANK DOCUMENTS---")
+        question = state["question"]
+        documents = state["documents"]
+
+        scores, grades = await self._run_stage(
+            "rerank", asyncio.to_thread(self.reranker.grade, question, [doc.page_content for doc in documents])
+        )
+        grades = await self._run_stage("rerank", self._agrade_uncertain(
+            question, documents, grades, degraded(state.get("mode"), "local_grading")
+        ))
+        return self._reranked(question, documents, scores, grades)
+
+    def _reranked(self, question, documents, scores, grades):
+        """Keeps the documents graded 'yes', best reranker score first."""
+        logger.debug("---RERANK: %d KEPT, %d DROPPED OF %d---", grades.count("yes"), grades.count("no"), len(grades))
+        kept = sorted(
+            (i for i, grade in enumerate(grades) if grade == "yes"), key=lambda i: scores[i], reverse=True
+        )
+        return {
+            "documents": [documents[i] for i in kept],
+            "rerank_scores": [float(scores[i]) for i in kept],
+            "question": question,
+        }
+
+    def _grade_uncertain(self, question, documents, grades, local_only=False):
+        """Fills in the grades left as None with the grader crew, using GRADER_MODE.
+
+        With `local_only` (a degraded mode) they are kept as relevant instead; context packing
+        still bounds how much of them reaches the answer prompt.
+        """
+        grades = list(grades)
+        uncertain = [i for i, grade in enumerate(grades) if grade is None]
+        if uncertain and local_only:
+            logger.debug("---LOCAL GRADING ONLY: KEEPING %d UNCERTAIN DOCUMENTS---", len(uncertain))
+            return ["yes" if grade is None else grade for grade in grades]
+        if uncertain:
+            pending = [documents[i] for i in uncertain]
+            if GRADER_MODE == "batch":
+                verdicts = self._grade_batch(question, pending)
+            elif GRADER_MODE == "concurrent":
+                verdicts = self._grade_concurrent(question, pending)
+            else:
+                verdicts = [self._grade_document(question, doc) for doc in pending]
+            for i, verdict in zip(uncertain, verdicts):
+                grades[i] = verdict
+        return grades
+
+    async def _agrade_uncertain(self, question, documents, grades, local_only=False):
+        """Async version of `_grade_uncertain`."""
+        grades = list(grades)
+        uncertain = [i for i, grade in enumerate(grades) if grade is None]
+        if uncertain and local_only:
+            logger.debug("---LOCAL GRADING ONLY: KEEPING %d UNCERTAIN DOCUMENTS---", len(uncertain))
+            return ["yes" if grade is None else grade for grade in grades]
+        if uncertain:
+            pending = [documents[i] for i in uncertain]
+            if GRADER_MODE == "batch":
+                verdicts = await self._agrade_batch(question, pending)
+            else:
+                # Sequential grading has no benefit on the async path, so it is graded concurrently too
+                verdicts = await self._agrade_concurrent(question, pending)
+            for i, verdict in zip(uncertain, verdicts):
+                grades[i] = verdict
+        return grades
+
+    def _filter_graded(self, documents, grades):
+        """Keeps the documents graded 'yes'."""
+        filtered_docs = []
+        for doc, grade in zip(documents, grades):
             if grade == "yes":
-                print("---GRADE: DOCUMENT RELEVANT---")
+                logger.debug("---GRADE: DOCUMENT RELEVANT---")
                 filtered_docs.append(doc)
             else:
-                print("---GRADE: DOCUMENT NOT RELEVANT---")
+                logger.debug("---GRADE: DOCUMENT NOT RELEVANT---")
+        return filtered_docs
 
-        return {"documents": filtered_docs, "question": question}
+    def _prefilter_documents(self, question, documents):
+        """Grades documents that are clearly (ir)relevant by embedding similarity.
+
+        Returns one entry per document: 'yes', 'no', or None when the LLM grader must decide.
+        """
+        if not GRADER_PREFILTER or not documents:
+            return [None] * len(documents)
+        if all("score" in doc.metadata for doc in documents):
+            # The local index already attached each document's similarity to the question
+            return self._prefilter_grades([doc.metadata["score"] for doc in documents])
+        if self.embeddings is None:
+            return [None] * len(documents)
+        try:
+            query_vector = self.embeddings.embed_query(question)
+            doc_vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        except Exception as e:
+            logger.warning("---PREFILTER SKIPPED: %s---", e)
+            return [None] * len(documents)
+        return self._prefilter_grades(cosine_similarity(query_vector, doc_vectors))
+
+    async def _aprefilter_documents(self, question, documents):
+        """Async version of `_prefilter_documents`."""
+        if not GRADER_PREFILTER or not documents:
+            return [None] * len(documents)
+        if all("score" in doc.metadata for doc in documents):
+            return self._prefilter_grades([doc.metadata["score"] for doc in documents])
+        if self.embeddings is None:
+            return [None] * len(documents)
+        try:
+            query_vector, doc_vectors = await asyncio.gather(
+                self.embeddings.aembed_query(question),
+                self.embeddings.aembed_documents([doc.page_content for doc in documents]),
+            )
+        except Exception as e:
+            logger.warning("---PREFILTER SKIPPED: %s---", e)
+            return [None] * len(documents)
+        return self._prefilter_grades(cosine_similarity(query_vector, doc_vectors))
+
+    def _prefilter_grades(self, similarities):
+        """Maps question/document similarities to 'yes', 'no' or None (uncertain)."""
+        grades = []
+        for similarity in similarities:
+            if similarity >= GRADER_PREFILTER_HIGH:
+                grades.append("yes")
+            elif similarity < GRADER_PREFILTER_LOW:
+                grades.append("no")
+            else:
+                grades.append(None)
+        logger.debug("---PREFILTER: %d OF %d DOCUMENTS NEED THE GRADER---", grades.count(None), len(grades))
+        return grades
+
+    def _grade_document(self, question, doc):
+        """Grades a single document with the grader crew."""
+        score = self.crews["grader"].kickoff(inputs={"document": doc.page_content, "question": question})
+        return _parse_grade(score.raw)
+
+    def _grade_concurrent(self, question, documents):
+        """Grades documents one call each on a bounded worker pool, keeping document order."""
+        # Each worker gets a copy of the caller's context so its LLM usage is traced against this node
+        with ThreadPoolExecutor(max_workers=GRADER_MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._grade_document, question, doc)
+                for doc in documents
+            ]
+            return [future.result() for future in futures]
+
+    async def _agrade_concurrent(self, question, documents):
+        """Async version of `_grade_concurrent`, bounded by a semaphore instead of a pool."""
+        semaphore = asyncio.Semaphore(GRADER_MAX_WORKERS)
+
+        async def grade(doc):
+            async with semaphore:
+                score = await self.crews["grader"].kickoff_async(
+                    inputs={"document": doc.page_content, "question": question}
+                )
+                return _parse_grade(score.raw)
+
+        return await asyncio.gather(*(grade(doc) for doc in documents))
+
+    def _grade_batch(self, question, documents):
+        """Grades all documents in one structured call; returns one verdict per document."""
+        result = self.crews["grader_batch"].kickoff(inputs=_batch_grader_inputs(question, documents))
+        return _batch_verdicts(result, len(documents))
+
+    async def _agrade_batch(self, question, documents):
+        """Async version of `_grade_batch`, micro-batched with other requests' grading when enabled."""
+        if "grader" in self.batchers:
+            return await self.batchers["grader"].submit((question, documents))
+        result = await self.crews["grader_batch"].kickoff_async(inputs=_batch_grader_inputs(question, documents))
+        return _batch_verdicts(result, len(documents))
+
+    async def _grade_pairs(self, calls):
+        """Grades a micro-batch of (question, documents) calls with one grader call; one verdict list per call."""
+        if len(calls) == 1:
+            question, documents = calls[0]
+            result = await self.crews["grader_batch"].kickoff_async(inputs=_batch_grader_inputs(question, documents))
+            return [_batch_verdicts(result, len(documents))]
+        pairs = [(question, doc) for question, documents in calls for doc in documents]
+        result = await self.crews["grader_pairs"].kickoff_async(inputs=_pair_grader_inputs(pairs))
+        verdicts = _batch_verdicts(result, len(pairs))
+        grades, start = [], 0
+        for _, documents in calls:
+            grades.append(verdicts[start:start + len(documents)])
+            start += len(documents)
+        return grades
 
     def decide_to_generate(self, state):
         """Decides whether to generate an answer or create multiple new questions."""
-        print("---ASSESS GRADED DOCUMENTS---")
+        logger.debug("---ASSESS GRADED DOCUMENTS---")
         filtered_documents = state["documents"]
 
+        if not filtered_documents and degraded(state.get("mode"), "no_expansion"):
+            logger.debug("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT, QUERY EXPANSION SKIPPED UNDER LOAD---")
+            return "generate"
         if not filtered_documents:
-            print("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT, TRANSFORM QUERY---")
+            logger.debug("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT, TRANSFORM QUERY---")
             return "multiple_question_generators"
         else:
-            print("---DECISION: GENERATE---")
+            logger.debug("---DECISION: GENERATE---")
             return "generate"
 
     def generate(self, state):
         """Generates an answer based on the question and relevant documents."""
-        print("---GENERATE---")
+        logger.debug("---GENERATE---")
+        question = state["question"]
+        documents = state["documents"]
+        context, context_tokens = self._answer_context(question, documents)
+        generation = self.crews["answer_generator"].kickoff(inputs={"documents": context, "question": question})
+        return {"documents": documents, "question": question, "generation": generation.raw, "verification": None,
+                "context_tokens": context_tokens}
+
+    async def agenerate(self, state, config=None):
+        """Async version of `generate`; streams answer tokens when the run asks for them."""
+        logger.debug("---GENERATE---")
         question = state["question"]
         documents = state["documents"]
-        generation = self.answer_generator_crew.kickoff(inputs={"documents": documents, "question": question})
-        return {"documents": documents, "question": question, "generation": generation}
+        context, context_tokens = self._answer_context(question, documents)
+        if (config or {}).get("configurable", {}).get("stream_tokens"):
+            generation = await self._run_stage("generate", self._astream_answer(question, context))
+        else:
+            response = await self._run_stage(
+                "generate",
+                self.crews["answer_generator"].kickoff_async(inputs={"documents": context, "question": question}),
+            )
+            generation = response.raw
+        return {"documents": documents, "question": question, "generation": generation, "verification": None,
+                "context_tokens": context_tokens}
+
+    def _answer_context(self, question, documents):
+        """The documents text for the answer prompt, packed into the generator model's token budget.
+
+        Returns (text, token count).
+        """
+        model = self.crews["answer_generator"].model
+        if self.packer is not None:
+            documents, tokens = self.packer.pack(question, documents, model)
+            context = documents_text(documents)
+        else:
+            context = documents_text(documents)
+            tokens = token_counter(model)(context)
+        record_context_tokens(model, tokens)
+        return context, tokens
+
+    async def _astream_answer(self, question, context):
+        """Generates the answer with the answer generator agent's prompt and model, streaming tokens.
+
+        Tokens go to the graph's custom stream as {"token": ...}; the full answer is returned.
+        """
+        from litellm import acompletion
+
+        agent = self.crews["answer_generator"].agents[0]
+        task = self.crews["answer_generator"].tasks[0]
+        prompt = task.description.replace("{question}", str(question)).replace("{documents}", context)
+        messages = [
+            {"role": "system", "content": f"You are {agent.role}. {agent.backstory}\nYour goal: {agent.goal}"},
+            {"role": "user", "content": f"{prompt}\n\n{task.expected_output}"},
+        ]
+        model = getattr(agent.llm, "model", agent.llm)
+        writer = get_stream_writer()
+        tokens = []
+        usage = None
+        # With include_usage the last chunk carries the token usage (and no choices)
+        async for chunk in await acompletion(model=model, messages=messages, stream=True,
+                                             stream_options={"include_usage": True}):
+            usage = getattr(chunk, "usage", None) or usage
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                tokens.append(token)
+                writer({"token": token})
+        record_llm_call(model, usage)
+        return "".join(tokens)
 
     def multiple_question_generators(self, state):
         """Generates multiple questions for improved document retrieval."""
-        print("---GENERATE MULTIPLE QUESTIONS---")
+        logger.debug("---GENERATE MULTIPLE QUESTIONS---")
         question = state["question"]
-        response = self.question_generators_crew.kickoff(inputs={"question": question})
-        return {"questions": response, "original_question": question}
+        response = self.crews["question_generators"].kickoff(inputs={"question": question})
+        return {"questions": _parse_questions(response.raw), "original_question": question}
+
+    async def amultiple_question_generators(self, state):
+        """Async version of `multiple_question_generators`."""
+        logger.debug("---GENERATE MULTIPLE QUESTIONS---")
+        question = state["question"]
+        response = await self._run_stage(
+            "multiple_question_generators",
+            self.crews["question_generators"].kickoff_async(inputs={"question": question}),
+        )
+        return {"questions": _parse_questions(response.raw), "original_question": question}
 
     def reciprocal_rank_fusion(self, state):
         """Performs reciprocal rank fusion on retrieved documents for reranking."""
-        print("---FUSION---")
+        logger.debug("---FUSION---")
         fusion_documents = state["documents"]
         original_question = state["original_question"]
-        documents = []
-        fused_scores = {}
-
-        for docs in fusion_documents:
-            for rank, doc in enumerate(docs, start=1):
-                if doc.page_content not in fused_scores:
-                    fused_scores[doc.page_content] = 0
-                    documents.append(doc)
-                fused_scores[doc.page_content] += 1 / (rank + k)
 
-        reranked_results = {doc: score for doc, score in sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)[:3]}
-        print("\nTop 3 search scores ========================================")
-        for i, (doc, score) in enumerate(reranked_results.items(), start=1):
-            print(f"\nDocument {i}: {doc} - Score: {score}")
-        print("\n===========================================================\n")
+        documents, scores = reciprocal_rank_fusion(fusion_documents)
+        logger.debug("---FUSED %d DOCUMENTS, SCORES: %s---", len(documents), scores)
+        return {"documents": documents, "fused_scores": scores, "question": original_question}
 
-        filtered_documents = [doc for doc in documents if doc.page_content in reranked_results]
-        return {"documents": filtered_documents, "question": original_question}
+    async def areciprocal_rank_fusion(self, state):
+        """Async version of `reciprocal_rank_fusion`; fusion is CPU-only so it runs inline."""
+        return self.reciprocal_rank_fusion(state)
 
     def hallucination_grader(self, state):
-        """Checks for hallucination in the generated response."""
-        print("---CHECK HALLUCINATION---")
-        question = state["question"]
-        generation = state["generation"]
-        response = self.hallucination_crew.kickoff(inputs={"question": question, "generation": generation})
-        return {"question": question, "multiple_questions": response}
+        """Verifies the generated response: groundedness, answer quality and a revised answer in one pass."""
+        logger.debug("---CHECK HALLUCINATION---")
+        return {"verification": self._verify(state)}
+
+    async def ahallucination_grader(self, state):
+        """Async version of `hallucination_grader`."""
+        logger.debug("---CHECK HALLUCINATION---")
+        return {"verification": await self._averify(state)}
 
     def decide_after_hallucination_grader(self, state):
         """Decides the next step after checking for hallucination."""
-        print("---ASSESS HALLUCINATION GRADER---")
-        question = state["question"]
-        generation = state["generation"]
-        score = self.hallucination_crew.invoke(inputs={"documents": state["documents"], "question": question, "generation": generation})
-        grade = score["score"]
+        logger.debug("---ASSESS HALLUCINATION GRADER---")
+        verification = state.get("verification") or self._verify(state)
 
-        if grade == "yes":
-            print("---DECISION: GENERATION IS GROUNDED---")
+        if verification["grounded"] == "yes":
+            logger.debug("---DECISION: GENERATION IS GROUNDED---")
             return "generate"
         else:
-            print("---DECISION: GENERATION IS NOT GROUNDED, RETRY---")
-            return "Sorry, I am not able to answer this question. Please contact customer service."
+            logger.debug("---DECISION: GENERATION IS NOT GROUNDED, RETRY---")
+            return FALLBACK_ANSWER
 
     def final_grader(self, state):
         """Evaluates the final generated response to ensure it is grounded and accurate."""
-        print("---CHECK FINAL GENERATION---")
-        question = state["question"]
-        generation = state["generation"]
-        score = self.hallucination_crew.invoke(inputs={"documents": state["documents"], "question": question, "generation": generation})
-        grade = score["score"]
-
-        if grade == "yes":
-            print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-            return self.support_answer_quality_assurance.invoke(inputs={"question": question, "generation": generation})
+        logger.debug("---CHECK FINAL GENERATION---")
+        verification = state.get("verification") or self._verify(state)
+        return self._final_answer(verification)
+
+    async def afinal_grader(self, state):
+        """Async version of `final_grader`."""
+        logger.debug("---CHECK FINAL GENERATION---")
+        verification = state.get("verification") or await self._averify(state)
+        return self._final_answer(verification)
+
+    def _verify(self, state):
+        """Runs the local grounding pre-check, then the single verification call if it is inconclusive."""
+        verification = self._local_verification(state)
+        if verification is None and degraded(state.get("mode"), "no_review"):
+            verification = _unreviewed(state)
+        if verification is None:
+            result = self.crews["verification"].kickoff(inputs=self._verification_inputs(state))
+            verification = _verification_result(result, state["generation"])
+        return verification
+
+    async def _averify(self, state):
+        """Async version of `_verify`."""
+        verification = self._local_verification(state)
+        if verification is None and degraded(state.get("mode"), "no_review"):
+            verification = _unreviewed(state)
+        if verification is None:
+            result = await self._run_stage(
+                "verification", self.crews["verification"].kickoff_async(inputs=self._verification_inputs(state))
+            )
+            verification = _verification_result(result, state["generation"])
+        return verification
+
+    def _local_verification(self, state):
+        """Accepts answers whose n-grams and numbers are clearly found in the documents, without an LLM."""
+        if is_clearly_grounded(state["generation"], state.get("documents")):
+            logger.debug("---LOCAL CHECK: GENERATION IS CLEARLY GROUNDED---")
+            return {"grounded": "yes", "answer_quality": "yes", "revised_answer": state["generation"], "source": "local"}
+        return None
+
+    def _verification_inputs(self, state):
+        return {
+            "question": state["question"],
+            "generation": state["generation"],
+            "documents": documents_text(state.get("documents")),
+        }
+
+    def _final_answer(self, verification):
+        if verification["grounded"] == "yes":
+            logger.debug("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+            return {"generation": verification["revised_answer"], "verification": verification}
         else:
-            print("---DECISION: NOT GROUNDED, RETRY---")
-            return "Sorry, I am not able to answer this question. Please contact customer service."
+            logger.debug("---DECISION: NOT GROUNDED, RETRY---")
+            return {"generation": FALLBACK_ANSWER, "verification": verification}
+
+
+def _unreviewed(state):
+    """Verification of an answer the local check could not confirm, when the review is skipped under load.
+
+    The answer is passed through unrevised: the local check only confirms near-verbatim answers, so
+    treating the rest as ungrounded would refuse most paraphrased answers whenever load is high.
+    Degraded-mode answers are not cached, so an unreviewed answer does not outlive the load spike.
+    """
+    logger.debug("---ANSWER REVIEW SKIPPED UNDER LOAD---")
+    return {"grounded": "yes", "answer_quality": "yes", "revised_answer": state["generation"], "source": "skipped"}
+
+
+def _parse_grade(text):
+    """Normalizes a grader response to 'yes' or 'no'."""
+    return "yes" if str(text).strip().strip("'\"").lower().startswith("yes") else "no"
+
+
+def _parse_questions(text):
+    """Splits the question generator output into one question per line, without numbering."""
+    questions = [re.sub(r"^\s*(?:[-*\u2022]|\d+[.)])\s*", "", line).strip() for line in str(text).splitlines()]
+    return [q for q in questions if q]
+
+
+def _verification_result(result, generation):
+    """Reads the verification crew's structured output, falling back to the raw text."""
+    if result.pydantic is not None:
+        grounded = _parse_grade(result.pydantic.grounded)
+        answer_quality = _parse_grade(result.pydantic.answer_quality)
+        revised_answer = result.pydantic.revised_answer.strip() or generation
+    else:
+        verdicts = re.findall(r"\b(yes|no)\b", result.raw, re.IGNORECASE)
+        grounded = _parse_grade(verdicts[0]) if verdicts else "no"
+        answer_quality = _parse_grade(verdicts[1]) if len(verdicts) > 1 else grounded
+        revised_answer = generation
+    return {"grounded": grounded, "answer_quality": answer_quality, "revised_answer": revised_answer, "source": "llm"}
+
+
+def _batch_grader_inputs(question, documents):
+    """Crew inputs for the batch grader: the documents as one numbered list."""
+    return {"documents": _numbered(doc.page_content for doc in documents), "question": question}
+
+
+def _numbered(items):
+    """Items as one numbered list, the format the batch tasks expect."""
+    return "\n\n".join(f"[{i}] {item}" for i, item in enumerate(items))
+
+
+def _pair_grader_inputs(pairs):
+    """Crew inputs for the pair grader: (question, document) pairs as one numbered list."""
+    return {"pairs": _numbered(f"Question: {question}\nDocument: {doc.page_content}" for question, doc in pairs)}
+
 
+def _batch_verdicts(result, count):
+    """Reads one verdict per document from a batch grader result."""
+    if result.pydantic is not None:
+        verdicts = [_parse_grade(v) for v in result.pydantic.verdicts]
+    else:
+        verdicts = [_parse_grade(v) for v in re.findall(r"\b(yes|no)\b", result.raw, re.IGNORECASE)]
+    if len(verdicts) != count:
+        logger.warning("---BATCH GRADER RETURNED %d VERDICTS FOR %d DOCUMENTS---", len(verdicts), count)
+    # The grader is told not to be stringent, so documents without a verdict are kept
+    return (verdicts + ["yes"] * count)[:count]
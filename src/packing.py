@@ -0,0 +1,138 @@
+import functools
+import json
+import logging
+import os
+import re
+import zlib
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from .bm25 import tokenize
+from .rerank import STOPWORDS
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_PACKING = os.getenv('CONTEXT_PACKING', 'true').lower() == 'true'
+# Prompt tokens given to the retrieved documents; per-model overrides as JSON: {"gpt-4o-mini": 6000}
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+CONTEXT_TOKEN_BUDGETS = json.loads(os.getenv('CONTEXT_TOKEN_BUDGETS', '{}'))
+# Chunks longer than this are trimmed to their sentences most relevant to the question
+CONTEXT_CHUNK_MAX_TOKENS = int(os.getenv('CONTEXT_CHUNK_MAX_TOKENS', '400'))
+# Chunks whose estimated shingle Jaccard similarity to a better-ranked chunk reaches this are dropped
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv('CONTEXT_DEDUP_THRESHOLD', '0.8'))
+# A chunk that does not fit is trimmed into the remaining budget only if at least this much is left
+CONTEXT_MIN_FILL_TOKENS = int(os.getenv('CONTEXT_MIN_FILL_TOKENS', '32'))
+# tiktoken encoding for models tiktoken does not know
+CONTEXT_TOKENIZER = os.getenv('CONTEXT_TOKENIZER', 'cl100k_base')
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+APPROX_TOKEN_PATTERN = re.compile(r"[A-Za-z]{1,8}|\d{1,3}|[^\w\s]|\w")
+
+MINHASH_PRIME = (1 << 31) - 1
+MINHASH_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+_rng = np.random.default_rng(20240611)
+_MINHASH_A = _rng.integers(1, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_B = _rng.integers(0, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+@functools.lru_cache(maxsize=None)
+def token_counter(model=None):
+    """Token-counting function for a model: tiktoken when its encoding is available, else a regex estimate."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(str(model).split("/")[-1])
+        except KeyError:
+            encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:  # not installed, or the encoding cannot be downloaded
+        logger.info("---TIKTOKEN UNAVAILABLE (%s), ESTIMATING TOKENS---", e)
+        return lambda text: len(APPROX_TOKEN_PATTERN.findall(text))
+
+
+def context_budget(model=None):
+    """Token budget for the documents in the prompt of `model`."""
+    return int(CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET))
+
+
+def minhash_signature(text):
+    """MinHash signature of the word 3-shingles of a text."""
+    tokens = tokenize(text)
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) % MINHASH_PRIME for s in shingles], dtype=np.uint64)
+    return ((_MINHASH_A[:, None] * hashes[None, :] + _MINHASH_B[:, None]) % MINHASH_PRIME).min(axis=1)
+
+
+class ContextPacker:
+    """Packs ranked documents into the answer prompt's token budget.
+
+    Near-duplicate chunks are dropped (keeping the better-ranked copy), chunks longer than
+    `chunk_max_tokens` are cut down to the sentences sharing most words with the question, and
+    chunks are then added in rank order until the budget is spent. Documents must be passed best
+    first, as the reranker, fusion and retrievers return them.
+    """
+
+    def __init__(self, chunk_max_tokens=CONTEXT_CHUNK_MAX_TOKENS, dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+                 min_fill_tokens=CONTEXT_MIN_FILL_TOKENS):
+        self.chunk_max_tokens = chunk_max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.min_fill_tokens = min_fill_tokens
+
+    def pack(self, question, documents, model=None, budget=None):
+        """Returns (packed documents, their token count) for `model`'s budget."""
+        count_tokens = token_counter(model)
+        budget = context_budget(model) if budget is None else budget
+        terms = {t for t in tokenize(question) if t not in STOPWORDS}
+
+        packed, used = [], 0
+        for doc in self.deduplicate(documents):
+            remaining = budget - used
+            if remaining < self.min_fill_tokens:
+                break
+            text, tokens = self.trim(doc.page_content, terms, min(self.chunk_max_tokens, remaining), count_tokens)
+            if not text:
+                continue
+            packed.append(Document(page_content=text, metadata=doc.metadata))
+            used += tokens
+        logger.debug("---PACKED %d OF %d DOCUMENTS INTO %d/%d TOKENS---", len(packed), len(documents), used, budget)
+        return packed, used
+
+    def deduplicate(self, documents):
+        """Drops documents that are near-duplicates of an earlier one."""
+        kept, signatures = [], []
+        for doc in documents:
+            if not doc.page_content.strip():
+                continue
+            signature = minhash_signature(doc.page_content)
+            if any(np.mean(signature == other) >= self.dedup_threshold for other in signatures):
+                logger.debug("---DROPPED NEAR-DUPLICATE CHUNK---")
+                continue
+            kept.append(doc)
+            signatures.append(signature)
+        return kept
+
+    def trim(self, text, terms, max_tokens, count_tokens):
+        """Cuts text to at most `max_tokens`, keeping its most question-relevant sentences in order."""
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            return text, tokens
+        sentences = [s.strip() for s in SENTENCE_PATTERN.split(text) if s.strip()]
+        sizes = [count_tokens(s) for s in sentences]
+        # Most overlapping sentences first; earlier sentences win ties
+        order = sorted(range(len(sentences)),
+                       key=lambda i: (-len(terms & set(tokenize(sentences[i]))), i))
+        chosen, used = [], 0
+        for i in order:
+            if used + sizes[i] <= max_tokens:
+                chosen.append(i)
+                used += sizes[i]
+        if not chosen:
+            # Not even one sentence fits: keep the start of the most relevant one
+            best = sentences[order[0]]
+            cut = best[:max(1, len(best) * max_tokens // sizes[order[0]])]
+            return cut, count_tokens(cut)
+        return " ".join(sentences[i] for i in sorted(chosen)), used
@@ -0,0 +1,113 @@
+import os
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from .bm25 import tokenize
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# 'lexical', 'onnx' or 'none' (LLM grading only)
+RERANKER = os.getenv('RERANKER', 'lexical')
+# Directory holding model.onnx and tokenizer.json of a cross-encoder for RERANKER=onnx
+RERANKER_MODEL_DIR = os.getenv('RERANKER_MODEL_DIR', 'models/cross-encoder')
+RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', '32'))
+# Documents scoring at or above RERANK_KEEP are kept, below RERANK_DROP dropped; the band in
+# between goes to the grader crew. Use `calibrate_thresholds` to pick them for a scorer.
+RERANK_KEEP = float(os.getenv('RERANK_KEEP', '0.6'))
+RERANK_DROP = float(os.getenv('RERANK_DROP', '0.1'))
+
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from has have how i in is it its me my of on or our
+    that the their there this to was we what when where which who why will with you your
+""".split())
+
+
+class LexicalOverlapScorer:
+    """Baseline scorer: the share of the question's content words that appear in the chunk."""
+
+    def score(self, question, texts):
+        terms = {t for t in tokenize(question) if t not in STOPWORDS} or set(tokenize(question))
+        if not terms:
+            return np.zeros(len(texts), dtype=np.float32)
+        return np.array([len(terms & set(tokenize(text))) / len(terms) for text in texts], dtype=np.float32)
+
+
+class OnnxCrossEncoderScorer:
+    """Cross-encoder relevance scorer run with onnxruntime on CPU, in batches of (question, chunk) pairs.
+
+    Expects `model.onnx` and a HuggingFace `tokenizer.json` in `model_dir`; scores are sigmoid(logit).
+    """
+
+    def __init__(self, model_dir=RERANKER_MODEL_DIR, batch_size=RERANK_BATCH_SIZE, max_length=512):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        self.session = onnxruntime.InferenceSession(str(model_dir / "model.onnx"), providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def score(self, question, texts):
+        scores = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch([(question, text) for text in texts[start:start + self.batch_size]])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+            scores.append(1.0 / (1.0 + np.exp(-np.asarray(logits, dtype=np.float32).reshape(len(encodings), -1)[:, 0])))
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+class Reranker:
+    """Scores (question, chunk) pairs locally and sorts chunks into keep / drop / uncertain."""
+
+    def __init__(self, scorer, keep=RERANK_KEEP, drop=RERANK_DROP):
+        self.scorer = scorer
+        self.keep = keep
+        self.drop = drop
+
+    @classmethod
+    def from_env(cls):
+        """Builds the reranker selected by RERANKER, or returns None when it is 'none'."""
+        if RERANKER == "onnx":
+            return cls(OnnxCrossEncoderScorer())
+        if RERANKER == "lexical":
+            return cls(LexicalOverlapScorer())
+        return None
+
+    def grade(self, question, texts):
+        """Returns (scores, grades) with one grade per text: 'yes', 'no' or None (uncertain)."""
+        scores = self.scorer.score(question, texts)
+        grades = ["yes" if s >= self.keep else "no" if s < self.drop else None for s in scores]
+        return scores, grades
+
+
+def calibrate_thresholds(scores, labels, precision=0.95):
+    """Picks (drop, keep) thresholds from scored examples with 0/1 relevance labels.
+
+    `keep` is the lowest score above which at least `precision` of documents are relevant, and
+    `drop` the highest score below which at least `precision` of documents are irrelevant.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.float32)
+    order = np.argsort(-scores)
+    ranked_scores, ranked_labels = scores[order], labels[order]
+
+    # Precision of keeping everything at or above each score, best score first
+    keep_precision = np.cumsum(ranked_labels) / np.arange(1, len(labels) + 1)
+    keep_ok = np.flatnonzero(keep_precision >= precision)
+    keep = float(ranked_scores[keep_ok[-1]]) if len(keep_ok) else float("inf")
+
+    # Share of irrelevant documents among everything at or below each score, worst score first
+    drop_precision = np.cumsum(1 - ranked_labels[::-1]) / np.arange(1, len(labels) + 1)
+    drop_ok = np.flatnonzero(drop_precision >= precision)
+    # Drop is a strict lower bound, so it sits just above the last safely dropped score
+    drop = float(np.nextafter(ranked_scores[::-1][drop_ok[-1]], np.float32(np.inf))) if len(drop_ok) else float("-inf")
+    return min(drop, keep), keep
@@ -0,0 +1,508 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from .embeddings import get_embeddings
+from .bm25 import BM25Index, save_npz
+from .fusion import reciprocal_rank_fusion
+from .cypher import NO_CYPHER_ANSWER, CypherExecutor, clean_cypher
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'index')
+# Storage precision of the embedding matrix: float16 halves memory and disk at a small recall cost
+VECTOR_INDEX_DTYPE = os.getenv('VECTOR_INDEX_DTYPE', 'float32')
+RETRIEVER_K = int(os.getenv('RETRIEVER_K', '4'))
+# From this many chunks searches go through an IVF index instead of a full scan. At 1536 dims a
+# full scan takes ~3ms at 10k chunks and ~30ms at 50k, while an IVF search stays at 1-2.5ms
+IVF_MIN_SIZE = int(os.getenv('IVF_MIN_SIZE', '10000'))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+# Fuse BM25 keyword results with dense results before grading
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'true').lower() == 'true'
+# Candidates taken from each of the dense and sparse searches before fusion
+HYBRID_FETCH_K = int(os.getenv('HYBRID_FETCH_K', '20'))
+# Rows scored per block in a full scan, bounding the float32 copy of a float16 matrix
+SCAN_BLOCK_SIZE = 65536
+# Ids or rows per SQL IN (...) query, under SQLite's bound-parameter limit
+SQL_BATCH_SIZE = 500
+
+
+class LocalIndex:
+    """Embedding index stored on disk in `path`.
+
+    Files:
+        embeddings.npy: memory-mapped matrix of unit-normalized embeddings, one row per chunk
+        chunks.sqlite: the id, page_content, metadata and tombstone flag of each row
+        ivf.npz: optional IVF centroids and row assignments
+
+    Chunk texts stay on disk and a checkpoint only writes what changed. Nothing is durable until
+    `save`, which commits the chunk table in one transaction and replaces ivf.npz atomically, so an
+    interrupted run reopens as of its last save. Deleted rows are tombstoned until `compact`
+    rewrites the files. Small indexes are searched with a brute-force scan; once the index holds
+    IVF_MIN_SIZE chunks `build_ivf` clusters the rows so a search only scores the IVF_NPROBE
+    nearest clusters.
+    """
+
+    def __init__(self, path, embeddings, dtype=VECTOR_INDEX_DTYPE):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.embeddings = embeddings
+        self.dtype = np.dtype(dtype)
+        self.count = 0  # rows written, including tombstoned ones
+        self._vectors = None
+        self._deleted = np.zeros(0, dtype=bool)
+        self._centroids = None
+        self._assignments = None
+        self._lists = None
+        # Searches read chunk texts from worker threads while ingestion writes
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path / "chunks.sqlite", check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL, "
+            "page_content TEXT NOT NULL, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS chunks_live_id ON chunks (id) WHERE deleted = 0")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.commit()
+        self._load()
+
+    def __len__(self):
+        return self.count - int(self._deleted[:self.count].sum())
+
+    def add(self, ids, texts, vectors, metadatas=None):
+        """Adds (or replaces) chunks with precomputed embeddings."""
+        vectors = _unit_rows(vectors)
+        metadatas = metadatas or [{} for _ in ids]
+        self.delete(ids)
+        start = self.count
+        self._reserve(start + len(ids), vectors.shape[1])
+        self._vectors[start:start + len(ids)] = vectors.astype(self.dtype)
+        with self._lock:
+            self.connection.executemany(
+                "INSERT INTO chunks (row, id, page_content, metadata) VALUES (?, ?, ?, ?)",
+                [(start + offset, doc_id, text, json.dumps(metadata))
+                 for offset, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas))],
+            )
+        self.count += len(ids)
+        if self._centroids is not None:
+            self._assign(np.arange(start, start + len(ids)))
+        elif self.count >= IVF_MIN_SIZE:
+            self.build_ivf()
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        """Embeds and adds texts in one batched embedding call."""
+        ids = ids or [f"{self.count + i}" for i in range(len(texts))]
+        self.add(ids, texts, self.embeddings.embed_documents(list(texts)), metadatas)
+        return ids
+
+    def delete(self, ids):
+        """Tombstones chunks by id."""
+        rows = list(self._live_rows(ids).values())
+        if not rows:
+            return
+        with self._lock:
+            self.connection.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+        self._deleted[rows] = True
+
+    def search(self, vector, k=RETRIEVER_K):
+        """Returns [(row, score)] for the k nearest chunks by cosine similarity."""
+        if len(self) == 0:
+            return []
+        query = _unit_rows(vector)[0]
+        if self._centroids is None:
+            rows = None
+            scores = np.empty(self.count, dtype=np.float32)
+            for start in range(0, self.count, SCAN_BLOCK_SIZE):
+                block = self._vectors[start:start + SCAN_BLOCK_SIZE][:self.count - start]
+                scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+            scores[self._deleted[:self.count]] = -np.inf
+        else:
+            probes = np.argsort(self._centroids @ query)[::-1][:IVF_NPROBE]
+            rows = np.concatenate([self._lists[p] for p in probes])
+            rows = rows[~self._deleted[rows]]
+            scores = self._vectors[rows].astype(np.float32, copy=False) @ query
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = [(int(rows[i]) if rows is not None else int(i), float(scores[i])) for i in top]
+        return [(row, score) for row, score in hits if score > -np.inf]
+
+    def similarity_search_by_vector(self, embedding, k=RETRIEVER_K, **kwargs):
+        """Documents for the k nearest chunks, with their similarity in metadata['score']."""
+        return self._documents(self.search(embedding, k))
+
+    async def asimilarity_search_by_vector(self, embedding, k=RETRIEVER_K, **kwargs):
+        return await asyncio.to_thread(self.similarity_search_by_vector, embedding, k)
+
+    def get_documents(self, ids, vector=None):
+        """Documents for the live chunks among `ids`; with a query `vector`, their similarity goes in metadata['score']."""
+        live = self._live_rows(ids)
+        rows = [live[doc_id] for doc_id in ids if doc_id in live]
+        if vector is None or not rows:
+            return self._documents([(row, None) for row in rows])
+        scores = self._vectors[rows].astype(np.float32, copy=False) @ _unit_rows(vector)[0]
+        return self._documents([(row, float(score)) for row, score in zip(rows, scores)])
+
+    def chunks(self):
+        """[(id, page_content)] of the live chunks, in row order."""
+        with self._lock:
+            return self.connection.execute("SELECT id, page_content FROM chunks WHERE deleted = 0 ORDER BY row").fetchall()
+
+    def build_ivf(self, nlist=None, iterations=10, sample_size=256 * 1024):
+        """Clusters the rows with k-means (on a sample) and builds the inverted lists."""
+        live = np.flatnonzero(~self._deleted[:self.count])
+        if len(live) == 0:
+            return
+        nlist = nlist or max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(live, min(len(live), sample_size), replace=False))].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _unit_rows(centroids)
+        self._centroids = centroids
+        self._assignments = np.full(self.count, -1, dtype=np.int32)
+        self._lists = [np.zeros(0, dtype=np.int64) for _ in range(len(centroids))]
+        self._assign(live)
+
+    def compact(self):
+        """Drops tombstoned rows from the matrix and the chunk table, then saves.
+
+        The compacted matrix is written beside the live one and swapped in once the renumbered
+        chunk table is committed; an open that finds the swap unfinished completes it.
+        """
+        if self._vectors is None:
+            return
+        self.save()
+        live = np.flatnonzero(~self._deleted[:self.count])
+        nlist = len(self._centroids) if self._centroids is not None else None
+        # The IVF assignments refer to the old row numbers
+        self._centroids = self._assignments = self._lists = None
+        (self.path / "ivf.npz").unlink(missing_ok=True)
+        compacted = np.lib.format.open_memmap(self.path / "embeddings.npy.compact", mode="w+", dtype=self.dtype,
+                                              shape=(max(len(live), 1), self._vectors.shape[1]))
+        for start in range(0, len(live), SCAN_BLOCK_SIZE):
+            compacted[start:start + SCAN_BLOCK_SIZE] = self._vectors[live[start:start + SCAN_BLOCK_SIZE]]
+        compacted.flush()
+        del compacted
+        with self._lock:
+            self.connection.execute("DELETE FROM chunks WHERE deleted = 1")
+            # Renumbered through negative rows so no two rows share a number mid-update
+            self.connection.execute(
+                "UPDATE chunks SET row = -1 - renumbered.row FROM "
+                "(SELECT row AS old, ROW_NUMBER() OVER (ORDER BY row) - 1 AS row FROM chunks) AS renumbered "
+                "WHERE chunks.row = renumbered.old"
+            )
+            self.connection.execute("UPDATE chunks SET row = -1 - row")
+            self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('compacting', '1')")
+            self.connection.commit()
+        self._vectors = None
+        self._finish_compaction()
+        self.count = len(live)
+        self._vectors = np.load(self.path / "embeddings.npy", mmap_mode="r+")
+        self._deleted = np.zeros(self._vectors.shape[0], dtype=bool)
+        if nlist:
+            self.build_ivf(nlist=nlist)
+        self.save()
+
+    def save(self):
+        """Makes every change since the last save durable: matrix rows, then chunk table, then IVF state."""
+        if self._vectors is not None:
+            self._vectors.flush()
+        with self._lock:
+            self.connection.commit()
+        if self._centroids is not None:
+            save_npz(self.path / "ivf.npz", centroids=self._centroids, assignments=self._assignments[:self.count])
+        elif (self.path / "ivf.npz").exists():
+            (self.path / "ivf.npz").unlink()
+
+    def close(self):
+        self.connection.close()
+
+    def _live_rows(self, ids):
+        """{id: row} of the live chunks among `ids`."""
+        ids = list(dict.fromkeys(ids))
+        rows = {}
+        with self._lock:
+            for start in range(0, len(ids), SQL_BATCH_SIZE):
+                batch = ids[start:start + SQL_BATCH_SIZE]
+                rows.update(self.connection.execute(
+                    f"SELECT id, row FROM chunks WHERE deleted = 0 AND id IN ({', '.join('?' * len(batch))})", batch
+                ))
+        return rows
+
+    def _documents(self, hits):
+        """Documents for [(row, score or None)], in order."""
+        rows = [row for row, _ in hits]
+        records = {}
+        with self._lock:
+            for start in range(0, len(rows), SQL_BATCH_SIZE):
+                batch = rows[start:start + SQL_BATCH_SIZE]
+                for row, doc_id, text, metadata in self.connection.execute(
+                    f"SELECT row, id, page_content, metadata FROM chunks WHERE row IN ({', '.join('?' * len(batch))})", batch
+                ):
+                    records[row] = (doc_id, text, metadata)
+        documents = []
+        for row, score in hits:
+            doc_id, text, metadata = records[row]
+            metadata = {**json.loads(metadata), "id": doc_id}
+            if score is not None:
+                metadata["score"] = score
+            documents.append(Document(page_content=text, metadata=metadata))
+        return documents
+
+    def _reserve(self, size, dim, exact=False):
+        """Grows the memory-mapped matrix (doubling) so it can hold `size` rows of `dim` floats."""
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if size <= capacity and self._vectors is not None:
+            return
+        new_capacity = max(size, 1) if exact else max(size, capacity * 2, 1024)
+        tmp_path = self.path / "embeddings.npy.tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(new_capacity, dim))
+        if self._vectors is not None:
+            grown[:self.count] = self._vectors[:self.count]
+            del self._vectors
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self.path / "embeddings.npy")
+        self._vectors = np.load(self.path / "embeddings.npy", mmap_mode="r+")
+        self._deleted = np.concatenate([self._deleted, np.zeros(new_capacity - len(self._deleted), dtype=bool)])
+        if self._assignments is not None:
+            self._assignments = np.concatenate([self._assignments, np.full(new_capacity - len(self._assignments), -1, dtype=np.int32)])
+
+    def _assign(self, rows):
+        """Assigns rows to their nearest IVF centroid and appends them to the inverted lists."""
+        if len(rows) == 0:
+            return
+        if len(self._assignments) < self.count:
+            self._assignments = np.concatenate([self._assignments, np.full(self.count - len(self._assignments), -1, dtype=np.int32)])
+        labels = np.argmax(self._vectors[rows].astype(np.float32) @ self._centroids.T, axis=1)
+        self._assignments[rows] = labels
+        for c in np.unique(labels):
+            self._lists[c] = np.concatenate([self._lists[c], rows[labels == c]])
+
+    def _finish_compaction(self):
+        """Swaps in the compacted matrix once its chunk table is committed, or drops an uncommitted one."""
+        compacted = self.path / "embeddings.npy.compact"
+        if self.connection.execute("SELECT 1 FROM state WHERE key = 'compacting'").fetchone():
+            if compacted.exists():
+                os.replace(compacted, self.path / "embeddings.npy")
+            self.connection.execute("DELETE FROM state WHERE key = 'compacting'")
+            self.connection.commit()
+        elif compacted.exists():
+            compacted.unlink()
+
+    def _load(self):
+        self._finish_compaction()
+        matrix_path = self.path / "embeddings.npy"
+        if not matrix_path.exists():
+            return
+        self._vectors = np.load(matrix_path, mmap_mode="r+")
+        self.dtype = self._vectors.dtype
+        # Rows past the last saved chunk belong to an interrupted run and are overwritten
+        self.count = self.connection.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+        self._deleted = np.zeros(self._vectors.shape[0], dtype=bool)
+        self._deleted[[row for row, in self.connection.execute("SELECT row FROM chunks WHERE deleted = 1")]] = True
+        ivf_path = self.path / "ivf.npz"
+        if ivf_path.exists():
+            with np.load(ivf_path) as ivf:
+                self._centroids = ivf["centroids"]
+                assignments = ivf["assignments"][:self.count]
+            self._assignments = np.full(self._vectors.shape[0], -1, dtype=np.int32)
+            self._assignments[:len(assignments)] = assignments
+            self._lists = [np.flatnonzero(assignments == c) for c in range(len(self._centroids))]
+            unassigned = np.arange(len(assignments), self.count)
+            self._assign(unassigned)
+
+
+class LocalIndexRetriever(BaseRetriever):
+    """LangChain retriever over a `LocalIndex`.
+
+    Exposes the index as `vectorstore` so callers can batch query embeddings, then retrieve for
+    each query with `search_by_vector`.
+    """
+
+    vectorstore: Any
+    search_kwargs: dict = {"k": RETRIEVER_K}
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.search_by_vector(query, self.vectorstore.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return await self.asearch_by_vector(query, await self.vectorstore.embeddings.aembed_query(query))
+
+    def search_by_vector(self, query, vector):
+        """Documents for a query whose embedding has already been computed."""
+        return self.vectorstore.similarity_search_by_vector(vector, **self.search_kwargs)
+
+    async def asearch_by_vector(self, query, vector):
+        """Async version of `search_by_vector`."""
+        return await self.vectorstore.asimilarity_search_by_vector(vector, **self.search_kwargs)
+
+
+class HybridRetriever(LocalIndexRetriever):
+    """Retriever that fuses BM25 keyword results with dense results.
+
+    The BM25 search runs while the query embedding is being computed; both candidate lists are
+    then merged with reciprocal rank fusion. Keyword-only hits get their dense similarity from the
+    stored embeddings, so every result carries metadata['score'].
+    """
+
+    bm25: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            vector_future = executor.submit(self.vectorstore.embeddings.embed_query, query)
+            sparse = self.bm25.search(query, HYBRID_FETCH_K)
+            vector = vector_future.result()
+        dense = self.vectorstore.similarity_search_by_vector(vector, HYBRID_FETCH_K)
+        return self._fuse(dense, sparse, vector)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        vector_task = asyncio.ensure_future(self.vectorstore.embeddings.aembed_query(query))
+        sparse = self.bm25.search(query, HYBRID_FETCH_K)
+        vector = await vector_task
+        dense = await self.vectorstore.asimilarity_search_by_vector(vector, HYBRID_FETCH_K)
+        return self._fuse(dense, sparse, vector)
+
+    def search_by_vector(self, query, vector):
+        """Fused BM25 and dense results for a query whose embedding has already been computed."""
+        sparse = self.bm25.search(query, HYBRID_FETCH_K)
+        return self._fuse(self.vectorstore.similarity_search_by_vector(vector, HYBRID_FETCH_K), sparse, vector)
+
+    async def asearch_by_vector(self, query, vector):
+        """Async version of `search_by_vector`."""
+        sparse = self.bm25.search(query, HYBRID_FETCH_K)
+        dense = await self.vectorstore.asimilarity_search_by_vector(vector, HYBRID_FETCH_K)
+        return self._fuse(dense, sparse, vector)
+
+    def _fuse(self, dense, sparse, vector):
+        sparse_docs = self.vectorstore.get_documents([doc_id for doc_id, _ in sparse], vector)
+        documents, _ = reciprocal_rank_fusion(
+            [dense, sparse_docs], top_n=self.search_kwargs.get("k", RETRIEVER_K), weights=[1.0, 1.0]
+        )
+        return documents
+
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    """Splits text into overlapping character windows, preferring to break on whitespace."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            space = text.rfind(" ", start + chunk_size // 2, end)
+            end = space if space > 0 else end
+        chunks.append(text[start:end].strip())
+        if end == len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+def build_index_from_directory(source_dir, index_dir=VECTOR_INDEX_DIR, embeddings=None, chunk_size=1000,
+                               overlap=200, batch_size=256, patterns=("*.txt", "*.md")):
+    """Bulk-loads every matching file under `source_dir` into the index at `index_dir`.
+
+    Embeds in this process with `embeddings`; see `src.ingest` for parallel, incremental ingestion.
+    Chunk ids are '<relative path>:<chunk number>'.
+    """
+    from .ingest import ingest, load_directory
+
+    stats = ingest(load_directory(source_dir, patterns), index_dir, embeddings, chunk_size=chunk_size,
+                   overlap=overlap, batch_size=batch_size, workers=0)
+    logger.info("---INDEXED %d CHUNKS FROM %s---", stats["index_chunks"], source_dir)
+    return LocalIndex(index_dir, embeddings or get_embeddings())
+
+
+_cypher_executor = None
+
+
+def get_cypher_executor():
+    """Shared executor over one pooled graph-DB driver, created on first use."""
+    global _cypher_executor
+    if _cypher_executor is None:
+        _cypher_executor = CypherExecutor.from_env()
+    return _cypher_executor
+
+
+def set_cypher_executor(executor):
+    """Replaces the shared cypher executor, e.g. with one over an in-memory graph stand-in."""
+    global _cypher_executor
+    _cypher_executor = executor
+
+
+def invalidate_cypher_results():
+    """Drops cached cypher query results, if the executor has been started."""
+    if _cypher_executor is not None:
+        _cypher_executor.invalidate()
+
+
+def cypher_retriever(cypher, params=None):
+    """Runs a parameterized cypher query against the graph database and returns the rows as documents.
+
+    A translator reply that no query applies (NO_CYPHER_ANSWER) returns no documents.
+    """
+    cypher = clean_cypher(cypher)
+    if not cypher or cypher.startswith(NO_CYPHER_ANSWER):
+        logger.debug("---NO CYPHER QUERY FOR THE QUESTION---")
+        return []
+    rows = get_cypher_executor().execute(cypher, params)
+    return [Document(page_content=json.dumps(row, default=str), metadata={"source": "cypher db"}) for row in rows]
+
+
+def _web_search_tool():
+    from .websearch import WebSearch
+    return WebSearch.from_env()
+
+
+def _unit_rows(vectors):
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _vectorstore_retriever():
+    index = LocalIndex(VECTOR_INDEX_DIR, get_embeddings())
+    if not HYBRID_RETRIEVAL:
+        return LocalIndexRetriever(vectorstore=index, search_kwargs={"k": RETRIEVER_K})
+    bm25 = BM25Index.load(VECTOR_INDEX_DIR)
+    if bm25 is None:
+        bm25 = BM25Index.build_from_index(index)
+        bm25.save(VECTOR_INDEX_DIR)
+    return HybridRetriever(vectorstore=index, bm25=bm25, search_kwargs={"k": RETRIEVER_K})
+
+
+_LAZY_GLOBALS = {"vectorstore_retrieve": _vectorstore_retriever, "web_search_tool": _web_search_tool}
+_lazy_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # `vectorstore_retrieve` and `web_search_tool` are built on first access, so importing the graph
+    # or tools that only need the index classes (e.g. `src.ingest`) do not load the index or the
+    # search client; the lock keeps concurrent first requests from building (and saving) it twice
+    if name in _LAZY_GLOBALS:
+        with _lazy_lock:
+            if name not in globals():
+                globals()[name] = _LAZY_GLOBALS[name]()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+from collections import defaultdict
+import numpy as np
+from dotenv import load_dotenv
+from .embeddings import cosine_similarity, get_embeddings
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# The router crew is only called when the local classifier is less confident than this
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv('ROUTER_CONFIDENCE_THRESHOLD', '0.6'))
+# Optional .npz file with one embedding centroid per route (see `fit_centroids`)
+ROUTER_CENTROIDS_PATH = os.getenv('ROUTER_CENTROIDS_PATH')
+# Similarity margin between the best and second-best centroid that counts as fully confident
+ROUTER_CENTROID_MARGIN = float(os.getenv('ROUTER_CENTROID_MARGIN', '0.1'))
+
+ROUTES = ("vectorstore", "cypher db", "web_search")
+
+# Keyword rules from the router agent's backstory: product descriptions, summaries and reviews
+# go to the vectorstore; inventory, prices, discounts, lead time and shipping go to the cypher db
+ROUTING_RULES = {
+    "cypher db": [
+        r"\binventor(y|ies)\b", r"\bin[- ]stock\b", r"\bstock\b", r"\bavailab(le|ility)\b",
+        r"\bquantit(y|ies)\b", r"\bunits?\b", r"\bprices?\b", r"\bpric(ed|ing)\b", r"\bcosts?\b",
+        r"\bhow much\b", r"\bdiscounts?\b", r"\bsales?\b", r"\bcoupons?\b", r"\bpromo(tion)?s?\b",
+        r"\blead[- ]times?\b", r"\bship(ping|ped|s)?\b", r"\bdeliver(y|ed|ies)?\b", r"\bdispatch\b",
+    ],
+    "vectorstore": [
+        r"\bdescri(be|ption)s?\b", r"\bsummar(y|ies|ize|ise)\b", r"\breviews?\b", r"\bratings?\b",
+        r"\bfeatures?\b", r"\bspec(s|ification|ifications)?\b", r"\bmaterials?\b", r"\bdimensions?\b",
+        r"\bcompar(e|ison)\b", r"\bpros and cons\b", r"\bwhat do (customers|people|users) (say|think)\b",
+    ],
+    "web_search": [
+        r"\bnews\b", r"\blatest\b", r"\btoday\b", r"\bcurrent(ly)?\b", r"\bweather\b",
+        r"\bcompetitors?\b", r"\bwho (is|was)\b",
+    ],
+}
+
+
+def normalize_route(decision):
+    """Maps a router response such as "'websearch'" or 'Cypher DB' to a route name."""
+    text = re.sub(r"[^a-z ]", " ", str(decision).lower())
+    text = re.sub(r"\s+", " ", text).strip()
+    if "vector" in text:
+        return "vectorstore"
+    if "cypher" in text:
+        return "cypher db"
+    if "web" in text:
+        return "web_search"
+    return text
+
+
+class LocalRouter:
+    """Routes questions without an LLM when a keyword rule table, or optionally an
+    embedding-centroid model, is confident enough.
+
+    Keeps per-route counts of local and LLM decisions.
+    """
+
+    def __init__(self, rules=ROUTING_RULES, threshold=ROUTER_CONFIDENCE_THRESHOLD,
+                 embeddings=None, centroids=None):
+        self.rules = {route: [re.compile(p, re.IGNORECASE) for p in patterns] for route, patterns in rules.items()}
+        self.threshold = threshold
+        self.embeddings = embeddings
+        self.centroids = centroids  # {route: vector}
+        self._counts = defaultdict(lambda: {"local": 0, "llm": 0})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, embeddings=None, centroids_path=None):
+        """Builds the router, loading embedding centroids when ROUTER_CENTROIDS_PATH is set.
+
+        Without `embeddings` the router creates its own model if it has centroids to compare with.
+        """
+        centroids_path = centroids_path or ROUTER_CENTROIDS_PATH
+        if not centroids_path:
+            return cls(embeddings=embeddings)
+        return cls(embeddings=embeddings or get_embeddings(), centroids=load_centroids(centroids_path))
+
+    def classify(self, question):
+        """Returns (route, confidence) from the rule table, then the centroid model if it is unsure."""
+        route, confidence = self.classify_rules(question)
+        if confidence < self.threshold and self.centroids:
+            route, confidence = max(
+                (route, confidence), self.classify_vector(self.embeddings.embed_query(question)), key=lambda r: r[1]
+            )
+        return route, confidence
+
+    async def aclassify(self, question):
+        """Async version of `classify`."""
+        route, confidence = self.classify_rules(question)
+        if confidence < self.threshold and self.centroids:
+            route, confidence = max(
+                (route, confidence), self.classify_vector(await self.embeddings.aembed_query(question)), key=lambda r: r[1]
+            )
+        return route, confidence
+
+    def classify_rules(self, question):
+        """Scores each route by matching rules; confidence grows with matches and drops on conflicts."""
+        scores = {route: sum(1 for pattern in patterns if pattern.search(question)) for route, patterns in self.rules.items()}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (route, top), second = ranked[0], (ranked[1][1] if len(ranked) > 1 else 0)
+        if top == 0:
+            return None, 0.0
+        return route, top / (top + second + 0.5)
+
+    def classify_vector(self, vector):
+        """Picks the nearest route centroid; confidence is the margin over the runner-up."""
+        routes = list(self.centroids)
+        similarities = cosine_similarity(vector, np.stack([self.centroids[r] for r in routes]))
+        order = np.argsort(similarities)[::-1]
+        margin = similarities[order[0]] - (similarities[order[1]] if len(order) > 1 else 0.0)
+        return routes[order[0]], float(min(1.0, margin / ROUTER_CENTROID_MARGIN))
+
+    def is_confident(self, confidence):
+        return confidence >= self.threshold
+
+    def record(self, route, source):
+        """Counts a routing decision made by 'local' or 'llm'."""
+        with self._lock:
+            self._counts[route][source] += 1
+
+    def stats(self):
+        """Per-route counts of decisions made locally and by the router crew."""
+        with self._lock:
+            return {route: dict(counts) for route, counts in self._counts.items()}
+
+
+def fit_centroids(examples, embeddings):
+    """Builds route centroids from {route: [example questions]}."""
+    return {
+        route: np.mean(np.asarray(embeddings.embed_documents(questions), dtype=np.float32), axis=0)
+        for route, questions in examples.items()
+    }
+
+
+def save_centroids(path, centroids):
+    np.savez(path, **{route.replace(" ", "_"): vector for route, vector in centroids.items()})
+
+
+def load_centroids(path):
+    with np.load(path) as data:
+        return {normalize_route(name.replace("_", " ")): data[name] for name in data.files}
@@ -13,8 +13,28 @@ class AgentState(TypedDict):
         question: question
         generation: LLM generation
         documents: list of documents
+        response: router decision
+        cypher: cypher query from the translator or a cached template
+        cypher_params: parameters bound to the cypher query
+        questions: rephrased questions from the question generators
+        original_question: question before query expansion
+        fused_scores: reciprocal rank fusion score of each fused document
+        rerank_scores: local reranker score of each kept document
+        verification: groundedness, answer quality and revised answer of the generation
+        context_tokens: tokens of the packed documents in the answer prompt
+        mode: degradation mode the request was admitted in (see src.admission)
     """
 
     question: str
     generation: str
-    documents: List[str]
\ No newline at end of file
+    documents: List[str]
+    response: str
+    cypher: str
+    cypher_params: dict
+    questions: List[str]
+    original_question: str
+    fused_scores: List[float]
+    rerank_scores: List[float]
+    verification: dict
+    context_tokens: int
+    mode: str
\ No newline at end of file
@@ -0,0 +1,265 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from opentelemetry import trace
+from prometheus_client import Counter as PromCounter, Gauge, Histogram
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON price table overriding litellm's: {"model": [usd per 1k prompt tokens, usd per 1k completion tokens]}
+LLM_PRICES = json.loads(os.getenv('LLM_PRICES', '{}'))
+# Threads running crew kickoffs of the async path. A kickoff whose stage timed out cannot be
+# interrupted and keeps its thread until its LLM calls return, so this also caps how many
+# abandoned kickoffs can run (and spend tokens) at once
+CREW_MAX_THREADS = int(os.getenv('CREW_MAX_THREADS', '32'))
+
+tracer = trace.get_tracer("rag.workflow")
+
+NODE_LATENCY = Histogram(
+    "rag_node_latency_seconds", "Wall time of a graph node", ["node"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+NODE_RUNS = PromCounter("rag_node_runs_total", "Graph node executions", ["node", "status"])
+NODE_RETRIES = PromCounter("rag_node_retries_total", "Repeated executions of a node within one request", ["node"])
+LLM_CALLS = PromCounter("rag_llm_calls_total", "LLM (crew) calls", ["node", "model"])
+LLM_TOKENS = PromCounter("rag_llm_tokens_total", "LLM tokens", ["node", "model", "kind"])
+LLM_COST = PromCounter("rag_llm_cost_usd_total", "Estimated LLM cost in USD", ["node", "model"])
+BRANCHES = PromCounter("rag_branch_total", "Conditional edge decisions", ["edge", "branch"])
+MICRO_BATCH_SIZE = Histogram("rag_micro_batch_size", "Calls coalesced into one micro-batch", ["role"],
+                             buckets=(1, 2, 4, 8, 16, 32, 64))
+CONTEXT_TOKENS = Histogram("rag_context_tokens", "Tokens of the packed documents in the answer prompt", ["model"],
+                           buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+EMBEDDING_CACHE_LOOKUPS = PromCounter("rag_embedding_cache_lookups_total",
+                                      "Embedding lookups by the cache tier that answered (miss: embedded)", ["tier"])
+CHECKPOINT_RESUMES = PromCounter("rag_checkpoint_resumes_total",
+                                 "Retried requests resumed from a checkpoint, by the node they resumed at", ["node"])
+ADMISSION_IN_FLIGHT = Gauge("rag_admission_in_flight", "Graph executions running in this worker")
+ADMISSION_QUEUED = Gauge("rag_admission_queued", "Requests waiting for an execution slot in this worker")
+ADMISSION_QUEUE_WAIT = Histogram("rag_admission_queue_wait_seconds", "Time queued requests waited for a slot",
+                                 buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+ADMISSION_REJECTED = PromCounter("rag_admission_rejected_total", "Requests rejected with 503", ["reason"])
+DEGRADED_REQUESTS = PromCounter("rag_requests_by_mode_total", "Admitted requests by degradation mode", ["mode"])
+STARTUP_SECONDS = Gauge("rag_startup_seconds", "Wall time of each startup phase of this worker", ["phase"])
+
+# Usage of the node currently running, and per-request node run counts
+_node_usage = contextvars.ContextVar("node_usage", default=None)
+_request_runs = contextvars.ContextVar("request_runs", default=None)
+
+
+class NodeUsage:
+    """LLM usage accumulated while one node runs."""
+
+    def __init__(self, node):
+        self.node = node
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.models = set()
+        self._lock = threading.Lock()
+
+    def add(self, model, prompt_tokens, completion_tokens):
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+            self.models.add(model)
+        LLM_CALLS.labels(self.node, model).inc()
+        LLM_TOKENS.labels(self.node, model, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(self.node, model, "completion").inc(completion_tokens)
+        LLM_COST.labels(self.node, model).inc(cost)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of one call, from LLM_PRICES or litellm's price table."""
+    if model in LLM_PRICES:
+        prompt_price, completion_price = LLM_PRICES[model]
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+    try:
+        from litellm import cost_per_token
+        prompt_cost, completion_cost = cost_per_token(model=model, prompt_tokens=prompt_tokens,
+                                                      completion_tokens=completion_tokens)
+        return prompt_cost + completion_cost
+    except Exception:
+        return 0.0
+
+
+def start_request():
+    """Starts per-request bookkeeping (node retry counts); call before running the graph."""
+    _request_runs.set(Counter())
+
+
+def traced_node(name, func):
+    """Wraps a sync or async node in a span that records latency, LLM usage, cost and retries."""
+    def start():
+        runs = _request_runs.get()
+        retries = 0
+        if runs is not None:
+            retries = runs[name]
+            runs[name] += 1
+        if retries:
+            NODE_RETRIES.labels(name).inc()
+        usage = NodeUsage(name)
+        return usage, _node_usage.set(usage), retries, time.perf_counter()
+
+    def finish(span, usage, token, retries, started, status):
+        elapsed = time.perf_counter() - started
+        _node_usage.reset(token)
+        NODE_LATENCY.labels(name).observe(elapsed)
+        NODE_RUNS.labels(name, status).inc()
+        span.set_attributes({
+            "rag.node": name,
+            "rag.status": status,
+            "rag.retries": retries,
+            "rag.llm.calls": usage.llm_calls,
+            "rag.llm.models": sorted(usage.models),
+            "rag.llm.prompt_tokens": usage.prompt_tokens,
+            "rag.llm.completion_tokens": usage.completion_tokens,
+            "rag.llm.cost_usd": usage.cost,
+        })
+        logger.debug("node %s %s in %.3fs, %d llm calls, %d+%d tokens", name, status, elapsed,
+                     usage.llm_calls, usage.prompt_tokens, usage.completion_tokens)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def traced(*args, **kwargs):
+            with tracer.start_as_current_span(f"node.{name}") as span:
+                usage, token, retries, started = start()
+                status = "error"
+                try:
+                    result = await func(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    finish(span, usage, token, retries, started, status)
+    else:
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            with tracer.start_as_current_span(f"node.{name}") as span:
+                usage, token, retries, started = start()
+                status = "error"
+                try:
+                    result = func(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    finish(span, usage, token, retries, started, status)
+    return traced
+
+
+def traced_branch(edge, func):
+    """Wraps a conditional-edge function to record the branch it takes."""
+    @functools.wraps(func)
+    def traced(*args, **kwargs):
+        branch = func(*args, **kwargs)
+        BRANCHES.labels(edge, str(branch)).inc()
+        trace.get_current_span().add_event("branch", {"rag.edge": edge, "rag.branch": str(branch)})
+        logger.debug("edge %s -> %s", edge, branch)
+        return branch
+    return traced
+
+
+class StartupReport:
+    """Wall time of each startup phase of a worker, for tuning cold starts."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.phases[name] = seconds
+        STARTUP_SECONDS.labels(name).set(seconds)
+        logger.info("startup phase %s took %.3fs", name, seconds)
+
+    def as_dict(self):
+        return {"pid": os.getpid(), "total_seconds": sum(self.phases.values()), "phases": dict(self.phases)}
+
+
+class TracedCrew:
+    """Crew proxy that records each kickoff's token usage against the running node.
+
+    A crew cannot run two kickoffs at once, so every kickoff runs on its own copy of the crew and
+    concurrent requests never share agent state. Async kickoffs run on the bounded `crew_executor`
+    instead of `asyncio.to_thread`: one cancelled (e.g. by a stage timeout) while still queued never
+    starts, while one already running finishes in the background.
+    """
+
+    def __init__(self, crew, model):
+        self.crew = crew
+        self.model = model or "unknown"
+
+    def kickoff(self, *args, **kwargs):
+        return self._record(self.crew.copy().kickoff(*args, **kwargs))
+
+    async def kickoff_async(self, *args, **kwargs):
+        # Crew.kickoff_async is a thread running kickoff; the copied context keeps the usage on this node
+        call = functools.partial(contextvars.copy_context().run, self.crew.copy().kickoff, *args, **kwargs)
+        return self._record(await asyncio.get_running_loop().run_in_executor(crew_executor(), call))
+
+    def copy(self):
+        return TracedCrew(self.crew.copy(), self.model)
+
+    def __getattr__(self, name):
+        return getattr(self.crew, name)
+
+    def _record(self, result):
+        record_llm_call(self.model, getattr(result, "token_usage", None))
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def crew_executor():
+    """The process-wide pool of CREW_MAX_THREADS threads for async crew kickoffs."""
+    return ThreadPoolExecutor(max_workers=CREW_MAX_THREADS, thread_name_prefix="crew")
+
+
+def record_llm_call(model, token_usage=None):
+    """Adds one LLM call (and its token usage, if known) to the running node."""
+    usage = _node_usage.get()
+    if usage is not None:
+        usage.add(model or "unknown", getattr(token_usage, "prompt_tokens", 0) or 0,
+                  getattr(token_usage, "completion_tokens", 0) or 0)
+
+
+def record_context_tokens(model, tokens):
+    """Records the answer prompt's document tokens on the running node's span and in metrics."""
+    CONTEXT_TOKENS.labels(model or "unknown").observe(tokens)
+    trace.get_current_span().set_attribute("rag.context_tokens", tokens)
+
+
+def setup_tracing(app):
+    """Exports OpenTelemetry spans (to OTEL_EXPORTER_OTLP_ENDPOINT, if set) and instruments the FastAPI app."""
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "rag-workflow")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app)
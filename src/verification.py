@@ -0,0 +1,50 @@
+import os
+import re
+from dotenv import load_dotenv
+from .bm25 import tokenize
+from .rerank import STOPWORDS
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# An answer counts as clearly grounded, and skips the LLM verification, when at least this share of
+# its content words and of its word bigrams occur in the retrieved documents
+VERIFY_UNIGRAM_THRESHOLD = float(os.getenv('VERIFY_UNIGRAM_THRESHOLD', '0.9'))
+VERIFY_BIGRAM_THRESHOLD = float(os.getenv('VERIFY_BIGRAM_THRESHOLD', '0.6'))
+
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def documents_text(documents):
+    """Joins retrieved documents (Documents or strings, possibly nested) into one text."""
+    if isinstance(documents, str):
+        return documents
+    if hasattr(documents, "page_content"):
+        return documents.page_content
+    return "\n\n".join(documents_text(doc) for doc in documents or [])
+
+
+def grounding_overlap(generation, documents):
+    """Returns (unigram coverage, bigram coverage) of the generation by the documents."""
+    source = documents_text(documents)
+    source_tokens = tokenize(source)
+    tokens = tokenize(generation)
+    words = [t for t in tokens if t not in STOPWORDS]
+    bigrams = list(zip(tokens, tokens[1:]))
+    if not words or not bigrams:
+        return 0.0, 0.0
+    source_words = set(source_tokens)
+    source_bigrams = set(zip(source_tokens, source_tokens[1:]))
+    return (
+        sum(w in source_words for w in words) / len(words),
+        sum(b in source_bigrams for b in bigrams) / len(bigrams),
+    )
+
+
+def is_clearly_grounded(generation, documents):
+    """Cheap local check: high n-gram overlap and every number in the answer found in the documents."""
+    source = documents_text(documents)
+    if not set(NUMBER_PATTERN.findall(str(generation))) <= set(NUMBER_PATTERN.findall(source)):
+        return False
+    unigram, bigram = grounding_overlap(generation, source)
+    return unigram >= VERIFY_UNIGRAM_THRESHOLD and bigram >= VERIFY_BIGRAM_THRESHOLD
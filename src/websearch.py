@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import html
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import zip_longest
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from .cache import normalize_question
+
+# Load environment variables from a .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated providers queried concurrently: tavily, duckduckgo
+WEB_SEARCH_PROVIDERS = os.getenv('WEB_SEARCH_PROVIDERS', 'tavily')
+# Seconds to wait for all providers; results of the ones that finished in time are used
+WEB_SEARCH_DEADLINE = float(os.getenv('WEB_SEARCH_DEADLINE', '5'))
+WEB_SEARCH_MAX_RESULTS = int(os.getenv('WEB_SEARCH_MAX_RESULTS', '5'))
+# Characters of extracted text kept per result
+WEB_SEARCH_RESULT_MAX_CHARS = int(os.getenv('WEB_SEARCH_RESULT_MAX_CHARS', '1500'))
+WEB_SEARCH_CACHE_TTL = float(os.getenv('WEB_SEARCH_CACHE_TTL', '900'))
+WEB_SEARCH_CACHE_SIZE = int(os.getenv('WEB_SEARCH_CACHE_SIZE', '1000'))
+
+TAG_PATTERN = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.DOTALL | re.IGNORECASE)
+SENTENCE_END_PATTERN = re.compile(r"[.!?]\s")
+SPACE_BEFORE_PUNCTUATION_PATTERN = re.compile(r"\s+([.,;:!?])")
+
+
+def web_search_providers(names=None):
+    """Search tools for a WEB_SEARCH_PROVIDERS-style setting, by name."""
+    providers = {}
+    for name in [n.strip().lower() for n in (names or WEB_SEARCH_PROVIDERS).split(",") if n.strip()]:
+        if name == "tavily":
+            from langchain_community.tools.tavily_search import TavilySearchResults
+            providers[name] = TavilySearchResults(max_results=WEB_SEARCH_MAX_RESULTS)
+        elif name == "duckduckgo":
+            from langchain_community.tools import DuckDuckGoSearchResults
+            providers[name] = DuckDuckGoSearchResults(output_format="list", num_results=WEB_SEARCH_MAX_RESULTS)
+        else:
+            raise ValueError(f"Unknown web search provider: {name}")
+    return providers
+
+
+def clean_text(text):
+    """Strips markup and collapses whitespace."""
+    text = re.sub(r"\s+", " ", html.unescape(TAG_PATTERN.sub(" ", str(text))))
+    return SPACE_BEFORE_PUNCTUATION_PATTERN.sub(r"\1", text).strip()
+
+
+def truncate(text, max_chars):
+    """Cuts text to `max_chars`, at the last sentence end (or else word break) in the second half."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    ends = [m.end() for m in SENTENCE_END_PATTERN.finditer(cut)]
+    if ends and ends[-1] > max_chars // 2:
+        return cut[:ends[-1]].strip()
+    space = cut.rfind(" ", max_chars // 2)
+    return cut[:space] if space > 0 else cut
+
+
+class WebSearch:
+    """Web search over several providers at once, with a TTL cache keyed on the normalized query.
+
+    Each provider is a tool whose `invoke` / `ainvoke` take {"query": ...} and return a list of
+    result dicts (Tavily's format; DuckDuckGo's field names are also understood). Providers run
+    concurrently under one `deadline`, and a late or failing provider is left out. Results are
+    interleaved by rank, cleaned, deduped by URL and content, truncated to `max_chars` and
+    returned as one Document per result with its source URL, title and provider in metadata.
+    Empty results are not cached, so a provider outage is retried on the next request.
+    """
+
+    def __init__(self, providers, deadline=WEB_SEARCH_DEADLINE, max_results=WEB_SEARCH_MAX_RESULTS,
+                 max_chars=WEB_SEARCH_RESULT_MAX_CHARS, ttl=WEB_SEARCH_CACHE_TTL, cache_size=WEB_SEARCH_CACHE_SIZE):
+        self.providers = providers
+        self.deadline = deadline
+        self.max_results = max_results
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # normalized query -> (expires at, documents), least recently used first
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(providers)), thread_name_prefix="web-search")
+        self.hits = 0
+        self.misses = 0
+        self.late = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(web_search_providers())
+
+    def search(self, query):
+        """Documents for the query's results, from the cache or the providers."""
+        documents = self._cached(query)
+        if documents is not None:
+            return documents
+        futures = {self._executor.submit(tool.invoke, {"query": query}): name for name, tool in self.providers.items()}
+        done, not_done = wait(futures, timeout=self.deadline)
+        for future in not_done:
+            future.cancel()
+        # In provider order, not completion order, so equal ranks always interleave the same way
+        results = {name: self._result(name, future) for future, name in futures.items() if future in done}
+        return self._store(query, results, len(not_done))
+
+    async def asearch(self, query):
+        """Async version of `search`."""
+        documents = self._cached(query)
+        if documents is not None:
+            return documents
+        tasks = {asyncio.ensure_future(tool.ainvoke({"query": query})): name for name, tool in self.providers.items()}
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        results = {name: self._result(name, task) for task, name in tasks.items() if task in done}
+        return self._store(query, results, len(pending))
+
+    # Tavily-tool compatible entry points, so a WebSearch can stand in for `web_search_tool`
+    def invoke(self, payload):
+        return self.search(payload["query"])
+
+    async def ainvoke(self, payload):
+        return await self.asearch(payload["query"])
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "late_providers": self.late, "cached_queries": len(self._cache)}
+
+    def documents(self, results):
+        """Merges {provider: [result dict]} into cleaned, deduped, truncated Documents, best ranks first."""
+        documents, urls, contents = [], set(), set()
+        ranked = zip_longest(*([(name, rank, r) for rank, r in enumerate(rs)] for name, rs in results.items()))
+        for name, rank, result in (entry for row in ranked for entry in row if entry is not None):
+            if not isinstance(result, dict):
+                continue
+            url = str(result.get("url") or result.get("link") or result.get("href") or "")
+            text = clean_text(result.get("content") or result.get("snippet") or result.get("body") or "")
+            fingerprint = hashlib.sha1(text.lower().encode("utf-8")).digest()
+            if not text or fingerprint in contents or (url and url.rstrip("/") in urls):
+                continue
+            urls.add(url.rstrip("/"))
+            contents.add(fingerprint)
+            metadata = {"source": url or name, "title": clean_text(result.get("title") or ""), "provider": name,
+                        "rank": rank}
+            documents.append(Document(page_content=truncate(text, self.max_chars), metadata=metadata))
+            if len(documents) >= self.max_results:
+                break
+        return documents
+
+    def _result(self, name, future):
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.warning("web search provider %s failed: %s", name, e)
+            return []
+        if not isinstance(results, list):  # tools report errors as a string
+            logger.warning("web search provider %s failed: %s", name, results)
+            return []
+        return results
+
+    def _cached(self, query):
+        key = normalize_question(query)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                logger.debug("---WEB SEARCH CACHE HIT---")
+                return list(entry[1])
+            self._cache.pop(key, None)
+            self.misses += 1
+        return None
+
+    def _store(self, query, results, late):
+        if late:
+            self.late += late
+            logger.warning("---WEB SEARCH: %d PROVIDERS MISSED THE %.1fs DEADLINE---", late, self.deadline)
+        documents = self.documents(results)
+        if documents:
+            with self._lock:
+                self._cache[normalize_question(query)] = (time.monotonic() + self.ttl, documents)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return documents
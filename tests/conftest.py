@@ -0,0 +1,36 @@
+"""Test setup: the offline settings and fakes of the benchmark harness, so no API is called."""
+import tempfile
+import pytest
+from benchmarks.run import offline_environment
+
+# Must run before anything from `src` is imported
+offline_environment(tempfile.mkdtemp(prefix="rag-test-index-"))
+
+
+@pytest.fixture
+def fake_nodes():
+    """Nodes whose crews run on the fake LLMs; returns (nodes, LLM call Counter by role)."""
+    from benchmarks.fakes import fake_agents
+    from src.nodes import Nodes
+
+    agents, calls = fake_agents()
+    return Nodes(agents), calls
+
+
+@pytest.fixture(scope="session")
+def fake_workflow():
+    """WorkFlow over the benchmark's fakes and a small product catalog; returns (workflow, LLM call Counter)."""
+    from benchmarks.fakes import product_catalog
+    from benchmarks.run import build_workflow
+
+    return build_workflow(product_catalog(size=20))
+
+
+@pytest.fixture
+def client(fake_workflow):
+    """Test client of the API serving `fake_workflow`, without running the startup hook."""
+    from fastapi.testclient import TestClient
+    import main
+
+    main.workflow = fake_workflow[0]
+    return TestClient(main.app)
@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from langchain_core.documents import Document
+import litellm
+import main
+from src.admission import AdmissionController, Overloaded, degraded, parse_levels
+from src.nodes import FALLBACK_ANSWER
+from test_api import fake_acompletion
+
+LEVELS = parse_levels("no_review:0.75,no_expansion:1.0,local_grading:1.5,cache_first:2.0")
+
+
+def controller(max_in_flight=1, queue_size=4, queue_timeout=1.0):
+    return AdmissionController(max_in_flight, queue_size, queue_timeout, levels=LEVELS)
+
+
+def test_modes_follow_the_load_thresholds():
+    admission = controller(max_in_flight=4)
+    assert [admission.mode(load) for load in (0, 0.75, 1.0, 1.9, 2.0)] == [
+        "full", "no_review", "no_expansion", "local_grading", "cache_first"]
+    assert degraded("local_grading", "no_review") and not degraded("no_review", "local_grading")
+    with pytest.raises(ValueError):
+        parse_levels("no_reviews:0.5")
+
+
+def test_lone_request_runs_in_full_mode():
+    admission = controller(max_in_flight=1)
+
+    async def main_():
+        async with admission.slot() as mode:
+            return mode
+
+    assert asyncio.run(main_()) == "full"
+    assert admission.in_flight == 0
+
+
+def test_queued_requests_get_freed_slots_in_order_and_a_degraded_mode():
+    admission = controller(max_in_flight=1)
+    order = []
+
+    async def request(name):
+        async with admission.slot() as mode:
+            order.append((name, mode))
+            await asyncio.sleep(0.01)
+
+    async def main_():
+        await asyncio.gather(request("first"), request("second"), request("third"))
+
+    asyncio.run(main_())
+    assert order == [("first", "full"), ("second", "no_expansion"), ("third", "cache_first")]
+    assert (admission.in_flight, admission.load) == (0, 0)
+
+
+def test_full_queue_and_queue_timeout_are_rejected():
+    async def main_():
+        admission = controller(max_in_flight=1, queue_size=1, queue_timeout=0.05)
+        mode, release = await admission.acquire()
+        queued = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded, match="queue is full"):
+            await admission.acquire()
+        with pytest.raises(Overloaded, match="no slot free"):
+            await queued
+        release()
+        release()  # releasing twice frees the slot once
+        return admission.in_flight
+
+    assert asyncio.run(main_()) == 0
+
+
+@pytest.fixture
+def full_admission(monkeypatch):
+    """An admission controller whose only slot is taken and which queues nothing."""
+    admission = controller(max_in_flight=1, queue_size=0)
+    admission.in_flight = 1
+    monkeypatch.setattr(main, "admission", admission)
+    return admission
+
+
+def test_invoke_is_rejected_with_503_when_the_queue_is_full(client, full_admission):
+    response = client.post("/invoke", json={"question": "Tell me about the Aurora Kettle"})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_stream_is_rejected_with_503_before_streaming(client, full_admission):
+    response = client.post("/invoke/stream", json={"question": "Tell me about the Aurora Kettle"})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_cached_answer_is_served_while_the_queue_is_full(client, full_admission, monkeypatch):
+    entry = SimpleNamespace(question="q", generation="The kettle is quiet.", route="vectorstore")
+
+    async def lookup(question, relaxed=False):
+        return entry, None
+
+    monkeypatch.setattr(main.workflow, "lookup", lookup)
+
+    response = client.post("/invoke", json={"question": "Tell me about the Aurora Kettle"})
+    assert response.status_code == 200
+    assert response.json()["cache"] == "hit"
+    assert response.json()["result"]["generation"] == "The kettle is quiet."
+    assert client.post("/invoke/stream", json={"question": "q"}).status_code == 200
+    assert full_admission.in_flight == 1
+
+
+def test_stream_frees_its_slot(client, monkeypatch):
+    admission = controller(max_in_flight=1)
+    monkeypatch.setattr(main, "admission", admission)
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion("Your order", " ships today."))
+
+    response = client.post("/invoke/stream", json={"question": "Where is my order?"})
+
+    assert response.status_code == 200
+    assert admission.in_flight == 0
+
+
+def test_no_review_passes_paraphrased_answers_through_unreviewed(fake_nodes):
+    nodes, calls = fake_nodes
+    documents = [Document(page_content='{"name": "Aurora Kettle", "price": 49.0, "stock": 12}')]
+    paraphrased = {"question": "How much is the Aurora Kettle?", "documents": documents, "mode": "no_review",
+                   "generation": "The Aurora Kettle is priced at 49.0."}
+
+    result = nodes.final_grader(paraphrased)
+
+    assert result["generation"] == paraphrased["generation"] != FALLBACK_ANSWER
+    assert result["verification"]["source"] == "skipped"
+    assert calls["answer_review"] == 0
+    assert nodes.final_grader({**paraphrased, "mode": "full"})["verification"]["source"] == "llm"
+    assert calls["answer_review"] == 1
@@ -0,0 +1,60 @@
+import json
+from types import SimpleNamespace
+import litellm
+from prometheus_client import REGISTRY
+
+
+def sse_events(text):
+    """(event, data) pairs of a server-sent event stream."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def fake_acompletion(*tokens, usage=None):
+    """Streaming litellm.acompletion stand-in; with `usage`, ends with a usage-only chunk as OpenAI does."""
+    async def acompletion(**kwargs):
+        async def chunks():
+            for token in tokens:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+            if usage and kwargs.get("stream_options", {}).get("include_usage"):
+                yield SimpleNamespace(choices=[], usage=usage)
+        return chunks()
+    return acompletion
+
+
+def test_invoke_answers_the_question(client):
+    response = client.post("/invoke", json={"question": "Tell me about the Aurora Kettle"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["result"]["generation"]
+    assert body["cache"] == "miss"
+
+
+def test_stream_sends_node_events_tokens_and_the_result(client, monkeypatch):
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion("The kettle", " is quiet."))
+
+    response = client.post("/invoke/stream", json={"question": "Tell me about the Aurora Kettle"})
+
+    assert response.status_code == 200
+    events = sse_events(response.text)
+    nodes = [data["node"] for event, data in events if event == "node"]
+    assert nodes[0] == "router" and "generate" in nodes
+    assert [data["token"] for event, data in events if event == "token"] == ["The kettle", " is quiet."]
+    assert events[-1][0] == "result"
+    assert events[-1][1]["cache"] == "miss"
+
+
+def test_streamed_answer_records_its_token_usage(client, monkeypatch):
+    usage = SimpleNamespace(prompt_tokens=120, completion_tokens=8)
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion("The kettle", " is quiet.", usage=usage))
+    labels = {"node": "generate", "model": "fake/answer_generator", "kind": "prompt"}
+    before = REGISTRY.get_sample_value("rag_llm_tokens_total", labels) or 0.0
+
+    response = client.post("/invoke/stream", json={"question": "Tell me about the Aurora Kettle"})
+
+    assert response.status_code == 200
+    assert REGISTRY.get_sample_value("rag_llm_tokens_total", labels) - before == 120
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from src.batching import MicroBatcher
+
+
+def recording_batcher(max_size, max_wait):
+    batches = []
+
+    async def run_batch(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    return MicroBatcher("test", run_batch, max_size=max_size, max_wait=max_wait), batches
+
+
+def test_concurrent_calls_are_coalesced_and_get_their_own_results():
+    batcher, batches = recording_batcher(max_size=8, max_wait=0.05)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+
+    assert asyncio.run(main()) == [0, 10, 20]
+    assert batches == [[0, 1, 2]]
+    assert batcher.stats()["mean_batch_size"] == 3
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    batcher, batches = recording_batcher(max_size=2, max_wait=60)
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), timeout=1)
+
+    assert asyncio.run(main()) == [0, 10, 20, 30]
+    assert batches == [[0, 1], [2, 3]]
+
+
+def test_batch_failure_reaches_every_caller():
+    async def run_batch(items):
+        raise RuntimeError("llm down")
+
+    batcher = MicroBatcher("test", run_batch, max_size=8, max_wait=0.01)
+
+    async def main():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [str(e) for e in results] == ["llm down", "llm down"]
+
+
+def test_cancelled_caller_is_left_out_of_the_batch():
+    batcher, batches = recording_batcher(max_size=8, max_wait=0.05)
+
+    async def main():
+        cancelled = asyncio.ensure_future(batcher.submit(1))
+        kept = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        return await kept
+
+    assert asyncio.run(main()) == 20
+    assert batches == [[2]]
+
+
+def test_from_env_reads_per_role_settings(monkeypatch):
+    monkeypatch.setenv("MICRO_BATCH_ROUTER_MAX_SIZE", "3")
+    monkeypatch.setenv("MICRO_BATCH_ROUTER_MAX_WAIT_MS", "25")
+
+    batcher = MicroBatcher.from_env("router", None)
+
+    assert (batcher.max_size, batcher.max_wait) == (3, pytest.approx(0.025))
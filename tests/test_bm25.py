@@ -0,0 +1,106 @@
+import asyncio
+import math
+from collections import Counter
+import numpy as np
+import pytest
+from src.bm25 import BM25Index, tokenize
+from src.retriever import HybridRetriever, LocalIndex
+
+TEXTS = [
+    "The XR-200 kettle boils water fast",
+    "A quiet blender with a glass jar",
+    "Kettle descaling guide for the XR-200 and XR-300 kettle",
+    "Backpack made of recycled nylon",
+]
+
+
+def reference_bm25(texts, query, k1=1.2, b=0.75):
+    """Scores every document with the BM25 formula, term by term."""
+    docs = [Counter(tokenize(text)) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    average = sum(lengths) / len(lengths)
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(1 for d in docs if term in d)
+            if df == 0 or term not in doc:
+                continue
+            idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * doc[term] * (k1 + 1) / (doc[term] + k1 * (1 - b + b * length / average))
+        scores.append(score)
+    return scores
+
+
+def test_tokenize_keeps_sku_tokens_together():
+    assert tokenize("Is the XR-200 (sku_12) in stock?") == ["is", "the", "xr-200", "sku_12", "in", "stock"]
+
+
+@pytest.mark.parametrize("query", ["xr-200 kettle", "glass blender", "nylon", "kettle kettle water"])
+def test_scores_match_the_reference_formula(query):
+    index = BM25Index.build(["a", "b", "c", "d"], TEXTS)
+    expected = reference_bm25(TEXTS, query)
+
+    hits = index.search(query, k=4)
+
+    assert {doc_id: score for doc_id, score in hits} == pytest.approx(
+        {doc_id: score for doc_id, score in zip("abcd", expected) if score > 0}, rel=1e-5
+    )
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_unknown_terms_and_top_k():
+    index = BM25Index.build(["a", "b", "c", "d"], TEXTS)
+    assert index.search("espresso") == []
+    assert [doc_id for doc_id, _ in index.search("kettle", k=1)] == ["c"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(["a", "b", "c", "d"], TEXTS)
+    index.save(tmp_path)
+
+    loaded = BM25Index.load(tmp_path)
+
+    assert loaded.search("xr-200 kettle") == index.search("xr-200 kettle")
+    assert BM25Index.load(tmp_path / "missing") is None
+
+
+class KeywordEmbeddings:
+    """Dense embeddings that only know about kettles, so SKU-only matches need BM25."""
+
+    def embed_query(self, text):
+        return [1.0 if "kettle" in text.lower() else 0.0, 1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+def test_hybrid_retrieval_finds_keyword_only_matches(tmp_path):
+    index = LocalIndex(tmp_path, KeywordEmbeddings())
+    index.add_texts(TEXTS + ["Kettle " + str(i) for i in range(10)], ids=[str(i) for i in range(14)])
+    retriever = HybridRetriever(vectorstore=index, bm25=BM25Index.build_from_index(index), search_kwargs={"k": 3})
+
+    docs = retriever.invoke("backpack nylon")
+
+    assert docs[0].page_content == TEXTS[3]
+    assert all("score" in doc.metadata for doc in docs)
+    assert len({doc.metadata["id"] for doc in docs}) == len(docs) == 3
+    assert np.isfinite([doc.metadata["score"] for doc in docs]).all()
+
+
+def test_query_expansion_keeps_keyword_recall_with_one_embedding_call(tmp_path, fake_nodes):
+    index = LocalIndex(tmp_path, KeywordEmbeddings())
+    index.add_texts(TEXTS + ["Kettle " + str(i) for i in range(10)], ids=[str(i) for i in range(14)])
+    nodes, _ = fake_nodes
+    nodes.vectorstore_retriever = HybridRetriever(vectorstore=index, bm25=BM25Index.build_from_index(index),
+                                                  search_kwargs={"k": 3})
+    questions = ["backpack nylon", "recycled nylon backpack"]
+
+    for results in (nodes._multi_query_retrieve(questions), asyncio.run(nodes._amulti_query_retrieve(questions))):
+        assert [docs[0].page_content for docs in results] == [TEXTS[3], TEXTS[3]]
@@ -0,0 +1,120 @@
+import asyncio
+import numpy as np
+from src.cache import SemanticCache, normalize_question, question_literals
+
+
+class StubEmbeddings:
+    """Embeds each question as the vector it is mapped to, or a fixed unrelated one."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors.get(text, [0.0, 0.0, 1.0])
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def near(angle):
+    return [float(np.cos(angle)), float(np.sin(angle)), 0.0]
+
+
+def test_normalize_question():
+    assert normalize_question("  What is\tthe PRICE? ") == "what is the price?"
+
+
+def test_question_literals_ignore_case_and_order():
+    assert question_literals("Compare XR-200 and XR-201") == question_literals("compare xr-201 and xr-200")
+    assert question_literals("price of XR-200") != question_literals("price of XR-201")
+
+
+def test_exact_hit_without_embedding():
+    embeddings = StubEmbeddings({})
+    cache = SemanticCache(embeddings)
+    cache.put("What is the price of XR-200?", "$10", "cypher db", vector=near(0))
+
+    entry, vector = cache.get("what is the price of  XR-200?")
+
+    assert entry.generation == "$10" and vector is None
+
+
+def test_similar_question_about_the_same_entity_hits():
+    cache = SemanticCache(StubEmbeddings({"How much is XR-200?": near(0.1)}), threshold=0.95)
+    cache.put("What is the price of XR-200?", "$10", "cypher db", vector=near(0))
+
+    entry, _ = cache.get("How much is XR-200?")
+
+    assert entry is not None and entry.generation == "$10"
+
+
+def test_similar_question_about_another_entity_misses():
+    # Questions differing only in a SKU or number embed almost identically
+    cache = SemanticCache(StubEmbeddings({"What is the price of XR-201?": near(0.01),
+                                          "Does it ship within 3 days?": near(0.51)}), threshold=0.95)
+    cache.put("What is the price of XR-200?", "$10", "cypher db", vector=near(0))
+    cache.put("Does it ship within 10 days?", "yes", "cypher db", vector=near(0.5))
+
+    assert cache.get("What is the price of XR-201?")[0] is None
+    assert cache.get("Does it ship within 3 days?")[0] is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_matching_entry_is_found_behind_a_more_similar_one():
+    cache = SemanticCache(StubEmbeddings({"How much is XR-201?": near(0.02)}), threshold=0.95)
+    cache.put("How much is XR-200?", "$10", "cypher db", vector=near(0.02))
+    cache.put("What does XR-201 cost?", "$12", "cypher db", vector=near(0.1))
+
+    assert cache.get("How much is XR-201?")[0].generation == "$12"
+
+
+def test_expired_entries_miss_unless_relaxed():
+    cache = SemanticCache(StubEmbeddings({"How much is XR-200?": near(0.35)}), threshold=0.95, ttl=-1)
+    cache.put("What is the price of XR-200?", "$10", "cypher db", vector=near(0))
+
+    assert cache.get("How much is XR-200?")[0] is None  # below the threshold
+    assert cache.get("How much is XR-200?", relaxed=True)[0].generation == "$10"  # within the relaxed one
+    assert cache.get("What is the price of XR-200?")[0] is None  # expired, and now evicted
+    assert cache.stats()["size"] == 0
+
+
+def test_async_lookup_and_invalidation_by_route():
+    cache = SemanticCache(StubEmbeddings({}))
+    cache.put("a question", "answer a", "vectorstore", vector=near(0))
+    cache.put("another question", "answer b", "cypher db", vector=near(1.5))
+
+    assert asyncio.run(cache.aget("a question"))[0].generation == "answer a"
+    assert cache.invalidate("cypher db") == 1
+    assert cache.get("another question")[0] is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(StubEmbeddings({}), max_size=2)
+    cache.put("first", "1", "vectorstore", vector=near(0))
+    cache.put("second", "2", "vectorstore", vector=near(1))
+    cache.get("first")
+    cache.put("third", "3", "vectorstore", vector=near(2))
+
+    assert cache.get("second")[0] is None
+    assert cache.get("first")[0].generation == "1"
+
+
+class FailingEmbeddings:
+    def embed_query(self, text):
+        raise ConnectionError("embedding API unreachable")
+
+    async def aembed_query(self, text):
+        self.embed_query(text)
+
+
+def test_embedding_outage_skips_the_cache_but_still_answers(fake_workflow, monkeypatch):
+    workflow, _ = fake_workflow
+    cache = SemanticCache(FailingEmbeddings())
+    monkeypatch.setattr(workflow, "cache", cache)
+
+    result, status = asyncio.run(workflow.ainvoke({"question": "Tell me about the Aurora Kettle"}))
+
+    assert status == "miss" and result["generation"]
+    assert cache.stats()["size"] == 0
+    cache.put("a question", "an answer", "vectorstore")
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,89 @@
+from typing import TypedDict
+import pytest
+from langchain_core.documents import Document
+from langgraph.graph import END, START, StateGraph
+from src.checkpoint import DOC_REF, DocumentRefSerializer, SQLiteCheckpointSaver, make_checkpointer
+
+INDEX = {"faq:0": "Returns are free for 30 days."}
+
+
+def lookup(ids):
+    return {doc_id: INDEX[doc_id] for doc_id in ids if doc_id in INDEX}
+
+
+def test_index_chunks_are_stored_as_references():
+    serde = DocumentRefSerializer(lookup)
+    state = {"documents": [Document(page_content=INDEX["faq:0"], metadata={"id": "faq:0"}),
+                           Document(page_content="From the web.", metadata={"source": "https://x.com"})]}
+
+    type_, data = serde.dumps_typed(state)
+
+    assert INDEX["faq:0"].encode() not in data and DOC_REF.encode() in data
+    assert serde.loads_typed((type_, data)) == state
+
+
+def test_chunk_gone_from_the_index_is_dropped_on_load():
+    serde = DocumentRefSerializer(lookup)
+    data = serde.dumps_typed([Document(page_content=INDEX["faq:0"], metadata={"id": "faq:0"}), "kept"])
+
+    assert DocumentRefSerializer(lambda ids: {}).loads_typed(data) == ["kept"]
+
+
+def test_make_checkpointer_selects_the_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.checkpoint.CHECKPOINT_SQLITE_PATH", str(tmp_path / "checkpoints.sqlite"))
+    assert make_checkpointer("none") is None
+    assert isinstance(make_checkpointer("sqlite"), SQLiteCheckpointSaver)
+    with pytest.raises(ValueError):
+        make_checkpointer("memcached")
+
+
+class State(TypedDict):
+    steps: list
+
+
+def flaky_graph(saver, runs, failures):
+    """retrieve -> generate graph whose generate node raises while `failures` is non-empty."""
+    def retrieve(state):
+        runs.append("retrieve")
+        return {"steps": state["steps"] + ["retrieve"]}
+
+    def generate(state):
+        runs.append("generate")
+        if failures:
+            raise failures.pop()
+        return {"steps": state["steps"] + ["generate"]}
+
+    graph = StateGraph(State)
+    graph.add_node("retrieve", retrieve)
+    graph.add_node("generate", generate)
+    graph.add_edge(START, "retrieve")
+    graph.add_edge("retrieve", "generate")
+    graph.add_edge("generate", END)
+    return graph.compile(checkpointer=saver)
+
+
+def test_retry_resumes_after_the_last_completed_node(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    runs = []
+    app = flaky_graph(saver, runs, [TimeoutError("llm timed out")])
+    config = {"configurable": {"thread_id": "request-1"}}
+
+    with pytest.raises(TimeoutError):
+        app.invoke({"steps": []}, config)
+    assert app.get_state(config).next == ("generate",)
+
+    assert app.invoke(None, config) == {"steps": ["retrieve", "generate"]}
+    assert runs == ["retrieve", "generate", "generate"]
+
+
+def test_only_the_latest_checkpoint_is_kept_and_threads_expire(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteCheckpointSaver(path)
+    flaky_graph(saver, [], []).invoke({"steps": []}, {"configurable": {"thread_id": "request-1"}})
+
+    assert len(list(saver.list(None))) == 1
+
+    expired = SQLiteCheckpointSaver(path, ttl=-1)
+    assert expired.get_tuple({"configurable": {"thread_id": "request-1"}}) is None
+    assert expired.sweep() == 1
+    assert list(saver.list(None)) == []
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from src.cypher import CypherExecutor, CypherTemplateCache, InMemoryGraphDriver, clean_cypher, parameterize
+
+
+def test_parameterize_extracts_entities_into_placeholders():
+    pattern, params = parameterize('Is the XR-200 cheaper than "Nimbus Blender" under 50 dollars?')
+
+    assert pattern == "is the {sku0} cheaper than {text0} under {number0} dollars"
+    assert params == {"text0": "Nimbus Blender", "sku0": "XR-200", "number0": 50}
+
+
+def test_parameterize_keeps_a_numbered_name_whole():
+    assert parameterize("What is the price of Aurora Kettle 2?") == (
+        "what is the price of {name0}", {"name0": "Aurora Kettle 2"})
+    # A plain number after a lower-case word is still a number
+    assert parameterize("Which products ship within 10 days?") == (
+        "which products ship within {number0} days", {"number0": 10})
+
+
+def test_clean_cypher_strips_markdown_fences():
+    assert clean_cypher("```cypher\nMATCH (n) RETURN n\n```") == "MATCH (n) RETURN n"
+    assert clean_cypher("  MATCH (n) RETURN n ") == "MATCH (n) RETURN n"
+
+
+def test_learned_template_is_reused_with_new_values():
+    cache = CypherTemplateCache()
+    template = cache.learn("How many units of XR-200 are in stock?",
+                           "MATCH (p:Product {sku: 'XR-200'}) RETURN p.stock")
+
+    assert template == "MATCH (p:Product {sku: $sku0}) RETURN p.stock"
+    assert cache.lookup("How many units of QT-9 are in stock?") == (template, {"sku0": "QT-9"})
+    assert cache.lookup("Who makes the XR-200?") is None
+    assert cache.stats() == {"templates": 1, "hits": 1, "misses": 1}
+
+
+def test_numbered_name_is_learned_as_one_parameter():
+    cache = CypherTemplateCache()
+    template = cache.learn("What is the price of Aurora Kettle 2?",
+                           "MATCH (p:Product {name: 'Aurora Kettle 2'}) RETURN p.price")
+
+    assert template == "MATCH (p:Product {name: $name0}) RETURN p.price"
+    assert cache.lookup("What is the price of Nimbus Blender 3?") == (template, {"name0": "Nimbus Blender 3"})
+
+
+def test_value_at_several_literal_positions_is_not_learned():
+    cache = CypherTemplateCache()
+    cypher = "MATCH (p:Product) WHERE p.lead_time_days <= 10 RETURN p.name LIMIT 10"
+
+    assert cache.learn("Which products ship within 10 days?", cypher) is None
+    # Binding 3 into both positions would also have cut the result to 3 rows
+    assert cache.lookup("Which products ship within 3 days?") is None
+
+
+def test_value_missing_from_the_cypher_is_not_learned():
+    cache = CypherTemplateCache()
+
+    assert cache.learn("How many units of XR-200 are in stock?", "MATCH (p:Product) RETURN count(p)") is None
+    assert cache.learn("How many units of XR-200 are in stock?", "Sorry! unable to find a valid response") is None
+    assert cache.stats()["templates"] == 0
+
+
+def test_templates_persist_and_evict_least_recently_used(tmp_path):
+    path = tmp_path / "templates.json"
+    cache = CypherTemplateCache(path=path, max_size=2)
+    cache.learn("Who makes XR-200?", "MATCH (p {sku: 'XR-200'}) RETURN p.maker")
+    cache.learn("What does XR-200 cost?", "MATCH (p {sku: 'XR-200'}) RETURN p.price")
+    cache.lookup("Who makes QT-9?")
+    cache.learn("Where is XR-200 stored?", "MATCH (p {sku: 'XR-200'}) RETURN p.warehouse")
+
+    assert sorted(json.loads(path.read_text())) == ["where is {sku0} stored", "who makes {sku0}"]
+    reloaded = CypherTemplateCache(path=path)
+    assert reloaded.lookup("Who makes QT-9?") == ("MATCH (p {sku: $sku0}) RETURN p.maker", {"sku0": "QT-9"})
+
+
+def test_executor_caches_results_per_parameters_until_invalidated():
+    cypher = "MATCH (p:Product {sku: $sku0}) RETURN p.stock AS stock"
+    driver = InMemoryGraphDriver({cypher: lambda sku0: [{"stock": len(sku0)}]})
+    executor = CypherExecutor(driver, result_ttl=60)
+
+    assert executor.execute(cypher, {"sku0": "XR-200"}) == [{"stock": 6}]
+    assert executor.execute(cypher, {"sku0": "XR-200"}) == [{"stock": 6}]
+    assert executor.execute(cypher, {"sku0": "QT-9"}) == [{"stock": 4}]
+    assert len(driver.queries) == 2
+    assert executor.stats()[cypher]["count"] == 2
+    assert executor.stats()[cypher]["cache_hits"] == 1
+
+    executor.invalidate()
+    executor.execute(cypher, {"sku0": "XR-200"})
+    assert len(driver.queries) == 3
+
+
+def test_no_query_answer_is_not_sent_to_the_graph_db(fake_nodes, monkeypatch):
+    from src import retriever
+
+    driver = InMemoryGraphDriver()  # raises for any query
+    monkeypatch.setattr(retriever, "_cypher_executor", CypherExecutor(driver))
+    nodes, _ = fake_nodes
+    state = {"question": "Who won the match?", "cypher": "Sorry! unable to find a valid response", "cypher_params": {}}
+
+    assert nodes.cypher_retriever(state)["documents"] == []
+    assert asyncio.run(nodes.acypher_retriever(state))["documents"] == []
+    assert driver.queries == []
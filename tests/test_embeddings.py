@@ -0,0 +1,67 @@
+import asyncio
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.embeddings import CachedEmbeddings, EmbeddingCache, embedding_key
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Fake embedding model that records the texts of each call."""
+
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+def cached_model(cache):
+    model = CountingEmbedding(size=8, calls=[])
+    return CachedEmbeddings(model, "test-model", cache), model
+
+
+def test_only_missing_texts_are_sent_to_the_model():
+    embeddings, model = cached_model(EmbeddingCache(max_size=100))
+    first = embeddings.embed_documents(["kettle", "blender"])
+
+    again = embeddings.embed_documents(["blender", "toaster", " kettle\n"])
+
+    assert model.calls == [["kettle", "blender"], ["toaster"]]
+    assert again[0] == first[1] and again[2] == first[0]
+    assert embeddings.cache.stats()["memory"] == 2
+
+
+def test_async_queries_share_the_cache():
+    embeddings, model = cached_model(EmbeddingCache(max_size=100))
+    vector = embeddings.embed_query("kettle")
+
+    assert asyncio.run(embeddings.aembed_query("kettle")) == vector
+    assert model.calls == [["kettle"]]
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = EmbeddingCache(max_size=2)
+    cache.put_many({b"a": np.ones(2), b"b": np.ones(2)})
+    cache.get_many([b"a"])
+    cache.put_many({b"c": np.ones(2)})
+
+    assert sorted(cache.get_many([b"a", b"b", b"c"])) == [b"a", b"c"]
+
+
+def test_disk_tier_is_shared_across_caches(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    writer, _ = cached_model(EmbeddingCache(max_size=100, path=path))
+    vector = writer.embed_query("kettle")
+
+    reader, model = cached_model(EmbeddingCache(max_size=100, path=path))
+
+    assert np.allclose(reader.embed_query("kettle"), vector)
+    assert model.calls == []
+    assert reader.cache.stats()["disk"] == 1
+
+
+def test_keys_depend_on_the_model_and_normalized_text():
+    assert embedding_key("m", "a  kettle") == embedding_key("m", " a kettle ")
+    assert embedding_key("m", "a kettle") != embedding_key("other", "a kettle")
@@ -0,0 +1,57 @@
+import pytest
+from langchain_core.documents import Document
+from src.fusion import document_id, reciprocal_rank_fusion
+
+
+def doc(content, **metadata):
+    return Document(page_content=content, metadata=metadata)
+
+
+def reference_rrf(result_lists, k, weights):
+    """The textbook loop: each list adds weight / (k + best rank) per document id."""
+    scores = {}
+    for weight, docs in zip(weights, result_lists):
+        best = {}
+        for rank, d in enumerate(docs, start=1):
+            best.setdefault(document_id(d), rank)
+        for doc_id, rank in best.items():
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return scores
+
+
+def test_document_id_prefers_metadata_ids_then_content_hash():
+    assert document_id(doc("x", id=7)) == "7"
+    assert document_id(doc("x", chunk_id="a:1")) == "a:1"
+    assert document_id(doc("same")) == document_id(doc("same"))
+    assert document_id(doc("same")) != document_id(doc("other"))
+
+
+def test_scores_match_the_reference_loop():
+    lists = [
+        [doc("a"), doc("b"), doc("c")],
+        [doc("c"), doc("a"), doc("d"), doc("a")],  # a repeated within a list keeps its best rank
+        [doc("d")],
+    ]
+    weights = [2.0, 1.0, 1.0]
+
+    documents, scores = reciprocal_rank_fusion(lists, k=60, top_n=10, weights=weights)
+
+    expected = reference_rrf(lists, 60, weights)
+    assert [document_id(d) for d in documents] == sorted(expected, key=expected.get, reverse=True)
+    assert scores == pytest.approx(sorted(expected.values(), reverse=True))
+
+
+def test_duplicates_are_merged_by_id_not_content():
+    documents, _ = reciprocal_rank_fusion([[doc("v1", id=1)], [doc("v2", id=1)], [doc("v1", id=2)]], top_n=5)
+    assert [d.metadata["id"] for d in documents] == [1, 2]
+
+
+def test_missing_weights_default_to_one_and_ties_keep_first_seen_order():
+    documents, scores = reciprocal_rank_fusion([[doc("a")], [doc("b")]], k=1, top_n=2, weights=[])
+    assert [d.page_content for d in documents] == ["a", "b"]
+    assert scores == [0.5, 0.5]
+
+
+def test_top_n_and_empty_input():
+    assert reciprocal_rank_fusion([[doc(str(i)) for i in range(10)]], top_n=3)[0] == [doc("0"), doc("1"), doc("2")]
+    assert reciprocal_rank_fusion([[], []]) == ([], [])
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+import pytest
+from langchain_core.documents import Document
+from src import nodes as nodes_module
+from src.nodes import _batch_verdicts, _parse_grade
+
+
+def test_parse_grade_normalizes_responses():
+    assert _parse_grade(" 'Yes' ") == "yes"
+    assert _parse_grade("YES, it is relevant") == "yes"
+    assert _parse_grade("no") == "no"
+    assert _parse_grade("maybe") == "no"
+
+
+def test_batch_verdicts_reads_structured_output():
+    result = SimpleNamespace(pydantic=SimpleNamespace(verdicts=["yes", "No", "yes"]), raw="")
+    assert _batch_verdicts(result, 3) == ["yes", "no", "yes"]
+
+
+def test_batch_verdicts_falls_back_to_raw_text_and_keeps_unjudged_documents():
+    result = SimpleNamespace(pydantic=None, raw="[0] no\n[1] yes")
+    assert _batch_verdicts(result, 3) == ["no", "yes", "yes"]
+    assert _batch_verdicts(result, 1) == ["no"]
+
+
+def test_prefilter_grades_use_both_bounds(fake_nodes):
+    nodes, _ = fake_nodes
+    high, low = nodes_module.GRADER_PREFILTER_HIGH, nodes_module.GRADER_PREFILTER_LOW
+    assert nodes._prefilter_grades([high, low - 0.01, (low + high) / 2]) == ["yes", "no", None]
+
+
+@pytest.mark.parametrize("mode", ["batch", "concurrent", "sequential"])
+def test_only_uncertain_documents_reach_the_grader(fake_nodes, monkeypatch, mode):
+    monkeypatch.setattr(nodes_module, "GRADER_MODE", mode)
+    nodes, calls = fake_nodes
+    documents = [Document(page_content=f"document {i}") for i in range(4)]
+
+    grades = nodes._grade_uncertain("question", documents, ["no", None, "yes", None])
+
+    assert grades == ["no", "yes", "yes", "yes"]
+    assert calls["grader"] == (1 if mode == "batch" else 2)
+
+
+def test_grades_without_uncertain_documents_make_no_call(fake_nodes):
+    nodes, calls = fake_nodes
+    documents = [Document(page_content="a"), Document(page_content="b")]
+    assert nodes._grade_uncertain("question", documents, ["yes", "no"]) == ["yes", "no"]
+    assert calls["grader"] == 0
+    assert nodes._filter_graded(documents, ["yes", "no"]) == documents[:1]
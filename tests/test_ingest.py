@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from src.bm25 import BM25Index
+from src.embeddings import get_embeddings
+from src.ingest import SourceDocument, ingest, load_directory
+from src.retriever import LocalIndex
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def documents(**texts):
+    return [SourceDocument(doc_id, text, {"source": doc_id}) for doc_id, text in texts.items()]
+
+
+def run(index_dir, docs, **kwargs):
+    return ingest(docs, str(index_dir), get_embeddings(cached=False), workers=0, chunk_size=40, overlap=0, **kwargs)
+
+
+def test_reingest_only_embeds_changed_documents(tmp_path):
+    long_text = "the aurora kettle boils water quickly. " * 4
+    run(tmp_path, documents(kettle=long_text, blender="the nimbus blender crushes ice."))
+
+    stats = run(tmp_path, documents(kettle="the aurora kettle is discontinued.", blender="the nimbus blender crushes ice."))
+
+    assert (stats["embedded"], stats["unchanged"]) == (1, 1)
+    index = LocalIndex(tmp_path, get_embeddings())
+    assert sorted(doc.metadata["id"] for doc in index.get_documents(["kettle:0", "kettle:1", "blender:0"])) == [
+        "blender:0", "kettle:0"]
+
+
+def test_prune_removes_missing_documents_and_rebuilds_bm25(tmp_path):
+    run(tmp_path, documents(kettle="the aurora kettle boils water.", blender="the nimbus blender crushes ice."))
+
+    stats = run(tmp_path, documents(kettle="the aurora kettle boils water."), prune=True)
+
+    assert stats["removed"] == 1 and stats["index_chunks"] == 1
+    bm25 = BM25Index.load(str(tmp_path))
+    assert [doc_id for doc_id, _ in bm25.search("nimbus blender", 5)] == []
+    assert [doc_id for doc_id, _ in bm25.search("aurora kettle", 5)] == ["kettle:0"]
+
+
+def test_load_directory_reads_text_and_jsonl(tmp_path):
+    (tmp_path / "faq.md").write_text("Returns are free.", encoding="utf-8")
+    (tmp_path / "products.jsonl").write_text(
+        '{"id": "XR-200", "description": "A blender", "price": 49}\n\n{"name": "no text"}\n', encoding="utf-8")
+
+    loaded = {doc.id: doc for doc in load_directory(tmp_path)}
+
+    assert sorted(loaded) == ["XR-200", "faq.md"]
+    assert loaded["XR-200"].metadata == {"id": "XR-200", "price": 49, "source": "products.jsonl"}
+
+
+def test_building_the_graph_does_not_load_the_index(tmp_path):
+    code = ("from benchmarks.fakes import fake_agents\n"
+            "from src.graph import WorkFlow\n"
+            "from src.nodes import Nodes\n"
+            "WorkFlow(Nodes(fake_agents()[0]))\n")
+    env = {**os.environ, "VECTOR_INDEX_DIR": str(tmp_path / "index")}
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, capture_output=True)
+
+    assert not (tmp_path / "index").exists()
+
+
+def test_interrupted_run_resumes_from_its_last_checkpoint(tmp_path):
+    texts = {f"doc{i}": f"product {i} is a kettle." for i in range(10)}
+    # The process dies while reading the 8th document: checkpoints were saved after the 3rd and
+    # 6th, and the 7th was added to the index but never saved
+    code = ("import os, sys\n"
+            "from src.embeddings import get_embeddings\n"
+            "from src.ingest import SourceDocument, ingest\n"
+            "def documents():\n"
+            "    for i in range(10):\n"
+            "        if i == 7:\n"
+            "            os._exit(1)\n"
+            "        yield SourceDocument(f'doc{i}', f'product {i} is a kettle.', {'source': f'doc{i}'})\n"
+            "ingest(documents(), sys.argv[1], get_embeddings(cached=False), workers=0, chunk_size=40, overlap=0,\n"
+            "       batch_size=1, checkpoint_chunks=3)\n")
+    crashed = subprocess.run([sys.executable, "-c", code, str(tmp_path)], cwd=ROOT, capture_output=True)
+    assert crashed.returncode == 1
+    assert len(LocalIndex(tmp_path, get_embeddings())) == 6
+
+    stats = run(tmp_path, documents(**texts))
+
+    assert (stats["unchanged"], stats["embedded"], stats["index_chunks"]) == (6, 4, 10)
+    index = LocalIndex(tmp_path, get_embeddings())
+    assert [doc.page_content for doc in index.get_documents([f"doc{i}:0" for i in range(10)])] == list(texts.values())
+    assert [doc_id for doc_id, _ in BM25Index.load(str(tmp_path)).search("product 7", 1)] == ["doc7:0"]
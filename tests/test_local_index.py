@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from src import retriever
+from src.retriever import LocalIndex, LocalIndexRetriever, chunk_text
+
+
+class NoEmbeddings:
+    """Index embeddings are passed in precomputed, except for the query in the retriever test."""
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+
+def axis(i, dim=4):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def clustered(n, dim=16, clusters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, n)] + 0.1 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_search_returns_nearest_chunks_with_scores(tmp_path):
+    index = LocalIndex(tmp_path, NoEmbeddings())
+    index.add(["a", "b", "c"], ["alpha", "beta", "gamma"], [axis(0), axis(1), axis(0) + axis(1)])
+
+    hits = index.similarity_search_by_vector(axis(0), k=2)
+
+    assert [doc.metadata["id"] for doc in hits] == ["a", "c"]
+    assert hits[0].metadata["score"] == pytest.approx(1.0)
+    assert hits[1].metadata["score"] == pytest.approx(np.sqrt(0.5))
+
+
+def test_delete_replace_reload_and_compact(tmp_path):
+    index = LocalIndex(tmp_path, NoEmbeddings(), dtype="float16")
+    index.add(["a", "b", "c"], ["alpha", "beta", "gamma"], [axis(0), axis(1), axis(2)], [{"n": 1}, {}, {}])
+    index.delete(["b"])
+    index.add(["c"], ["gamma v2"], [axis(3)])
+    index.save()
+
+    reloaded = LocalIndex(tmp_path, NoEmbeddings())
+    assert len(reloaded) == 2 and reloaded.dtype == np.float16
+    assert [d.page_content for d in reloaded.get_documents(["a", "b", "c"])] == ["alpha", "gamma v2"]
+    assert reloaded.similarity_search_by_vector(axis(1), k=3)[0].metadata["id"] in {"a", "c"}
+
+    reloaded.compact()
+    compacted = LocalIndex(tmp_path, NoEmbeddings())
+    assert compacted.count == 2
+    assert compacted.get_documents(["a"])[0].metadata == {"n": 1, "id": "a"}
+
+
+def test_unsaved_changes_are_rolled_back_on_reopen(tmp_path):
+    index = LocalIndex(tmp_path, NoEmbeddings())
+    index.add(["a", "b"], ["alpha", "beta"], [axis(0), axis(1)])
+    index.save()
+    index.delete(["a"])
+    index.add(["c"], ["gamma"], [axis(2)])
+    index.close()
+
+    reopened = LocalIndex(tmp_path, NoEmbeddings())
+    assert reopened.count == 2
+    assert [d.page_content for d in reopened.get_documents(["a", "b", "c"])] == ["alpha", "beta"]
+    reopened.add(["c"], ["gamma"], [axis(2)])
+    assert reopened.similarity_search_by_vector(axis(2), k=1)[0].page_content == "gamma"
+
+
+def test_reopen_finishes_an_interrupted_compaction(tmp_path, monkeypatch):
+    index = LocalIndex(tmp_path, NoEmbeddings())
+    index.add(["a", "b", "c"], ["alpha", "beta", "gamma"], [axis(0), axis(1), axis(2)])
+    index.delete(["a"])
+
+    def crash():
+        raise SystemExit
+    monkeypatch.setattr(index, "_finish_compaction", crash)
+    with pytest.raises(SystemExit):
+        index.compact()
+    monkeypatch.undo()
+
+    reopened = LocalIndex(tmp_path, NoEmbeddings())
+    assert reopened.count == 2 and not (tmp_path / "embeddings.npy.compact").exists()
+    assert [d.metadata["id"] for d in reopened.similarity_search_by_vector(axis(2), k=2)] == ["c", "b"]
+
+
+def test_ivf_search_matches_the_full_scan(tmp_path):
+    vectors = clustered(2000)
+    index = LocalIndex(tmp_path, NoEmbeddings())
+    index.add([str(i) for i in range(len(vectors))], [""] * len(vectors), vectors)
+    queries = vectors[:20] + 0.05
+    exact = [[row for row, _ in index.search(q, k=5)] for q in queries]
+
+    index.build_ivf()
+    approximate = [[row for row, _ in index.search(q, k=5)] for q in queries]
+
+    assert index._centroids is not None
+    recall = np.mean([len(set(a) & set(e)) / 5 for a, e in zip(approximate, exact)])
+    assert recall >= 0.9
+
+
+def test_ivf_is_built_at_the_size_threshold_and_survives_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(retriever, "IVF_MIN_SIZE", 100)
+    vectors = clustered(150)
+    index = LocalIndex(tmp_path, NoEmbeddings())
+    index.add([str(i) for i in range(99)], [""] * 99, vectors[:99])
+    assert index._centroids is None
+    index.add([str(i) for i in range(99, 150)], [""] * 51, vectors[99:])
+    assert index._centroids is not None
+    index.save()
+
+    reloaded = LocalIndex(tmp_path, NoEmbeddings())
+    assert reloaded._centroids is not None
+    assert reloaded.search(vectors[120], k=1)[0][0] == 120
+
+
+def test_retriever_embeds_the_question(tmp_path):
+    index = LocalIndex(tmp_path, NoEmbeddings())
+    index.add(["a", "b"], ["alpha", "beta"], [axis(1), axis(0)])
+    docs = LocalIndexRetriever(vectorstore=index, search_kwargs={"k": 1}).invoke("question")
+    assert [doc.page_content for doc in docs] == ["beta"]
+
+
+def test_chunk_text_overlaps():
+    chunks = chunk_text("x" * 2500, chunk_size=1000, overlap=200)
+    assert [len(c) for c in chunks] == [1000, 1000, 900]
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from src import packing
+from src.packing import ContextPacker, minhash_signature
+
+
+def count_words(text):
+    return len(text.split())
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(packing, "token_counter", lambda model=None: count_words)
+
+
+def doc(text, **metadata):
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_minhash_agreement_tracks_text_similarity():
+    text = "the aurora kettle boils a full litre of water in under three minutes and switches off by itself"
+    near = text.replace("three", "four")
+    other = "our warehouse in lyon ships blenders to every country of the european union within days"
+
+    assert np.array_equal(minhash_signature(text), minhash_signature(text))
+    assert np.mean(minhash_signature(text) == minhash_signature(near)) > 0.5
+    assert np.mean(minhash_signature(text) == minhash_signature(other)) < 0.2
+
+
+def test_near_duplicates_keep_the_better_ranked_copy():
+    text = "the aurora kettle boils a full litre of water in under three minutes and switches off by itself"
+    documents = [doc(text, rank=1), doc(text + ".", rank=2), doc("returns are free for thirty days", rank=3),
+                 doc("   ", rank=4)]
+
+    kept = ContextPacker(dedup_threshold=0.8).deduplicate(documents)
+
+    assert [d.metadata["rank"] for d in kept] == [1, 3]
+
+
+def test_long_chunk_keeps_its_most_relevant_sentences_in_order():
+    text = ("Our company was founded in 1990. The kettle price is 49 dollars. "
+            "We love tea. The kettle warranty lasts two years.")
+
+    trimmed, tokens = ContextPacker().trim(text, {"kettle", "price", "warranty"}, 12, count_words)
+
+    assert trimmed == "The kettle price is 49 dollars. The kettle warranty lasts two years."
+    assert tokens == 12
+
+
+def test_pack_fills_the_budget_in_rank_order():
+    documents = [doc(" ".join(["alpha"] * 10), id=1), doc(" ".join(["beta"] * 10), id=2),
+                 doc(" ".join(["gamma"] * 10), id=3)]
+
+    packed, used = ContextPacker(chunk_max_tokens=100, min_fill_tokens=5).pack("question", documents, budget=25)
+
+    assert [d.metadata["id"] for d in packed] == [1, 2, 3]
+    assert used <= 25
+    assert count_words(packed[2].page_content) == 5
+
+
+def test_pack_stops_when_the_remainder_is_below_the_minimum_fill():
+    documents = [doc(" ".join(["alpha"] * 10)), doc(" ".join(["beta"] * 10))]
+
+    packed, used = ContextPacker(chunk_max_tokens=100, min_fill_tokens=8).pack("question", documents, budget=15)
+
+    assert len(packed) == 1 and used == 10
@@ -0,0 +1,44 @@
+import asyncio
+from langchain_core.documents import Document
+from src.nodes import _parse_questions
+from src.retriever import LocalIndexRetriever
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+class VectorStore:
+    def __init__(self):
+        self.embeddings = CountingEmbeddings()
+
+    def similarity_search_by_vector(self, vector, k=4):
+        return [Document(page_content=f"{vector[0]:g}")] * k
+
+    async def asimilarity_search_by_vector(self, vector, k=4):
+        await asyncio.sleep(0.01 / vector[0])  # finish out of order
+        return self.similarity_search_by_vector(vector, k)
+
+
+def test_parse_questions_strips_numbering_and_bullets():
+    text = "1. First question?\n2) Second question?\n\n- Third question?\n• Fourth"
+    assert _parse_questions(text) == ["First question?", "Second question?", "Third question?", "Fourth"]
+
+
+def test_rephrased_questions_are_embedded_in_one_call_and_kept_in_order(fake_nodes):
+    nodes, _ = fake_nodes
+    vectorstore = VectorStore()
+    nodes.vectorstore_retriever = LocalIndexRetriever(vectorstore=vectorstore, search_kwargs={"k": 2})
+    questions = ["a", "bb", "ccc"]
+
+    for results in (nodes._multi_query_retrieve(questions), asyncio.run(nodes._amulti_query_retrieve(questions))):
+        assert [[doc.page_content for doc in docs] for docs in results] == [["1", "1"], ["2", "2"], ["3", "3"]]
+    assert vectorstore.embeddings.batches == [questions, questions]
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from benchmarks.fakes import fake_agents
+from src.crew.registry import CREW_SPECS, CrewRegistry, preload_roles
+
+
+def test_preload_roles_parses_the_setting():
+    assert preload_roles("all") == list(CREW_SPECS)
+    assert preload_roles("none") == []
+    assert preload_roles(" Router, grader_batch ") == ["router", "grader_batch"]
+    with pytest.raises(ValueError, match="routr"):
+        preload_roles("routr")
+
+
+def test_crews_are_built_on_first_use_only():
+    registry = CrewRegistry(fake_agents()[0])
+    assert registry.built() == []
+
+    crew = registry["router"]
+
+    assert registry["router"] is crew
+    assert registry.built() == ["router"]
+    assert crew.model == "fake/router"
+
+
+def test_concurrent_first_use_builds_one_crew():
+    registry = CrewRegistry(fake_agents()[0])
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        crews = list(executor.map(lambda _: registry["grader"], range(8)))
+
+    assert all(crew is crews[0] for crew in crews)
+    assert list(registry.build_seconds) == ["grader"]
+
+
+def test_preload_reports_build_seconds_per_role():
+    registry = CrewRegistry(fake_agents()[0])
+    seconds = registry.preload(["verification", "cypher_translator"])
+
+    assert sorted(seconds) == ["cypher_translator", "verification"]
+    assert registry.built() == ["cypher_translator", "verification"]
+    assert registry["verification"].model == "fake/answer_review"
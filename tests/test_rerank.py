@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from src.rerank import LexicalOverlapScorer, Reranker, calibrate_thresholds
+
+
+def test_lexical_overlap_ignores_stopwords():
+    scores = LexicalOverlapScorer().score("What is the XR-200 kettle made of?", [
+        "The XR-200 kettle is made of steel", "A kettle", "Backpack",
+    ])
+    assert scores.tolist() == pytest.approx([1.0, 1 / 3, 0.0])
+
+
+def test_reranker_sorts_into_keep_drop_and_uncertain():
+    scores, grades = Reranker(LexicalOverlapScorer(), keep=0.6, drop=0.1).grade(
+        "xr-200 kettle steel", ["xr-200 kettle steel", "kettle", "backpack"]
+    )
+    assert grades == ["yes", None, "no"]
+    assert len(scores) == 3
+
+
+def test_calibrated_thresholds_reach_the_precision():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, 500)
+    scores = np.clip(labels * 0.5 + rng.normal(0.25, 0.15, 500), 0, 1)
+
+    drop, keep = calibrate_thresholds(scores, labels, precision=0.95)
+
+    assert drop <= keep
+    assert labels[scores >= keep].mean() >= 0.95
+    assert (1 - labels[scores < drop]).mean() >= 0.95
+
+
+def test_only_the_uncertain_band_reaches_the_grader(fake_nodes):
+    nodes, calls = fake_nodes
+    nodes.reranker = Reranker(LexicalOverlapScorer(), keep=0.6, drop=0.1)
+    documents = [Document(page_content=text) for text in ["kettle", "xr-200 kettle steel", "backpack"]]
+
+    state = nodes.rerank({"question": "xr-200 kettle steel", "documents": documents})
+
+    # The fake grader keeps the uncertain 'kettle'; kept documents are ordered by score
+    assert [doc.page_content for doc in state["documents"]] == ["xr-200 kettle steel", "kettle"]
+    assert state["rerank_scores"] == pytest.approx([1.0, 1 / 3])
+    assert calls["grader"] == 1
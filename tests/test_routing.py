@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from src.routing import LocalRouter, fit_centroids, load_centroids, normalize_route, save_centroids
+
+
+class AxisEmbeddings:
+    """Embeds a text on the axis of the first keyword it contains."""
+
+    AXES = ("manual", "stock", "news")
+
+    def embed_query(self, text):
+        return [1.0 if axis in text else 0.0 for axis in self.AXES]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.mark.parametrize("decision, route", [
+    ("'websearch'", "web_search"), ("Cypher DB", "cypher db"), ("vectorstore.", "vectorstore"), ("other", "other"),
+])
+def test_normalize_route(decision, route):
+    assert normalize_route(decision) == route
+
+
+@pytest.mark.parametrize("question, route", [
+    ("How much does the Aurora Kettle cost?", "cypher db"),
+    ("Is the XR-200 in stock, and what is the lead time?", "cypher db"),
+    ("Summarize the reviews of the Nimbus Blender", "vectorstore"),
+    ("What is the latest news about Harbor?", "web_search"),
+])
+def test_clear_questions_are_routed_locally(question, route):
+    router = LocalRouter()
+    assert router.classify(question)[0] == route
+    assert router.is_confident(router.classify(question)[1])
+
+
+def test_conflicting_or_unknown_questions_go_to_the_router_crew():
+    router = LocalRouter()
+    assert router.classify("Tell me something") == (None, 0.0)
+    route, confidence = router.classify("Compare the reviews and the price")
+    assert not router.is_confident(confidence)
+
+
+def test_centroids_decide_when_the_rules_are_unsure(tmp_path):
+    embeddings = AxisEmbeddings()
+    centroids = fit_centroids({"vectorstore": ["manual"], "cypher db": ["stock"], "web_search": ["news"]}, embeddings)
+    save_centroids(tmp_path / "centroids.npz", centroids)
+    loaded = load_centroids(tmp_path / "centroids.npz")
+    assert set(loaded) == {"vectorstore", "cypher db", "web_search"}
+    assert np.allclose(loaded["cypher db"], centroids["cypher db"])
+
+    router = LocalRouter(embeddings=embeddings, centroids=loaded)
+    assert router.classify("Where is the manual?") == ("vectorstore", 1.0)
+
+
+def test_stats_count_decisions_by_source():
+    router = LocalRouter()
+    router.record("vectorstore", "local")
+    router.record("vectorstore", "llm")
+    router.record("cypher db", "local")
+    assert router.stats() == {"vectorstore": {"local": 1, "llm": 1}, "cypher db": {"local": 1, "llm": 0}}
+
+
+def test_centroid_router_gets_its_own_embeddings_without_the_grader_prefilter(tmp_path, monkeypatch):
+    from benchmarks.fakes import fake_agents
+    from src import nodes as nodes_module
+    from src import routing
+
+    save_centroids(tmp_path / "centroids.npz", {"vectorstore": np.ones(4), "cypher db": -np.ones(4)})
+    monkeypatch.setattr(routing, "ROUTER_CENTROIDS_PATH", str(tmp_path / "centroids.npz"))
+    monkeypatch.setattr(nodes_module, "GRADER_PREFILTER", False)
+
+    nodes = nodes_module.Nodes(fake_agents()[0])
+
+    assert nodes.embeddings is None
+    assert nodes.local_router.embeddings is not None
+    assert set(nodes.local_router.centroids) == {"vectorstore", "cypher db"}
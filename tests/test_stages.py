@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src import tracing
+from src.nodes import StageTimeoutError
+from src.tracing import TracedCrew
+
+
+class SlowCrew:
+    """Crew stand-in whose kickoff blocks its thread for `seconds`."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = 0
+        self.lock = threading.Lock()
+
+    def copy(self):
+        return self
+
+    def kickoff(self, inputs=None):
+        with self.lock:
+            self.started += 1
+        time.sleep(self.seconds)
+        return inputs
+
+
+def test_stage_timeout_is_per_stage(fake_nodes, monkeypatch):
+    nodes, _ = fake_nodes
+    monkeypatch.setenv("STAGE_TIMEOUT_GENERATE", "0.05")
+
+    with pytest.raises(StageTimeoutError, match="'generate' timed out after 0.05s"):
+        asyncio.run(nodes._run_stage("generate", asyncio.sleep(1)))
+    assert asyncio.run(nodes._run_stage("router", asyncio.sleep(0, result="done"))) == "done"
+
+
+def test_async_kickoff_runs_a_copy_on_the_crew_pool(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="crew")
+    monkeypatch.setattr(tracing, "crew_executor", lambda: executor)
+    crew = SlowCrew(0)
+
+    assert asyncio.run(TracedCrew(crew, "model").kickoff_async(inputs={"question": "q"})) == {"question": "q"}
+    assert crew.started == 1
+
+
+def test_kickoff_cancelled_while_queued_never_starts(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crew")
+    monkeypatch.setattr(tracing, "crew_executor", lambda: executor)
+    crew = TracedCrew(SlowCrew(0.3), "model")
+
+    async def run():
+        # The first kickoff holds the only thread past its timeout; the second times out in the queue
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(crew.kickoff_async(inputs={}), timeout=0.05)
+
+    asyncio.run(run())
+    executor.shutdown(wait=True)
+    assert crew.crew.started == 1
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from prometheus_client import REGISTRY
+from src import tracing
+from src.tracing import estimate_cost, record_llm_call, start_request, traced_branch, traced_node
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_estimate_cost_uses_configured_prices_per_1k_tokens(monkeypatch):
+    monkeypatch.setattr(tracing, "LLM_PRICES", {"test/model": [0.5, 1.5]})
+    assert estimate_cost("test/model", 2000, 1000) == pytest.approx(2.5)
+    assert estimate_cost("test/unpriced-model", 2000, 1000) == 0.0
+
+
+def test_node_records_llm_usage_and_retries_within_a_request(monkeypatch):
+    monkeypatch.setattr(tracing, "LLM_PRICES", {"test/model": [1.0, 1.0]})
+
+    def node(state):
+        record_llm_call("test/model", SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+        return state
+
+    traced = traced_node("test_usage", node)
+    before = {
+        "calls": sample("rag_llm_calls_total", node="test_usage", model="test/model"),
+        "prompt": sample("rag_llm_tokens_total", node="test_usage", model="test/model", kind="prompt"),
+        "retries": sample("rag_node_retries_total", node="test_usage"),
+    }
+    start_request()
+    traced({})
+    traced({})
+
+    assert sample("rag_llm_calls_total", node="test_usage", model="test/model") - before["calls"] == 2
+    assert sample("rag_llm_tokens_total", node="test_usage", model="test/model", kind="prompt") - before["prompt"] == 200
+    assert sample("rag_node_retries_total", node="test_usage") - before["retries"] == 1
+
+
+def test_async_node_failure_is_counted_as_error():
+    async def node(state):
+        raise ValueError("boom")
+
+    before = sample("rag_node_runs_total", node="test_error", status="error")
+    with pytest.raises(ValueError):
+        asyncio.run(traced_node("test_error", node)({}))
+    assert sample("rag_node_runs_total", node="test_error", status="error") - before == 1
+
+
+def test_branch_decisions_are_counted():
+    before = sample("rag_branch_total", edge="test_edge", branch="websearch")
+    assert traced_branch("test_edge", lambda state: "websearch")({}) == "websearch"
+    assert sample("rag_branch_total", edge="test_edge", branch="websearch") - before == 1
+
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+from langchain_core.documents import Document
+from src.nodes import FALLBACK_ANSWER, _verification_result
+from src.verification import documents_text, grounding_overlap, is_clearly_grounded
+
+DOCUMENTS = [Document(page_content="The Aurora Kettle holds 1.7 litres and costs 49 dollars. It ships within 3 days.")]
+
+
+def test_documents_text_flattens_documents_and_strings():
+    assert documents_text("plain") == "plain"
+    assert documents_text([Document(page_content="a"), ["b", Document(page_content="c")]]) == "a\n\nb\n\nc"
+    assert documents_text(None) == ""
+
+
+def test_copied_answer_is_clearly_grounded():
+    answer = "The Aurora Kettle holds 1.7 litres and costs 49 dollars."
+
+    assert grounding_overlap(answer, DOCUMENTS) == (1.0, 1.0)
+    assert is_clearly_grounded(answer, DOCUMENTS)
+
+
+def test_number_missing_from_the_documents_is_not_clearly_grounded():
+    assert not is_clearly_grounded("The Aurora Kettle holds 1.7 litres and costs 59 dollars.", DOCUMENTS)
+
+
+def test_unrelated_answer_is_not_clearly_grounded():
+    assert not is_clearly_grounded("Our blenders come with a lifetime warranty.", DOCUMENTS)
+    assert not is_clearly_grounded("", DOCUMENTS)
+
+
+def test_verification_result_reads_structured_output():
+    verdict = SimpleNamespace(grounded="Yes", answer_quality="no", revised_answer="  ")
+    result = _verification_result(SimpleNamespace(pydantic=verdict, raw=""), "draft")
+
+    assert result == {"grounded": "yes", "answer_quality": "no", "revised_answer": "draft", "source": "llm"}
+
+
+def test_verification_result_falls_back_to_raw_verdicts():
+    assert _verification_result(SimpleNamespace(pydantic=None, raw="grounded: no"), "draft")["grounded"] == "no"
+    assert _verification_result(SimpleNamespace(pydantic=None, raw="unparseable"), "draft")["grounded"] == "no"
+
+
+def test_clearly_grounded_answer_skips_the_verification_llm(fake_nodes):
+    nodes, calls = fake_nodes
+    state = {"question": "How much is the Aurora Kettle?", "documents": DOCUMENTS,
+             "generation": "The Aurora Kettle costs 49 dollars."}
+
+    assert nodes.final_grader(state)["verification"]["source"] == "local"
+    assert calls["answer_review"] == 0
+
+
+def test_inconclusive_answer_is_verified_by_one_llm_call(fake_nodes):
+    nodes, calls = fake_nodes
+    state = {"question": "How much is the Aurora Kettle?", "documents": DOCUMENTS,
+             "generation": "It is a great kettle for every kitchen."}
+
+    result = nodes.final_grader(state)
+
+    assert result["verification"]["source"] == "llm"
+    assert result["generation"] == state["generation"]
+    assert calls["answer_review"] == 1
+
+
+def test_ungrounded_verdict_returns_the_fallback_answer(fake_nodes):
+    nodes, _ = fake_nodes
+    verification = {"grounded": "no", "answer_quality": "no", "revised_answer": "x", "source": "llm"}
+
+    assert nodes.final_grader({"verification": verification})["generation"] == FALLBACK_ANSWER
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from src.websearch import WebSearch, clean_text, truncate
+
+
+class Provider:
+    """Search tool stand-in returning fixed results, optionally after a delay or with an error."""
+
+    def __init__(self, results, delay=0.0, error=None):
+        self.results = results
+        self.delay = delay
+        self.error = error
+        self.queries = []
+
+    def invoke(self, payload):
+        self.queries.append(payload["query"])
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.results
+
+    async def ainvoke(self, payload):
+        self.queries.append(payload["query"])
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.results
+
+
+def result(url, content, title=""):
+    return {"url": url, "content": content, "title": title}
+
+
+def test_clean_text_and_truncate():
+    assert clean_text("<p>Fast <b>shipping</b> .</p><script>x()</script>") == "Fast shipping."
+    text = "First sentence here. Second sentence is longer than the rest"
+    assert truncate(text, 30) == "First sentence here."
+    assert truncate("word " * 10, 12) == "word word"
+
+
+def test_results_are_interleaved_in_provider_order_and_deduplicated():
+    search = WebSearch({
+        # The first provider finishes last, but its results still win ties
+        "a": Provider([result("https://x.com/1", "one"), result("https://x.com/2", "two")], delay=0.05),
+        "b": Provider([result("https://x.com/1/", "one again"), {"link": "https://y.com", "snippet": "TWO"}]),
+    })
+
+    documents = search.search("question")
+
+    assert [d.page_content for d in documents] == ["one", "two"]
+    assert [d.metadata["provider"] for d in documents] == ["a", "a"]
+
+
+def test_failing_and_late_providers_are_left_out():
+    search = WebSearch({
+        "ok": Provider([result("https://x.com", "found")]),
+        "broken": Provider([], error=RuntimeError("down")),
+        "slow": Provider([result("https://slow.com", "late")], delay=1.0),
+    }, deadline=0.2)
+
+    assert [d.page_content for d in search.search("question")] == ["found"]
+    assert [d.page_content for d in asyncio.run(search.asearch("another question"))] == ["found"]
+    assert search.stats()["late_providers"] == 2
+
+
+def test_results_are_cached_per_normalized_query():
+    provider = Provider([result("https://x.com", "found")])
+    search = WebSearch({"a": provider})
+
+    search.search("Kettle  warranty?")
+    assert [d.page_content for d in search.search("kettle warranty? ")] == ["found"]
+    assert provider.queries == ["Kettle  warranty?"]
+    assert search.stats()["hits"] == 1
+
+
+def test_empty_results_are_not_cached():
+    provider = Provider([])
+    search = WebSearch({"a": provider})
+
+    assert search.search("question") == []
+    search.search("question")
+    assert len(provider.queries) == 2